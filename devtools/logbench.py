@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- mode:python -*-
+# -*- coding:utf-8 -*-
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import argparse
+import inspect
+import logging
+import os
+import sys
+import timeit
+
+def __sys_path():
+  l_path = os.path.realpath(os.path.dirname(__file__))
+  os.chdir(os.path.dirname(l_path))
+  sys.path.insert(0, ".")
+
+__sys_path()
+
+#pylint: disable=wrong-import-position
+from xtd.core                import logger
+from xtd.core.logger         import formatter
+from xtd.core.logger         import manager
+
+#------------------------------------------------------------------#
+
+class NullHandler(logging.Handler):
+  def emit(self, p_record):
+    pass
+
+def inspect_caller():
+  """ Caller lookup implementation prior to frame walk, for comparison """
+  l_outFrames = inspect.getouterframes(inspect.currentframe())
+  for c_pos in range(0, len(l_outFrames)):
+    l_items = l_outFrames[c_pos]
+    if l_items[1].endswith("core/logger/tools.py") and l_items[3] == "__wrap":
+      return l_outFrames[c_pos + 2][1:4]
+  return None
+
+def setup_logger(p_name):
+  logging.setLoggerClass(manager.WrapperLogger)
+  l_logger = logging.getLogger(p_name)
+  l_logger.handlers = [ NullHandler() ]
+  l_logger.propagate = False
+  l_logger.setLevel(logging.DEBUG)
+  return l_logger
+
+#------------------------------------------------------------------#
+
+def bench_findcaller(p_count):
+  l_logger = setup_logger("bench.findcaller")
+  l_res = {}
+  l_saved = manager.WrapperLogger.findCaller
+  try:
+    manager.WrapperLogger.findCaller = lambda p_self, *p_args: inspect_caller() + (None,)
+    l_res["inspect"] = timeit.timeit(lambda: logger.info("bench.findcaller", "msg"), number=p_count)
+  finally:
+    manager.WrapperLogger.findCaller = l_saved
+  manager.WrapperLogger.ms_location = True
+  l_res["frame-walk"] = timeit.timeit(lambda: logger.info("bench.findcaller", "msg"), number=p_count)
+  manager.WrapperLogger.ms_location = False
+  l_res["no-location"] = timeit.timeit(lambda: logger.info("bench.findcaller", "msg"), number=p_count)
+  manager.WrapperLogger.ms_location = True
+  del l_logger
+  return l_res
+
+def bench_formatter(p_count):
+  l_record = logging.LogRecord("bench.formatter", logging.INFO, __file__, 10, "value %d", (1,), None)
+  l_record.funcName = "bench_formatter"
+  l_fmt    = "%(asctime)s (%(name)s) [%(levelname)s] : %(message)s"
+  l_locFmt = "at %(pathname)s:%(lineno)s -> %(funcName)s"
+  l_res    = {}
+  l_plain  = logging.Formatter(l_fmt + " " + l_locFmt, "%Y-%m-%d %H:%M:%S")
+  l_loc    = formatter.LocationFormatter(l_fmt + " %(location)s", locfmt=l_locFmt,
+                                         locstyle={ "colors" : [ "cyan" ] })
+  l_res["logging"]  = timeit.timeit(lambda: l_plain.format(l_record), number=p_count)
+  l_res["location"] = timeit.timeit(lambda: l_loc.format(l_record), number=p_count)
+  for c_encoder in [ "json", "auto" ]:
+    l_json = formatter.JsonFormatter(static={ "app" : "logbench" }, encoder=c_encoder)
+    l_res["json-" + c_encoder] = timeit.timeit(lambda: l_json.format(l_record), number=p_count)
+  return l_res
+
+def bench_disabled(p_count):
+  l_logger = setup_logger("bench.disabled")
+  l_logger.setLevel(logging.ERROR)
+  def getlogger_debug():
+    getattr(logging.getLogger("bench.disabled"), "debug")("msg %s", 1)
+  l_res = {}
+  l_res["getlogger"] = timeit.timeit(getlogger_debug, number=p_count)
+  l_res["cached"]    = timeit.timeit(lambda: logger.debug("bench.disabled", "msg %s", 1), number=p_count)
+  return l_res
+
+BENCHMARKS = {
+  "disabled"   : bench_disabled,
+  "findcaller" : bench_findcaller,
+  "formatter"  : bench_formatter
+}
+
+#------------------------------------------------------------------#
+
+def main():
+  l_parser = argparse.ArgumentParser("xtd logging micro-benchmarks")
+  l_parser.add_argument("--count", type=int, default=20000, help="number of records per run")
+  l_parser.add_argument("names", nargs="*", default=sorted(BENCHMARKS.keys()),
+                        help="benchmarks to run : %s" % ", ".join(sorted(BENCHMARKS.keys())))
+  l_args = l_parser.parse_args()
+  for c_name in l_args.names:
+    l_res = BENCHMARKS[c_name](l_args.count)
+    for c_case, c_time in sorted(l_res.items(), key=lambda x: x[1]):
+      print("%-12s %-14s %8.2f us/record" % (c_name, c_case, c_time * 1e6 / l_args.count))
+
+if __name__ == "__main__":
+  main()
@@ -82,10 +82,12 @@ class Application(with_metaclass(mixin.Singleton, object)):
                                   path each --stat-disk-interval seconds\n
                          * http : post counters in json format to --stat-http-url
                                   url each --stat-http-interval seconds\n
+                         * statsd : send counters to --stat-statsd-host statsd
+                                    server each --stat-statsd-interval seconds\n
                          Can specify a comma separated combinaison of theses values\n
       """,
       "checks"      : config.checkers.is_array(
-        p_check=config.checkers.is_enum(p_values=["", "disk", "http"])
+        p_check=config.checkers.is_enum(p_values=["", "disk", "http", "statsd"])
       )
     },{
       "name"        : "disk-directory",
@@ -96,6 +98,15 @@ class Application(with_metaclass(mixin.Singleton, object)):
       "default"     : 50,
       "description" : "Interval in second between two disk outputs",
       "checks"      : config.checkers.is_int()
+    },{
+      "name"        : "disk-format",
+      "default"     : "",
+      "description" : """Write one file per namespace instead of one file per counter.
+                         Possibles values :\n
+                         * json : json object of counter values\n
+                         * kv : one name=value line per counter\n
+      """,
+      "checks"      : config.checkers.is_enum(p_values=["", "json", "kv"])
     },{
       "name"        : "http-url",
       "default"     : "http://localhost/counter",
@@ -105,6 +116,55 @@ class Application(with_metaclass(mixin.Singleton, object)):
       "default"     : 50,
       "description" : "Interval in second between two http outputs",
       "checks"      : config.checkers.is_int()
+    },{
+      "name"        : "http-timeout",
+      "default"     : 10.0,
+      "description" : "Timeout in second of http stat handler requests",
+      "checks"      : config.checkers.is_float(p_min=0)
+    },{
+      "name"        : "http-gzip",
+      "default"     : False,
+      "description" : "Compress http stat handler request bodies with gzip",
+      "checks"      : config.checkers.is_bool()
+    },{
+      "name"        : "http-queue",
+      "default"     : 0,
+      "description" : "Maximum number of outputs kept for retry by http stat handler, "
+                      "queued outputs are sent as a single json array, 0 to disable retries",
+      "checks"      : config.checkers.is_int(p_min=0)
+    },{
+      "name"        : "statsd-host",
+      "default"     : "localhost",
+      "description" : "Destination host for statsd stat handler"
+    },{
+      "name"        : "statsd-port",
+      "default"     : 8125,
+      "description" : "Destination UDP port for statsd stat handler",
+      "checks"      : config.checkers.is_int(p_min=1, p_max=65535)
+    },{
+      "name"        : "statsd-interval",
+      "default"     : 10,
+      "description" : "Interval in second between two statsd outputs",
+      "checks"      : config.checkers.is_int()
+    },{
+      "name"        : "statsd-prefix",
+      "default"     : "",
+      "description" : "Metric name prefix for statsd stat handler"
+    },{
+      "name"        : "statsd-tags",
+      "default"     : [],
+      "description" : "Comma separated list of DogStatsD tags (key:value) for statsd stat handler",
+      "checks"      : config.checkers.is_array()
+    },{
+      "name"        : "history",
+      "default"     : False,
+      "description" : "Keep recent counter values in memory (10s resolution for 1h, 1m for 24h)",
+      "checks"      : config.checkers.is_bool()
+    },{
+      "name"        : "scheduler",
+      "default"     : False,
+      "description" : "Run all stat handlers from a single scheduler thread",
+      "checks"      : config.checkers.is_bool()
     }])
 
     self.config().register_section("param", "Persistent parameter settings", [{
@@ -177,8 +237,12 @@ class Application(with_metaclass(mixin.Singleton, object)):
     Any child class that overrides this method should call
     ``super(Application, self).stop()`` or stop
     :py:class:`~xtd.core.stat.manager.StatManager` by hand
+
+    Records queued by asynchronous logging handlers are flushed.
     """
     self.m_stat.stop()
+    if self.m_logger is not None:
+      self.m_logger.flush()
 
   def join(self):
     """Join background modules
@@ -188,6 +252,8 @@ class Application(with_metaclass(mixin.Singleton, object)):
     :py:class:`~xtd.core.stat.manager.StatManager` by hand
     """
     self.m_stat.join()
+    if self.m_logger is not None:
+      self.m_logger.flush()
 
 
   def execute(self, p_argv=None):
@@ -246,18 +312,32 @@ class Application(with_metaclass(mixin.Singleton, object)):
 
   def _initialize_stat(self):
     self.m_stat = stat.manager.StatManager()
+    self.m_stat.use_scheduler(config.get("stat", "scheduler"))
+    if config.get("stat", "history"):
+      self.m_stat.enable_history()
     l_outputters = self.config().get("stat", "handlers")
     for c_name in l_outputters:
       if c_name == "disk":
         l_dir      = config.get("stat", "disk-directory")
         l_interval = config.get("stat", "disk-interval")
-        l_disk     = stat.handler.DiskHandler(l_dir, l_interval)
+        l_format   = config.get("stat", "disk-format") or None
+        l_disk     = stat.handler.DiskHandler(l_dir, l_interval, p_format=l_format)
         self.m_stat.register_handler(l_disk)
       elif c_name == "http":
         l_url      = config.get("stat", "http-url")
         l_interval = config.get("stat", "http-interval")
-        l_http      = stat.handler.HttpHandler(l_url, l_interval)
+        l_http     = stat.handler.HttpHandler(l_url, l_interval,
+                                              p_timeout=config.get("stat", "http-timeout"),
+                                              p_gzip=config.get("stat", "http-gzip"),
+                                              p_queueSize=config.get("stat", "http-queue"))
         self.m_stat.register_handler(l_http)
+      elif c_name == "statsd":
+        l_statsd = stat.handler.StatsdHandler(config.get("stat", "statsd-host"),
+                                              config.get("stat", "statsd-port"),
+                                              config.get("stat", "statsd-interval"),
+                                              p_prefix=config.get("stat", "statsd-prefix"),
+                                              p_tags=config.get("stat", "statsd-tags"))
+        self.m_stat.register_handler(l_statsd)
 
   def _initialize_log(self):
     self.m_logger = logger.manager.LogManager()
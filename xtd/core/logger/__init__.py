@@ -7,7 +7,8 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 import logging
 
-from .      import formatter, manager
+from .      import formatter, handler, manager
 from .tools import get, debug, info, warning, error, critical, exception, log
+from .tools import is_enabled, Lazy
 
 #------------------------------------------------------------------#
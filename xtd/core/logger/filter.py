@@ -12,78 +12,126 @@ import termcolor
 #------------------------------------------------------------------#
 
 class FieldFilter(logging.Filter):
+  """ Pad and colorize record fields
+
+  Styles are compiled at construction into ANSI prefix and suffix strings,
+  color support is therefore detected once by :py:mod:`termcolor`.
+
+  Filtering takes no lock : each thread tracks its own maximum field widths
+  and publishes them to :py:attr:`m_widths` when they grow, and merges widths
+  published by other threads every :py:attr:`MERGE_INTERVAL` records.
+  """
+
+  MERGE_INTERVAL = 256
+  """ Number of records between two merges of thread widths """
+
+  ms_marker = "\0"
 
   def __init__(self, fields=None):
     super(FieldFilter, self).__init__()
-    self.m_lock   = threading.Lock()
-    self.m_fields = fields
+    self.m_fields  = fields
     if fields is None:
       self.m_fields = {}
-    self.m_widths = { x : 0 for x in fields.keys() }
-    self.m_cdiff  = {}
+    self.m_widths  = { x : 0 for x in self.m_fields.keys() }
+    self.m_padded  = [ x for x, y in self.m_fields.items() if y.get("pad", False) ]
+    self.m_styles  = {}
+    self.m_formats = {}
+    self.m_local   = threading.local()
+    for c_name, c_data in self.m_fields.items():
+      l_styles = c_data.get("styles", False)
+      if l_styles:
+        l_compiled = { x : self._compile(y) for x, y in l_styles.items() }
+        self.m_styles[c_name] = (l_compiled, l_compiled.get("default", None))
+
+  @classmethod
+  def _compile(cls, p_style):
+    """ Get ANSI (prefix, suffix) of given style, None for unstyled values """
+    if not isinstance(p_style, dict):
+      return None
+    l_colors = p_style.get("colors", [])
+    l_attrs  = p_style.get("attrs",  [])
+    if not l_colors and not l_attrs:
+      return None
+    l_args = {}
+    for c_color in l_colors:
+      if c_color[0:3] == "on_":
+        l_args["on_color"] = c_color
+      else:
+        l_args["color"] = c_color
+    l_args["attrs"] = l_attrs
+    try:
+      l_value = termcolor.colored(cls.ms_marker, **l_args)
+    except KeyError:
+      return None
+    return tuple(l_value.split(cls.ms_marker, 1))
+
+  def _state(self):
+    l_state = self.m_local
+    if not hasattr(l_state, "widths"):
+      l_state.widths = dict(self.m_widths)
+      l_state.cdiff  = {}
+      l_state.count  = 0
+    return l_state
+
+  def _merge(self, p_state):
+    for c_name, c_width in list(self.m_widths.items()):
+      if p_state.widths.get(c_name, 0) > c_width:
+        self.m_widths[c_name] = p_state.widths[c_name]
+      else:
+        p_state.widths[c_name] = c_width
 
   def _width(self, p_record):
-    l_filter = lambda x,y : y.get("pad", False) and hasattr(p_record, x)
-    l_data   = { x:y for x,y in self.m_fields.items() if l_filter(x,y) }
-    for c_name in l_data.keys():
-      l_value = getattr(p_record, c_name)
-      l_size  = len(l_value)
-      self.m_widths[c_name] = max(self.m_widths[c_name], l_size)
+    l_state  = self._state()
+    l_widths = l_state.widths
+    for c_name in self.m_padded:
+      if hasattr(p_record, c_name):
+        l_size = len(getattr(p_record, c_name))
+        if l_size > l_widths.get(c_name, 0):
+          l_widths[c_name] = l_size
+          if l_size > self.m_widths.get(c_name, 0):
+            self.m_widths[c_name] = l_size
+    l_state.count += 1
+    if l_state.count >= self.MERGE_INTERVAL:
+      l_state.count = 0
+      self._merge(l_state)
 
-  def _pad(self, p_record):
-    l_filter = lambda x,y : y.get("pad", False) and hasattr(p_record, x)
-    l_data   = { x:y for x,y in self.m_fields.items() if l_filter(x,y) }
-
-    for c_name, c_data in l_data.items():
-      l_cdiff  = self.m_cdiff.get(c_name, 0)
-      l_value  = getattr(p_record, c_name)
-      if c_data["pad"] == "left":
-        l_width  = (int(self.m_widths[c_name]) + int(l_cdiff))
-        l_format = "%%-%ds" % l_width
-      elif c_data["pad"] == "right":
-        l_width  = (int(self.m_widths[c_name]) + int(l_cdiff))
-        l_format = "%%%ds" % l_width
+  def _format(self, p_pad, p_width):
+    l_key    = (p_pad, p_width)
+    l_format = self.m_formats.get(l_key, None)
+    if l_format is None:
+      if p_pad == "left":
+        l_format = "%%-%ds" % p_width
+      elif p_pad == "right":
+        l_format = "%%%ds" % p_width
       else:
-        l_width  = 0
         l_format = "%s"
-      l_value = l_format % l_value
-      setattr(p_record, c_name, l_value)
+      self.m_formats[l_key] = l_format
+    return l_format
+
+  def _pad(self, p_record):
+    l_state = self._state()
+    for c_name in self.m_padded:
+      if not hasattr(p_record, c_name):
+        continue
+      l_width  = max(l_state.widths.get(c_name, 0), self.m_widths.get(c_name, 0))
+      l_width += l_state.cdiff.get(c_name, 0)
+      l_format = self._format(self.m_fields[c_name]["pad"], l_width)
+      setattr(p_record, c_name, l_format % getattr(p_record, c_name))
 
   def _color(self, p_record):
-    l_filter = lambda x,y : y.get("styles", False) and hasattr(p_record, x)
-    l_data   = { x:y for x,y in self.m_fields.items() if l_filter(x,y) }
-    for c_name, c_data in l_data.items():
-      l_value  = getattr(p_record, c_name)
-      l_rawLen = len(l_value)
-      l_values = c_data.get("styles", { "default" : { "colors" : [], "attrs" : [] } })
-      if l_value in l_values.keys():
-        l_style = l_values[l_value]
-      else:
-        l_style = l_values.get("default", {})
-
-      l_colors = l_style.get("colors", [])
-      l_attrs  = l_style.get("attrs",  [])
-      if l_colors or l_attrs:
-        l_args = {}
-        for c_color in l_colors:
-          if c_color[0:3] == "on_":
-            l_args["on_color"] = c_color
-          else:
-            l_args["color"] = c_color
-        l_args["attrs"] = l_attrs
-
-        try:
-          l_newValue = termcolor.colored(l_value, **l_args)
-          self.m_cdiff[c_name] = len(l_newValue) - l_rawLen
-          l_value    = l_newValue
-        except KeyError:
-          continue
-        setattr(p_record, c_name, l_value)
+    l_state = self._state()
+    for c_name, (c_values, c_default) in self.m_styles.items():
+      if not hasattr(p_record, c_name):
+        continue
+      l_value = getattr(p_record, c_name)
+      l_style = c_values.get(l_value, c_default)
+      if l_style is not None:
+        l_state.cdiff[c_name] = len(l_style[0]) + len(l_style[1])
+        setattr(p_record, c_name, l_style[0] + l_value + l_style[1])
 
   def filter(self, p_record):
-    with self.m_lock:
-      self.m_cdiff = {}
-      self._width(p_record)
-      self._color(p_record)
-      self._pad(p_record)
+    self._state().cdiff = {}
+    self._width(p_record)
+    self._color(p_record)
+    self._pad(p_record)
     return True
@@ -5,50 +5,242 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 #------------------------------------------------------------------#
 
-import sys
+import re
+import json
 import logging
 import termcolor
 
+from ..error   import XtdError
+from .manager  import LOCATION_FIELDS
+
+try:
+  import orjson
+  _ORJSON_DUMPS   = getattr(orjson, "dumps", None)
+  _ORJSON_OPTIONS = getattr(orjson, "OPT_NON_STR_KEYS", 0)
+except ImportError:
+  _ORJSON_DUMPS   = None
+  _ORJSON_OPTIONS = 0
+
 #------------------------------------------------------------------#
 
 class LocationFormatter(logging.Formatter):
+  """ Formatter with a colored ``%(location)s`` field
+
+  The location format, the fields it needs and the ANSI codes of its style
+  are compiled at construction. Records are formatted without modifying
+  the formatter, which can be shared by handlers of different threads.
+
+  Args:
+    fmt (str) : record format, may contain ``%(location)s``
+    datefmt (str) : date format of ``%(asctime)s``
+    locfmt (str) : location format
+    locstyle (dict) : location style, ``{ "colors" : [...], "attrs" : [...] }``
+  """
+
+  ms_marker = "\0"
+
   def __init__(self,
                fmt      = "%(asctime)s (%(name)s) [%(levelname)s] : %(message)s %(location)s",
                datefmt  = "%Y-%m-%d %H:%M:%S",
                locfmt   = "at %(pathname)s:%(lineno)s -> %(funcName)s",
                locstyle = None):
     super(LocationFormatter, self).__init__(fmt, datefmt)
-    self.m_fmt      = fmt
-    self.m_locFmt   = locfmt
-    self.m_datefmt  = datefmt
-    self.m_locstyle = locstyle
-
+    self.m_fmt       = fmt
+    self.m_locFmt    = locfmt
+    self.m_datefmt   = datefmt
+    self.m_locstyle  = locstyle
     if locstyle is None:
       self.m_locstyle = { "colors" : [], "attrs" : [] }
+    self.m_hasLoc    = "%(location)s" in fmt
+    self.m_usesTime  = "%(asctime)" in fmt
+    self.m_locFields = sorted(set(re.findall(r"%\((\w+)\)", locfmt)))
+    self.m_locPrefix, self.m_locSuffix = self._compile(self.m_locstyle)
 
-  def _get_loc(self, p_record):
-    l_loc = self.m_locFmt % { x : getattr(p_record, x) for x in dir(p_record) if x[0] != "_" }
-    l_args = {}
-    l_colors = self.m_locstyle.get("colors", [])
-    l_attrs  = self.m_locstyle.get("attrs",  [])
+  @classmethod
+  def _compile(cls, p_style):
+    """ Get ANSI (prefix, suffix) of given style, empty strings for unstyled location """
+    l_args   = {}
+    l_colors = p_style.get("colors", [])
+    l_attrs  = p_style.get("attrs",  [])
     if not isinstance(l_colors, list):
       l_colors = [ l_colors ]
     if not isinstance(l_attrs, list):
       l_attrs = [ l_attrs ]
+    if not l_colors and not l_attrs:
+      return ("", "")
     l_args["attrs"] = l_attrs
     for c_arg in l_colors:
       if c_arg[0:3] == "on_":
         l_args["on_color"] = c_arg
       else:
         l_args["color"] = c_arg
-    return termcolor.colored(l_loc, **l_args)
+    l_value = termcolor.colored(cls.ms_marker, **l_args)
+    return tuple(l_value.split(cls.ms_marker, 1))
+
+  def uses_location(self):
+    """ Tell if formatter outputs record location, see :py:meth:`xtd.core.logger.manager.LogManager.initialize` """
+    l_fmt = self.m_fmt
+    if self.m_hasLoc:
+      l_fmt += self.m_locFmt
+    return [ x for x in LOCATION_FIELDS if "%%(%s)" % x in l_fmt ] != []
+
+  def usesTime(self):
+    return self.m_usesTime
+
+  def _get_loc(self, p_record):
+    l_loc = self.m_locFmt % { x : getattr(p_record, x) for x in self.m_locFields }
+    return self.m_locPrefix + l_loc + self.m_locSuffix
+
+  def formatMessage(self, p_record):
+    l_values = p_record.__dict__
+    if self.m_hasLoc:
+      l_values = dict(l_values)
+      l_values["location"] = self._get_loc(p_record)
+    return self.m_fmt % l_values
 
   def format(self, p_record):
-    l_loc = self._get_loc(p_record)
-    if sys.version_info[0] >= 3:
-      #pylint: disable=no-member,protected-access
-      self._style._fmt = self.m_fmt.replace("%(location)s", l_loc)
+    p_record.message = p_record.getMessage()
+    if self.m_usesTime:
+      p_record.asctime = self.formatTime(p_record, self.datefmt)
+    l_result = self.formatMessage(p_record)
+    if p_record.exc_info and not p_record.exc_text:
+      p_record.exc_text = self.formatException(p_record.exc_info)
+    if p_record.exc_text:
+      if l_result[-1:] != "\n":
+        l_result += "\n"
+      l_result += p_record.exc_text
+    l_stack = getattr(p_record, "stack_info", None)
+    if l_stack:
+      if l_result[-1:] != "\n":
+        l_result += "\n"
+      l_result += self.formatStack(l_stack)
+    return l_result
+
+#------------------------------------------------------------------#
+
+class JsonFormatter(logging.Formatter):
+  """ Format records as single-line JSON objects
+
+  Static fields are serialized once at construction. Timestamps are
+  formatted with ``datefmt`` once per second, milliseconds are appended.
+  When ``args`` is enabled, the message template is output unformatted and
+  record arguments are output as a separate ``args`` field, a list or an
+  object. For records passed through an
+  :py:class:`~xtd.core.logger.handler.AsyncHandler`, the template and the
+  arguments are read from its ``xtd_msg`` and ``xtd_args`` attributes.
+
+  Example of ``log.config`` formatter :
+
+  .. code-block:: json
+
+    {
+      "class"  : "xtd.core.logger.formatter.JsonFormatter",
+      "fields" : { "time" : "asctime", "level" : "levelname", "message" : "message", "line" : "lineno" },
+      "static" : { "app" : "myapp", "dc" : "eu-west" }
+    }
+
+  Args:
+    fields (dict|list) : output key to record attribute mapping, a list of
+      attribute names outputs them under their own names
+    static (dict) : constant fields added to every record
+    datefmt (str) : date format of ``asctime`` attribute
+    args (bool) : output arguments as structured field instead of formatting the message
+    encoder (str) : JSON encoder, one of :py:attr:`ENCODERS`, ``auto`` uses
+      ``orjson`` when installed
+
+  Raises:
+    XtdError: unknown or unavailable ``encoder``
+  """
+
+  FIELDS = [
+    ("time",    "asctime"),
+    ("logger",  "name"),
+    ("level",   "levelname"),
+    ("message", "message")
+  ]
+  """ Default output fields """
+
+  ENCODERS = [ "auto", "json", "orjson" ]
+  """ Available JSON encoders """
+
+  def __init__(self,
+               fields   = None,
+               static   = None,
+               datefmt  = "%Y-%m-%dT%H:%M:%S",
+               args     = True,
+               encoder  = "auto"):
+    super(JsonFormatter, self).__init__(None, datefmt)
+    if fields is None:
+      fields = self.FIELDS
+    elif isinstance(fields, dict):
+      fields = list(fields.items())
     else:
-      #pylint: disable=no-member,protected-access
-      self._fmt = self.m_fmt.replace("%(location)s", l_loc)
-    return super(LocationFormatter, self).format(p_record)
+      fields = [ x if isinstance(x, (list, tuple)) else (x, x) for x in fields ]
+    if not encoder in self.ENCODERS:
+      raise XtdError(__name__, "invalid json encoder '%s', must be one of %s" % (encoder, self.ENCODERS))
+    if encoder == "orjson" and _ORJSON_DUMPS is None:
+      raise XtdError(__name__, "json encoder 'orjson' is not installed")
+    self.m_fields   = [ (x, y) for x, y in fields ]
+    self.m_args     = args
+    self.m_fast     = _ORJSON_DUMPS is not None and encoder != "json"
+    self.m_static   = ""
+    self.m_time     = (None, None)
+    if static:
+      self.m_static = self._encode(static)[1:-1]
+
+  def uses_location(self):
+    """ Tell if formatter outputs record location, see :py:meth:`xtd.core.logger.manager.LogManager.initialize` """
+    return [ x for x in self.m_fields if x[1] in LOCATION_FIELDS ] != []
+
+  def usesTime(self):
+    return [ x for x in self.m_fields if x[1] == "asctime" ] != []
+
+  def _encode(self, p_data):
+    if self.m_fast:
+      try:
+        return _ORJSON_DUMPS(p_data, default=str, option=_ORJSON_OPTIONS).decode("utf-8")
+      except TypeError:
+        pass
+    return json.dumps(p_data, default=str, separators=(",", ":"), ensure_ascii=False)
+
+  def formatTime(self, record, datefmt=None):
+    """ Format record time, formatted seconds are cached """
+    l_secs = int(record.created)
+    l_time = self.m_time
+    if l_time[0] != l_secs:
+      l_time = self.m_time = (l_secs, super(JsonFormatter, self).formatTime(record, datefmt))
+    return "%s.%03d" % (l_time[1], record.msecs)
+
+  def _value(self, p_record, p_attr):
+    if p_attr == "asctime":
+      return self.formatTime(p_record, self.datefmt)
+    if p_attr == "message":
+      if self.m_args:
+        return str(getattr(p_record, "xtd_msg", p_record.msg))
+      return p_record.getMessage()
+    return getattr(p_record, p_attr, None)
+
+  def format(self, p_record):
+    l_data = {}
+    for c_key, c_attr in self.m_fields:
+      l_data[c_key] = self._value(p_record, c_attr)
+    l_args = None
+    if self.m_args:
+      l_args = getattr(p_record, "xtd_args", p_record.args)
+    if l_args:
+      if not isinstance(l_args, dict):
+        l_args = list(l_args)
+      l_data["args"] = l_args
+    if p_record.exc_info and not p_record.exc_text:
+      p_record.exc_text = self.formatException(p_record.exc_info)
+    if p_record.exc_text:
+      l_data["exception"] = p_record.exc_text
+    l_stack = getattr(p_record, "stack_info", None)
+    if l_stack:
+      l_data["stack"] = self.formatStack(l_stack)
+    l_result = self._encode(l_data)
+    if not self.m_static:
+      return l_result
+    if l_result == "{}":
+      return "{" + self.m_static + "}"
+    return "{" + self.m_static + "," + l_result[1:]
@@ -0,0 +1,231 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+"""
+
+.. inheritance-diagram:: xtd.core.logger.handler
+   :parts: 1
+
+"""
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import collections
+import logging
+import threading
+
+#------------------------------------------------------------------#
+
+class OverflowPolicy(object):
+  """ Applies the overflow policy of an :py:class:`AsyncHandler` queue
+
+  Args:
+    p_name (str) : handler name, used for counter names
+    p_size (int) : maximum number of queued records
+    p_overflow (str) : overflow policy, see :py:attr:`AsyncHandler.POLICIES`
+
+  Raises:
+    XtdError: invalid ``p_overflow`` or ``p_size``
+  """
+
+  def __init__(self, p_name, p_size, p_overflow):
+    from ..error        import XtdError
+    from ..stat.manager import StatManager
+    from ..stat         import counter
+    if not p_overflow in AsyncHandler.POLICIES:
+      raise XtdError(__name__, "invalid overflow policy '%s', must be one of %s" %
+                     (p_overflow, AsyncHandler.POLICIES))
+    if p_size < 1:
+      raise XtdError(__name__, "async handler queue size must be strictly positive")
+    self.m_size     = p_size
+    self.m_overflow = p_overflow
+    l_ns = "xtd.core.logger." + p_name
+    self.m_dropped  = StatManager().get_or_create(l_ns, "dropped",
+                                                  lambda x: counter.Family(x, [ "level" ]))
+    self.m_blocked  = StatManager().get_or_create(l_ns, "blocked",
+                                                  lambda x: counter.UInt64(x, 0))
+
+  def full(self, p_queue):
+    """ Tell if given queue is full """
+    return len(p_queue) >= self.m_size
+
+  def drop(self, p_record):
+    """ Count a dropped record """
+    self.m_dropped.labels(level=p_record.levelname).incr()
+
+  def make_room(self, p_queue, p_record, p_wait):
+    """ Apply overflow policy to full queue
+
+    Args:
+      p_queue (collections.deque) : queued records
+      p_record (logging.LogRecord) : incoming record
+      p_wait (function) : waits until queue has room, None when caller
+        must not wait, ``block`` policy then drops the incoming record
+
+    Returns:
+      bool: False when incoming record is dropped
+    """
+    if self.m_overflow == "block":
+      if p_wait is None:
+        self.drop(p_record)
+        return False
+      self.m_blocked.incr()
+      p_wait()
+      return True
+    if self.m_overflow == "drop_debug":
+      if p_record.levelno <= logging.DEBUG:
+        self.drop(p_record)
+        return False
+      for c_record in p_queue:
+        if c_record.levelno <= logging.DEBUG:
+          p_queue.remove(c_record)
+          self.drop(c_record)
+          return True
+    self.drop(p_queue.popleft())
+    return True
+
+#------------------------------------------------------------------#
+
+class AsyncHandler(logging.Handler):
+  """ Emit records of a target handler from a dedicated thread
+
+  Records are put in a bounded queue by the logging thread and passed to
+  the target handler by a listener thread, so a slow output (syslog socket,
+  disk flush) doesn't stall the logging thread. The target handler keeps
+  its own level, formatter and filters, the latter two run in the listener
+  thread.
+
+  Message arguments are merged in the caller thread, so that later changes
+  of argument objects don't affect the message. Queued records therefore
+  have no ``args``, the message template and its arguments are kept in
+  ``xtd_msg`` and ``xtd_args`` attributes for formatters that output them,
+  such as :py:class:`~xtd.core.logger.formatter.JsonFormatter`.
+
+  Overflow policies, applied when the queue is full :
+
+  - ``block`` : wait for the listener to make room. Records logged from a
+    listener thread of any asynchronous handler, for instance by a target
+    handler, are dropped instead, so that listeners never wait for each
+    other or for themselves.
+  - ``drop_oldest`` : drop the oldest queued record
+  - ``drop_debug`` : drop incoming record if its level is ``DEBUG`` or lower,
+    otherwise drop the oldest queued ``DEBUG`` record, otherwise drop the
+    oldest queued record
+
+  Dropped records are counted in
+  :py:class:`~xtd.core.stat.manager.StatManager`, namespace
+  ``xtd.core.logger.<name>`` :
+
+  - ``dropped`` : :py:class:`~xtd.core.stat.counter.Family` of dropped records by level name
+  - ``blocked`` : number of records that waited for room, ``block`` policy only
+
+  Args:
+    p_target (logging.Handler) : handler to run asynchronously
+    p_name (str) : handler name, used for thread and counter names
+    p_size (int) : maximum number of queued records
+    p_overflow (str) : overflow policy
+
+  Raises:
+    XtdError: invalid ``p_overflow`` or ``p_size``
+  """
+
+  POLICIES = [ "block", "drop_oldest", "drop_debug" ]
+  """ Available overflow policies """
+
+  ms_local = threading.local()
+  """ Thread-local state, ``listener`` is True in listener threads """
+
+  def __init__(self, p_target, p_name, p_size = 10000, p_overflow = "block"):
+    super(AsyncHandler, self).__init__(p_target.level)
+    self.m_policy    = OverflowPolicy(p_name, p_size, p_overflow)
+    self.m_target    = p_target
+    self.m_name      = p_name
+    self.m_queue     = collections.deque()
+    self.m_cond      = threading.Condition(threading.Lock())
+    self.m_busy      = False
+    self.m_closed    = False
+    self.formatter   = p_target.formatter
+    self.m_thread    = threading.Thread(target=self._listen, name=__name__ + "." + p_name)
+    self.m_thread.daemon = True
+    self.m_thread.start()
+
+  def target(self):
+    """ Get target handler """
+    return self.m_target
+
+  def policy(self):
+    """ Get overflow policy """
+    return self.m_policy
+
+  @staticmethod
+  def _prepare(p_record):
+    l_record = object.__new__(p_record.__class__)
+    l_record.__dict__ = dict(p_record.__dict__)
+    l_record.msg      = p_record.getMessage()
+    l_record.args     = None
+    l_record.xtd_msg  = p_record.msg
+    l_record.xtd_args = p_record.args
+    return l_record
+
+  def _wait_room(self):
+    while self.m_policy.full(self.m_queue) and not self.m_closed:
+      self.m_cond.wait()
+
+  def emit(self, record):
+    l_record = self._prepare(record)
+    with self.m_cond:
+      if self.m_closed:
+        self.m_policy.drop(l_record)
+        return
+      if self.m_policy.full(self.m_queue):
+        l_wait = self._wait_room
+        if getattr(self.ms_local, "listener", False):
+          l_wait = None
+        if not self.m_policy.make_room(self.m_queue, l_record, l_wait):
+          return
+      self.m_queue.append(l_record)
+      self.m_cond.notify_all()
+
+  def _listen(self):
+    self.ms_local.listener = True
+    while True:
+      with self.m_cond:
+        while not self.m_queue and not self.m_closed:
+          self.m_busy = False
+          self.m_cond.notify_all()
+          self.m_cond.wait()
+        if not self.m_queue:
+          self.m_busy = False
+          self.m_cond.notify_all()
+          return
+        l_records = list(self.m_queue)
+        self.m_queue.clear()
+        self.m_busy = True
+        self.m_cond.notify_all()
+      for c_record in l_records:
+        self.m_target.handle(c_record)
+
+  def flush(self):
+    """ Wait until all queued records are handled, then flush target handler """
+    with self.m_cond:
+      while (self.m_queue or self.m_busy) and self.m_thread.is_alive():
+        self.m_cond.wait(1)
+    self.m_target.flush()
+
+  def close(self):
+    """ Handle remaining records, stop listener thread and close target handler """
+    with self.m_cond:
+      self.m_closed = True
+      self.m_cond.notify_all()
+    if self.m_thread.is_alive() and self.m_thread is not threading.current_thread():
+      self.m_thread.join()
+    self.m_target.flush()
+    self.m_target.close()
+    super(AsyncHandler, self).close()
+
+#------------------------------------------------------------------#
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
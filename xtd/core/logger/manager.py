@@ -6,14 +6,14 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 #------------------------------------------------------------------#
 
-import copy
-import inspect
 import sys
 import logging
+import traceback
 import importlib
 from future.utils import with_metaclass
 
 from .            import tools
+from .handler     import AsyncHandler
 from ..tools      import mergedicts
 from ..           import mixin
 from ..error      import XtdError
@@ -94,43 +94,114 @@ DEFAULT_CONFIG = {
 
 """
 
+LOCATION_FIELDS = [ "pathname", "filename", "module", "lineno", "funcName" ]
+""" Record attributes computed by :py:meth:`WrapperLogger.findCaller` """
+
 
 
 #------------------------------------------------------------------#
 
 class WrapperLogger(logging.Logger):
+  """ Logger reporting the location of :py:mod:`xtd.core.logger.tools` callers
+
+  Records emitted through :py:func:`xtd.core.logger.tools.debug` and friends
+  get the location of the function that called the wrapper instead of the
+  wrapper itself.
+  """
+
+  ms_location = True
+  """ When False, records get no caller location, see :py:meth:`LogManager.update_location` """
+
+  UNKNOWN = ("(unknown file)", 0, "(unknown function)", None)
+
+  LOGGING_FILES = set([ logging.addLevelName.__code__.co_filename ])
+  """ Source files of logging internals, skipped when looking for caller """
+
   def __init__(self, p_name):
     super(WrapperLogger, self).__init__(p_name)
 
   @staticmethod
   def __sys_version(p_result):
     if sys.version_info.major != 2:
-      return (p_result[0], p_result[1], p_result[2], None)
-    return p_result
-
-  def findCaller(self, p_stack=False):
-    l_curFrame  = inspect.currentframe()
-    l_outFrames = inspect.getouterframes(l_curFrame)
-    l_sourceFrame = None
-    for c_pos in range(0, len(l_outFrames)):
-      l_items = l_outFrames[c_pos]
-      if l_items[1].endswith("core/logger/tools.py") and l_items[3] == "__wrap":
-        l_sourceFrame = l_outFrames[c_pos + 2]
-    if l_sourceFrame:
-      return self.__sys_version((l_sourceFrame[1], l_sourceFrame[2], l_sourceFrame[3]))
-    l_args = []
-    if sys.version_info[0] >= 3:
-      l_args.append(p_stack)
-    #pylint: disable=arguments-differ
-    return super(WrapperLogger, self).findCaller(*l_args)
-
-  def handle(self, p_record):
-    if len(self.handlers) < 2:
-      super(WrapperLogger, self).handle(p_record)
-    else:
-      for c_handler in self.handlers:
-        l_rec = copy.deepcopy(p_record)
-        c_handler.handle(l_rec)
+      return p_result
+    return p_result[:3]
+
+  #pylint: disable=arguments-differ
+  def findCaller(self, p_stack=False, p_stackLevel=1):
+    """ Get location of logging caller
+
+    Walks up the stack from current frame, skips logging internals and stops
+    at the first other frame. When this frame is a logging wrapper, see
+    :py:data:`xtd.core.logger.tools.WRAPPERS`, location of the wrapper
+    caller's caller is returned. No source file is read.
+
+    Args:
+      p_stack (bool) : include stack information in result
+      p_stackLevel (int) : number of additional frames to skip, see :py:meth:`logging.Logger.findCaller`
+
+    Returns:
+      tuple: ``(pathname, lineno, funcName, sinfo)`` (py3) or ``(pathname, lineno, funcName)`` (py2)
+    """
+    if not self.ms_location:
+      return self.__sys_version(self.UNKNOWN)
+    #pylint: disable=protected-access
+    l_frame = sys._getframe(1)
+    l_skip  = self.LOGGING_FILES
+    while l_frame is not None and l_frame.f_code.co_filename in l_skip:
+      l_frame = l_frame.f_back
+    if l_frame is not None and l_frame.f_code in tools.WRAPPERS:
+      l_frame = l_frame.f_back
+      if l_frame is not None:
+        l_frame = l_frame.f_back
+    while l_frame is not None and p_stackLevel > 1:
+      l_frame = l_frame.f_back
+      p_stackLevel -= 1
+    if l_frame is None:
+      return self.__sys_version(self.UNKNOWN)
+    l_info = None
+    if p_stack:
+      l_info = "Stack (most recent call last):\n" + "".join(traceback.format_stack(l_frame)).rstrip("\n")
+    l_code = l_frame.f_code
+    return self.__sys_version((l_code.co_filename, l_frame.f_lineno, l_code.co_name, l_info))
+
+  @staticmethod
+  def _overlay(p_record):
+    """ Get a shallow copy of given record
+
+    Only the attribute dictionary is copied : filters can replace attributes
+    of the copy without affecting other handlers, attribute values such as
+    ``args`` or ``exc_info`` are shared.
+    """
+    l_res = object.__new__(p_record.__class__)
+    l_res.__dict__ = dict(p_record.__dict__)
+    return l_res
+
+  def callHandlers(self, p_record):
+    """ Pass record to all relevant handlers
+
+    Same as :py:meth:`logging.Logger.callHandlers`, except that handlers
+    having filters, which may decorate records, get their own
+    :py:meth:`_overlay` of the record.
+
+    Records are propagated to parent loggers, up to the first logger whose
+    ``propagate`` attribute is False, whatever the number of handlers of
+    each logger.
+    """
+    l_found  = 0
+    l_logger = self
+    while l_logger:
+      for c_handler in l_logger.handlers:
+        l_found += 1
+        if p_record.levelno >= c_handler.level:
+          if c_handler.filters:
+            c_handler.handle(self._overlay(p_record))
+          else:
+            c_handler.handle(p_record)
+      if not l_logger.propagate:
+        break
+      l_logger = l_logger.parent
+    if not l_found:
+      super(WrapperLogger, self).callHandlers(p_record)
 
 #------------------------------------------------------------------#
 
@@ -160,6 +231,20 @@ class LogManager(with_metaclass(mixin.Singleton, object)):
     if p_name in self.m_handlers:
       raise XtdError(__name__, "multiply definied logging handler '%s'" % p_name)
     self.m_handlers[p_name] = p_obj
+    self.update_location()
+
+  def update_location(self):
+    """ Enable or disable caller location of :py:class:`WrapperLogger` records
+
+    Finding the caller location is skipped when no formatter of registered
+    handlers outputs location fields, see :py:data:`LOCATION_FIELDS`. Called
+    by :py:meth:`add_handler` and :py:meth:`initialize`, must be called again
+    when the formatter of a registered handler is replaced. Handlers added to
+    loggers without :py:meth:`add_handler` must be registered to get
+    location fields.
+    """
+    l_formatters = [ x.formatter for x in self.m_handlers.values() if x.formatter is not None ]
+    WrapperLogger.ms_location = [ x for x in l_formatters if self._uses_location(x) ] != []
 
   def get_formatter(self, p_name):
     if not p_name in self.m_formatters:
@@ -243,6 +328,23 @@ class LogManager(with_metaclass(mixin.Singleton, object)):
         raise XtdError(__name__, l_message)
       self.add_formatter(c_name, l_obj)
 
+  @staticmethod
+  def _uses_location(p_formatter):
+    """ Tell if given formatter output record location fields
+
+    Formatters can answer by themselves with a ``uses_location()`` method,
+    otherwise their format string is searched for location fields, in any
+    of the ``%``, ``{`` and ``$`` styles.
+    """
+    if hasattr(p_formatter, "uses_location"):
+      return p_formatter.uses_location()
+    l_fmt = getattr(p_formatter, "_fmt", None) or ""
+    for c_field in LOCATION_FIELDS:
+      for c_pattern in [ "%%(%s)", "{%s", "${%s}", "$%s" ]:
+        if c_pattern % c_field in l_fmt:
+          return True
+    return False
+
   def _load_handlers(self):
     l_usedHandlers = set()
     l_loggers      = self.m_config.get("loggers",  {})
@@ -251,12 +353,13 @@ class LogManager(with_metaclass(mixin.Singleton, object)):
     for c_name, c_value in l_loggers.items():
       l_usedHandlers |= set([ x for x in c_value.get("handlers", {})])
     l_handlers = { x:y for x,y in l_handlers.items() if x in l_usedHandlers }
+    l_async    = self.m_config.get("async", False)
 
     for c_name, c_conf in l_handlers.items():
       l_formatterName = c_conf.get("formatter", "default")
       l_params        = {
         x : y for x,y in c_conf.items()
-        if x not in [ "class", "formatter", "filters" ]
+        if x not in [ "class", "formatter", "filters", "async", "queue", "overflow" ]
       }
       if "stream" in l_params:
         if l_params["stream"] == "stdout":
@@ -275,6 +378,14 @@ class LogManager(with_metaclass(mixin.Singleton, object)):
       for c_filter in c_conf.get("filters", []):
         l_filter = self.get_filter(c_filter)
         l_obj.addFilter(l_filter)
+      if c_conf.get("async", l_async):
+        try:
+          l_obj = AsyncHandler(l_obj, c_name,
+                               c_conf.get("queue", 10000),
+                               c_conf.get("overflow", "block"))
+        except XtdError as l_error:
+          l_message = "unable to initialize logging handler '%s' : %s" % (c_name, str(l_error))
+          raise XtdError(__name__, l_message)
       self.add_handler(c_name, l_obj)
 
   def _load_loggers(self):
@@ -300,8 +411,21 @@ class LogManager(with_metaclass(mixin.Singleton, object)):
       self._load_loggers()
     except Exception as l_error:
       raise XtdError(__name__, "unable to initialize logging facility : %s" % str(l_error))
+    self.update_location()
     tools.info(__name__, "facility initialized")
 
+  def flush(self):
+    """ Flush all handlers
+
+    Waits for records queued in asynchronous handlers to be written, see
+    :py:class:`~xtd.core.logger.handler.AsyncHandler`.
+    """
+    for c_handler in self.m_handlers.values():
+      try:
+        c_handler.flush()
+      except Exception as l_error: # pylint: disable=broad-except
+        sys.stderr.write("unable to flush logging handler : %s\n" % str(l_error))
+
 
 # Local Variables:
 # ispell-local-dictionary: "american"
@@ -9,29 +9,109 @@ import logging
 
 #------------------------------------------------------------------#
 
+LEVELS = {
+  "debug"     : logging.DEBUG,
+  "info"      : logging.INFO,
+  "warning"   : logging.WARNING,
+  "error"     : logging.ERROR,
+  "critical"  : logging.CRITICAL,
+  "exception" : logging.ERROR
+}
+""" Levels of logging wrappers, by wrapper name """
+
+__loggers = {}
+
 def get(p_module = None):
   if (p_module == "root") or (p_module is None):
     return logging.getLogger()
   return logging.getLogger(p_module)
 
+def _logger(p_module):
+  l_logger = __loggers.get(p_module, None)
+  if l_logger is None:
+    l_logger = __loggers[p_module] = logging.getLogger(p_module)
+  return l_logger
+
+def is_enabled(p_module, p_level):
+  """ Tell if a record of given level would be processed by given module logger
+
+  Logger objects are cached by module name, level check is delegated to
+  :py:meth:`logging.Logger.isEnabledFor`, which caches effective levels
+  and invalidates them on level changes since python 3.7.
+
+  Args:
+    p_module (str) : logger name
+    p_level (int) : record level
+  """
+  return _logger(p_module).isEnabledFor(p_level)
+
+class Lazy(object):
+  """ Message argument computed only when the record is formatted
+
+  Useful for expensive arguments of records that are usually disabled :
+
+  >>> logger.debug(__name__, "state : %s", logger.Lazy(json.dumps, l_state, indent=2))
+
+  The value is computed on first conversion to string, only with ``%s`` and
+  ``%r`` placeholders.
+
+  Args:
+    p_func (function) : functor computing the argument value
+    p_args : positional arguments of ``p_func``
+    p_kwds : keyword arguments of ``p_func``
+  """
+  __slots__ = [ "m_func", "m_args", "m_kwds", "m_value" ]
+
+  ms_unset = object()
+
+  def __init__(self, p_func, *p_args, **p_kwds):
+    self.m_func  = p_func
+    self.m_args  = p_args
+    self.m_kwds  = p_kwds
+    self.m_value = self.ms_unset
+
+  def value(self):
+    """ Get argument value, computed on first call """
+    if self.m_value is self.ms_unset:
+      self.m_value = self.m_func(*self.m_args, **self.m_kwds)
+    return self.m_value
+
+  def __str__(self):
+    return str(self.value())
+
+  def __repr__(self):
+    return repr(self.value())
+
 def __wrap(p_func, p_module, p_msg, *p_args, **p_kwds):
-  l_logger = logging.getLogger(p_module)
-  l_func   = getattr(l_logger, p_func)
+  l_func = getattr(_logger(p_module), p_func)
   l_func(p_msg, *p_args, **p_kwds)
 
+WRAPPERS = set([ __wrap.__code__ ])
+""" Code objects of logging wrappers, their caller's caller is reported as
+record location, see :py:meth:`~xtd.core.logger.manager.WrapperLogger.findCaller`
+"""
+
 def debug(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("debug", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.DEBUG):
+    __wrap("debug", p_module, p_msg, *p_args, **p_kwds)
 def info(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("info", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.INFO):
+    __wrap("info", p_module, p_msg, *p_args, **p_kwds)
 def warning(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("warning", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.WARNING):
+    __wrap("warning", p_module, p_msg, *p_args, **p_kwds)
 def error(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("error", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.ERROR):
+    __wrap("error", p_module, p_msg, *p_args, **p_kwds)
 def critical(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("critical", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.CRITICAL):
+    __wrap("critical", p_module, p_msg, *p_args, **p_kwds)
 def exception(p_module, p_msg, *p_args, **p_kwds):
-  __wrap("exception", p_module, p_msg, *p_args, **p_kwds)
+  if is_enabled(p_module, logging.ERROR):
+    __wrap("exception", p_module, p_msg, *p_args, **p_kwds)
 def log(p_level, p_module, p_msg, *p_args, **p_kwds):
-  __wrap(p_level, p_module, p_msg, *p_args, **p_kwds)
+  l_level = LEVELS.get(p_level, None)
+  if l_level is None or is_enabled(p_module, l_level):
+    __wrap(p_level, p_module, p_msg, *p_args, **p_kwds)
 
 #------------------------------------------------------------------#
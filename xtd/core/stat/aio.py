@@ -0,0 +1,37 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+"""
+
+Asyncio helpers for statistic counters, requires python >= 3.5
+
+"""
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import functools
+
+#------------------------------------------------------------------#
+
+def measure_coroutine(p_perf, p_func):
+  """ Wrap a coroutine function so that each call is measured
+
+  Args:
+    p_perf (Perf) : counter receiving measures
+    p_func (function) : coroutine function to wrap
+
+  Returns:
+    function: wrapped coroutine function
+  """
+  @functools.wraps(p_func)
+  async def wrapper(*p_args, **p_kwds):
+    with p_perf.measure():
+      return await p_func(*p_args, **p_kwds)
+  return wrapper
+
+#------------------------------------------------------------------#
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -0,0 +1,341 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+"""
+
+.. inheritance-diagram:: xtd.core.stat.arena
+   :parts: 1
+
+"""
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import json
+import mmap
+import struct
+import threading
+
+from ..error   import XtdError
+from .counter  import BaseCounter
+
+#------------------------------------------------------------------#
+
+class CounterArena(object):
+  """ Fixed-layout shared memory region of named counter slots
+
+  The arena must be created before forking worker processes. It holds one
+  *stripe* of slots per process : each process selects its stripe with
+  :py:meth:`attach` and only writes there, so no inter-process lock is needed.
+  Reads can either sum a slot over all stripes or target a specific one.
+
+  When ``p_path`` is given, the region is backed by this file, the layout is
+  written in the file header so that any external process can map it with
+  :py:meth:`open` and publish the values through its own
+  :py:class:`~xtd.core.stat.manager.StatManager`.
+
+  Example:
+
+    ::
+
+      l_arena = CounterArena([ "requests", "errors" ], p_stripes=4)
+      for c_name in [ "requests", "errors" ]:
+        StatManager().register_counter("myapp", l_arena.counter(c_name))
+      for c_idx in range(1, 4):
+        if not os.fork():
+          l_arena.attach(c_idx)
+          ...
+
+  Args:
+    p_names (list) : slot names
+    p_stripes (int) : number of stripes (processes)
+    p_path (str) : backing file path, None for anonymous shared memory
+    p_types (dict) : slot type by name, ``q`` (64 bits integer, default)
+     or ``d`` (double)
+
+  Raises:
+    XtdError: invalid layout or unable to create backing file
+  """
+
+  MAGIC = b"XTDARENA"
+  """ Backing file signature """
+
+  def __init__(self, p_names, p_stripes = 1, p_path = None, p_types = None):
+    if p_types is None:
+      p_types = {}
+    self.m_names   = list(p_names)
+    self.m_types   = [ p_types.get(x, 'q') for x in self.m_names ]
+    self.m_stripes = int(p_stripes)
+    self.m_path    = p_path
+    self.m_stripe  = 0
+    self.m_lock    = threading.Lock()
+    self.m_slots   = { y : x for x, y in enumerate(self.m_names) }
+    self.m_structs = [ struct.Struct(x) for x in self.m_types ]
+    self.m_counters = {}
+
+    if len(self.m_slots) != len(self.m_names):
+      raise XtdError(__name__, "duplicated slot name in counter arena")
+    if [ x for x in self.m_types if x not in [ 'q', 'd' ] ]:
+      raise XtdError(__name__, "invalid slot type in counter arena, must be 'q' or 'd'")
+    if self.m_stripes < 1:
+      raise XtdError(__name__, "counter arena needs at least one stripe")
+
+    l_header = json.dumps({
+      "names"   : self.m_names,
+      "types"   : self.m_types,
+      "stripes" : self.m_stripes
+    }).encode("utf-8")
+    self.m_offset = self._align(len(self.MAGIC) + 4 + len(l_header))
+    l_size = self.m_offset + self.m_stripes * len(self.m_names) * 8
+    if p_path is None:
+      self.m_mmap = mmap.mmap(-1, l_size)
+    else:
+      try:
+        with open(p_path, "w+b") as l_file:
+          l_file.truncate(l_size)
+          self.m_mmap = mmap.mmap(l_file.fileno(), l_size)
+      except (IOError, OSError) as l_error:
+        raise XtdError(__name__, "unable to create counter arena '%s' : %s" % (p_path, str(l_error)))
+    self.m_mmap[0:len(self.MAGIC)] = self.MAGIC
+    struct.pack_into("I", self.m_mmap, len(self.MAGIC), len(l_header))
+    l_start = len(self.MAGIC) + 4
+    self.m_mmap[l_start:l_start + len(l_header)] = l_header
+
+  @staticmethod
+  def _align(p_size):
+    return (p_size + 7) & ~7
+
+  @classmethod
+  def open(cls, p_path):
+    """ Map an existing arena file in read-only mode
+
+    Args:
+      p_path (str) : arena backing file, see ``p_path`` constructor parameter
+
+    Returns:
+      CounterArena: arena object, :py:meth:`set`, :py:meth:`incr` and
+      :py:meth:`attach` raise :py:class:`~xtd.core.error.XtdError`
+
+    Raises:
+      XtdError: file doesn't exist or is not a counter arena
+    """
+    try:
+      with open(p_path, "rb") as l_file:
+        l_mmap = mmap.mmap(l_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError) as l_error:
+      raise XtdError(__name__, "unable to open counter arena '%s' : %s" % (p_path, str(l_error)))
+
+    l_start = len(cls.MAGIC) + 4
+    if len(l_mmap) < l_start or l_mmap[0:len(cls.MAGIC)] != cls.MAGIC:
+      raise XtdError(__name__, "file '%s' is not a counter arena" % p_path)
+    l_len    = struct.unpack_from("I", l_mmap, len(cls.MAGIC))[0]
+    l_header = json.loads(l_mmap[l_start:l_start + l_len].decode("utf-8"))
+
+    l_obj = cls.__new__(cls)
+    l_obj.m_names    = l_header["names"]
+    l_obj.m_types    = l_header["types"]
+    l_obj.m_stripes  = l_header["stripes"]
+    l_obj.m_path     = p_path
+    l_obj.m_stripe   = None
+    l_obj.m_lock     = threading.Lock()
+    l_obj.m_slots    = { y : x for x, y in enumerate(l_obj.m_names) }
+    l_obj.m_structs  = [ struct.Struct(x) for x in l_obj.m_types ]
+    l_obj.m_counters = {}
+    l_obj.m_offset   = cls._align(l_start + l_len)
+    l_obj.m_mmap     = l_mmap
+    return l_obj
+
+  def close(self):
+    """ Unmap shared region """
+    self.m_mmap.close()
+
+  def attach(self, p_stripe):
+    """ Select the stripe written by current process
+
+    Must be called by each forked process before writing any value.
+
+    Args:
+      p_stripe (int) : stripe index, from 0 to ``p_stripes - 1``
+
+    Raises:
+      XtdError: invalid stripe index or read-only arena
+    """
+    self._check_writable()
+    if not 0 <= p_stripe < self.m_stripes:
+      raise XtdError(__name__, "invalid counter arena stripe '%d'" % p_stripe)
+    self.m_stripe = p_stripe
+    self.m_lock   = threading.Lock()
+
+  def names(self):
+    """ Get slot names """
+    return list(self.m_names)
+
+  def stripes(self):
+    """ Get number of stripes """
+    return self.m_stripes
+
+  def slot(self, p_name):
+    """ Get slot index of given name
+
+    Raises:
+      XtdError: undefined slot name
+    """
+    if not p_name in self.m_slots:
+      raise XtdError(__name__, "undefined counter arena slot '%s'" % p_name)
+    return self.m_slots[p_name]
+
+  def _check_writable(self):
+    if self.m_stripe is None:
+      raise XtdError(__name__, "read-only arena")
+
+  def _pos(self, p_stripe, p_slot):
+    return self.m_offset + (p_stripe * len(self.m_names) + p_slot) * 8
+
+  def get(self, p_slot, p_stripe = None):
+    """ Read a slot value
+
+    Args:
+      p_slot (int) : slot index, see :py:meth:`slot`
+      p_stripe (int) : stripe to read, None to get the sum over all stripes
+
+    Returns:
+      numeric: slot value
+    """
+    l_struct = self.m_structs[p_slot]
+    if p_stripe is not None:
+      return l_struct.unpack_from(self.m_mmap, self._pos(p_stripe, p_slot))[0]
+    l_res = 0
+    for c_stripe in range(0, self.m_stripes):
+      l_res += l_struct.unpack_from(self.m_mmap, self._pos(c_stripe, p_slot))[0]
+    return l_res
+
+  def set(self, p_slot, p_val):
+    """ Write slot value of current process stripe
+
+    Raises:
+      struct.error: ``p_val`` doesn't match slot type
+      XtdError: read-only arena, see :py:meth:`open`
+    """
+    self._check_writable()
+    with self.m_lock:
+      self.m_structs[p_slot].pack_into(self.m_mmap, self._pos(self.m_stripe, p_slot), p_val)
+
+  def incr(self, p_slot, p_val = 1):
+    """ Increment slot value of current process stripe
+
+    Raises:
+      struct.error: ``p_val`` doesn't match slot type
+      XtdError: read-only arena, see :py:meth:`open`
+    """
+    self._check_writable()
+    l_struct = self.m_structs[p_slot]
+    l_pos    = self._pos(self.m_stripe, p_slot)
+    with self.m_lock:
+      l_struct.pack_into(self.m_mmap, l_pos, l_struct.unpack_from(self.m_mmap, l_pos)[0] + p_val)
+
+  def counter(self, p_name, p_detail = False):
+    """ Get the counter object bound to given slot
+
+    Args:
+      p_name (str) : slot name
+      p_detail (bool) : see :py:class:`ArenaValue`
+
+    Returns:
+      ArenaValue: counter object, created on first call for each
+      ``p_name`` and ``p_detail`` pair
+
+    Raises:
+      XtdError: undefined slot name
+    """
+    l_key = (p_name, bool(p_detail))
+    if not l_key in self.m_counters:
+      self.m_counters[l_key] = ArenaValue(p_name, self, p_detail=p_detail)
+    return self.m_counters[l_key]
+
+  def counters(self, p_detail = False):
+    """ Get counter objects bound to all slots, see :py:meth:`counter` """
+    return [ self.counter(x, p_detail) for x in self.m_names ]
+
+#------------------------------------------------------------------#
+
+class ArenaValue(BaseCounter):
+  """ Numeric value stored in a :py:class:`CounterArena` slot
+
+  Writes go to the stripe of current process, reads and visits report the
+  sum over all stripes.
+
+  Args:
+    p_name (str) : counter name
+    p_arena (CounterArena) : arena holding the value
+    p_slot (str) : slot name, defaults to ``p_name``
+    p_detail (bool) : when True, visitors also get the value of each stripe
+     named ``<name>.<stripe-index>``
+
+  Raises:
+    XtdError: undefined slot name
+
+  **Visitors**
+
+  See :py:class:`~xtd.core.stat.counter.Value`
+  """
+  def __init__(self, p_name, p_arena, p_slot = None, p_detail = False):
+    super(ArenaValue, self).__init__(p_name)
+    if p_slot is None:
+      p_slot = p_name
+    self.m_arena  = p_arena
+    self.m_slot   = p_arena.slot(p_slot)
+    self.m_detail = p_detail
+
+  # pylint: disable=invalid-name
+  @property
+  def val(self):
+    """ (Property) sum of slot values over all stripes
+
+    Setting the property writes the stripe of current process
+
+    Raises:
+      TypeError: affected value dosen't match slot type
+    """
+    return self.m_arena.get(self.m_slot)
+
+  @val.setter
+  def val(self, p_val):
+    try:
+      self.m_arena.set(self.m_slot, p_val)
+    except struct.error:
+      raise TypeError
+
+  def incr(self, p_val = 1):
+    """ Increments the value of current process stripe
+
+    Raises:
+      TypeError: given value dosen't match slot type
+    """
+    try:
+      self.m_arena.incr(self.m_slot, p_val)
+    except struct.error:
+      raise TypeError
+
+  def decr(self, p_val = 1):
+    """ Decrements the value of current process stripe
+
+    Raises:
+      TypeError: given value dosen't match slot type
+    """
+    self.incr(-1 * p_val)
+
+  def _visit_safe(self, p_visitor):
+    p_visitor(self.m_name, self.m_arena.get(self.m_slot))
+    if self.m_detail:
+      for c_stripe in range(0, self.m_arena.stripes()):
+        p_visitor("%s.%d" % (self.m_name, c_stripe), self.m_arena.get(self.m_slot, c_stripe))
+
+  def _update_safe(self):
+    """ Noop """
+    pass
+
+#------------------------------------------------------------------#
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -13,12 +13,47 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 #------------------------------------------------------------------#
 
 import threading
-import sys
+import bisect
+import functools
+import inspect
+import math
 import time
+import array
+import collections
+import weakref
 import multiprocessing
 
 from ..error import XtdError
 
+UNLOADED = object()
+""" Value of :py:data:`numpy` until :py:func:`get_numpy` is called """
+
+numpy = UNLOADED
+
+def get_numpy():
+  """ Get :py:mod:`numpy` module, imported on first call, None when not installed """
+  global numpy # pylint: disable=global-statement,invalid-name
+  if numpy is UNLOADED:
+    try:
+      import numpy as l_numpy
+    except ImportError:
+      l_numpy = None
+    numpy = l_numpy
+  return numpy
+
+#------------------------------------------------------------------#
+
+if hasattr(time, "perf_counter_ns"):
+  clock_ns = time.perf_counter_ns
+elif hasattr(time, "perf_counter"):
+  def clock_ns():
+    """ Monotonic clock, in nanoseconds """
+    return int(time.perf_counter() * 1000000000)
+else:
+  def clock_ns():
+    """ Monotonic clock, in nanoseconds """
+    return int(time.time() * 1000000000)
+
 #------------------------------------------------------------------#
 
 
@@ -32,8 +67,26 @@ class BaseCounter(object):
     p_name (str): object name
   """
   def __init__(self, p_name):
-    self.m_lock = multiprocessing.Lock()
-    self.m_name = p_name
+    self.m_lock    = multiprocessing.Lock()
+    self.m_name    = p_name
+    self.m_version = 0
+
+  def version(self):
+    """ Get a number that changes each time visited values may change
+
+    Used to skip the update and visit of unchanged counters, see
+    :py:meth:`xtd.core.stat.manager.StatManager.snapshot`. Counters whose values
+    depend on time, or that can't tell, return None.
+
+    Returns:
+      int|tuple: current version, compared by equality only, None when unknown
+    """
+    return None
+
+  def _overrides_update(self, p_class):
+    l_func = getattr(self.__class__._update_safe, "__func__", self.__class__._update_safe)
+    l_base = getattr(p_class._update_safe, "__func__", p_class._update_safe)
+    return l_func is not l_base
 
   def visit(self, p_visitor):
     """ Visit object tree with visitor """
@@ -50,6 +103,13 @@ class BaseCounter(object):
     with self.m_lock:
       self._update_safe()
 
+  def _prefix(self, p_prefix):
+    """ Prepend ``p_prefix`` to object name """
+    if self.m_name:
+      self.m_name = p_prefix + "." + self.m_name
+    else:
+      self.m_name = p_prefix
+
   def _visit_safe(self, p_visitor):
     raise NotImplementedError
 
@@ -92,6 +152,17 @@ class Value(BaseCounter):
     """ Make the current value undefined """
     with self.m_lock:
       self.m_unset = True
+      self.m_version += 1
+
+  def version(self):
+    """ See :py:meth:`BaseCounter.version`
+
+    The value is stored in shared memory and can be modified by forked
+    processes, the version therefore includes the current value.
+    """
+    if self._overrides_update(Value):
+      return None
+    return (self.m_version, self.m_unset, self.m_value.value)
 
   # pylint: disable=invalid-name
   @property
@@ -119,6 +190,7 @@ class Value(BaseCounter):
         self.m_value.value = p_val
       else:
         self.m_unset = True
+      self.m_version += 1
 
   def incr(self, p_val = 1):
     """ Increments the current value
@@ -131,6 +203,7 @@ class Value(BaseCounter):
     """
     with self.m_lock:
       self.m_value.value += p_val
+      self.m_version += 1
 
   def decr(self, p_val = 1):
     """ Decrements the current value
@@ -216,6 +289,169 @@ class Double(Value):
 
 #------------------------------------------------------------------#
 
+class ShardedValue(Value):
+  """ Numeric value holder optimized for concurrent increments
+
+  Each thread increments its own private shard without taking any lock,
+  shards are summed when the value is read or visited. Shards of terminated
+  threads are folded in a base value.
+
+  Typing and visitor output are the same as :py:class:`Value`.
+
+  Args:
+    p_name (str): Object's name
+    p_value (numeric): Initial value, type depends on ``p_type``
+    p_type (str) : One character type spec, see :py:class:`multiprocessing.Value`
+
+  Raises:
+    TypeError: invalid ``p_type``
+    TypeError: invalid ``p_value`` for given ``p_type``
+
+  Note:
+    Shards are local to the current process, increments made by forked
+    children are not seen by the parent.
+  """
+  def __init__(self, p_name, p_value = None, p_type='i'):
+    super(ShardedValue, self).__init__(p_name, p_value, p_type)
+    self.m_shardType = 'q'
+    if p_type in ['f', 'd']:
+      self.m_shardType = 'd'
+    self.m_base   = self.m_value.value
+    self.m_local  = threading.local()
+    self.m_shards = []
+
+  def _shard(self):
+    l_shard = array.array(self.m_shardType, [0])
+    with self.m_lock:
+      self.m_shards.append((weakref.ref(threading.current_thread()), l_shard))
+    self.m_local.shard = l_shard
+    return l_shard
+
+  def _total(self):
+    l_shards = []
+    for c_ref, c_shard in self.m_shards:
+      l_thread = c_ref()
+      if l_thread is None or not l_thread.is_alive():
+        self.m_base += c_shard[0]
+      else:
+        l_shards.append((c_ref, c_shard))
+    self.m_shards = l_shards
+    return self.m_base + sum(x[1][0] for x in l_shards)
+
+  # pylint: disable=invalid-name
+  @property
+  def val(self):
+    """ (Property) internal value
+
+    If set to None, the current value is ``undefined``
+
+    Returns:
+      (numeric) : current internal value, None if unset
+
+    Raises:
+      TypeError: affected value dosen't match constructor type
+    """
+    with self.m_lock:
+      if self.m_unset:
+        return None
+      self.m_value.value = self._total()
+      return self.m_value.value
+
+  @val.setter
+  def val(self, p_val):
+    with self.m_lock:
+      if p_val != None:
+        self.m_value.value = p_val
+        self.m_unset       = False
+        l_shards           = self._total() - self.m_base
+        self.m_base        = p_val - l_shards
+      else:
+        self.m_unset = True
+      self.m_version += 1
+
+  def incr(self, p_val = 1):
+    """ Increments the current value, lock-free
+
+    Args:
+      p_val (numeric): add p_val to current internal value
+
+    Raises:
+      TypeError: given value dosen't match constructor type
+    """
+    try:
+      l_shard = self.m_local.shard
+    except AttributeError:
+      l_shard = self._shard()
+    l_shard[0] += p_val
+    self.m_version += 1
+
+  def _visit_safe(self, p_visitor):
+    """ Apply visitor to the sum of all shards
+
+    Raises:
+      TypeError: visitor as invalid prototype
+    """
+    self.m_value.value = self._total()
+    super(ShardedValue, self)._visit_safe(p_visitor)
+
+#------------------------------------------------------------------#
+
+class ShardedInt32(ShardedValue):
+  """ ShardedValue specialization for signed 32 bits integer """
+
+  TYPE = Int32.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedInt32, self).__init__(p_name, p_value, self.TYPE)
+
+class ShardedInt64(ShardedValue):
+  """ ShardedValue specialization for signed 64 bits integer """
+
+  TYPE = Int64.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedInt64, self).__init__(p_name, p_value, self.TYPE)
+
+class ShardedUInt32(ShardedValue):
+  """ ShardedValue specialization for unsigned 32 bits integer """
+
+  TYPE = UInt32.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedUInt32, self).__init__(p_name, p_value, self.TYPE)
+
+class ShardedUInt64(ShardedValue):
+  """ ShardedValue specialization for unsigned 64 bits integer """
+
+  TYPE = UInt64.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedUInt64, self).__init__(p_name, p_value, self.TYPE)
+
+class ShardedFloat(ShardedValue):
+  """ ShardedValue specialization for float """
+
+  TYPE = Float.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedFloat, self).__init__(p_name, p_value, self.TYPE)
+
+class ShardedDouble(ShardedValue):
+  """ ShardedValue specialization for double """
+
+  TYPE = Double.TYPE
+  """:py:class:`multiprocessing.Value` type spec"""
+
+  def __init__(self, p_name, p_value = None):
+    super(ShardedDouble, self).__init__(p_name, p_value, self.TYPE)
+
+#------------------------------------------------------------------#
+
 class Composed(BaseCounter):
   """ Manage a collection child counters """
   def __init__(self, p_name):
@@ -226,15 +462,39 @@ class Composed(BaseCounter):
     """ Register a child counter
 
     Current object name is prepend to registered child
-    name with the following format : ``<parent-name>.<child-name>``
+    name with the following format : ``<parent-name>.<child-name>``.
+    When the child is itself a :py:class:`Composed`, the prefix is also
+    applied to its own children.
 
     Args:
       p_counter (BaseCounter): child counter to add
     """
     with self.m_lock:
       if self.m_name:
-        p_counter.m_name = self.m_name + "." + p_counter.m_name
+        p_counter._prefix(self.m_name)
       self.m_childs.append(p_counter)
+      self.m_version += 1
+
+  def _prefix(self, p_prefix):
+    for c_child in self.m_childs:
+      c_child._prefix(p_prefix)
+    super(Composed, self)._prefix(p_prefix)
+
+  def version(self):
+    """ Own version and children versions, see :py:meth:`BaseCounter.version`
+
+    Returns None when any child version is unknown or when ``_update_safe``
+    is overridden by a sub-class.
+    """
+    if self._overrides_update(Composed):
+      return None
+    l_res = [ self.m_version ]
+    for c_child in self.m_childs:
+      l_version = c_child.version()
+      if l_version is None:
+        return None
+      l_res.append(l_version)
+    return tuple(l_res)
 
   def _visit_safe(self, p_visitor):
     for c_child in self.m_childs:
@@ -246,21 +506,521 @@ class Composed(BaseCounter):
 
 #------------------------------------------------------------------#
 
+class QuantileSketch(object):
+  """ Fixed-memory, mergeable histogram for quantile estimation
+
+  Non-negative integer values are counted in log-linear buckets, in the
+  fashion of HDR histograms: values below ``2^p_precision`` are stored
+  exactly, bigger values share a bucket with neighbors having the same
+  ``p_precision`` most significant bits. Estimated quantiles are therefore
+  within ``2^-p_precision`` relative error of the real ones, and clamped
+  to the smallest and biggest counted values.
+
+  Two sketches with the same layout can be merged by adding their buckets,
+  which makes it possible to aggregate data collected by several threads or
+  processes, see :py:meth:`merge` and :py:meth:`state`.
+
+  Args:
+    p_precision (int) : number of significant bits kept for each value
+    p_maxBits (int) : bit length of biggest trackable value, bigger values are
+     counted in the last bucket
+
+  Note:
+    Negative values are counted as ``0``
+  """
+  def __init__(self, p_precision = 7, p_maxBits = 40):
+    self.m_precision = p_precision
+    self.m_maxBits   = max(p_maxBits, p_precision)
+    self.m_subCount  = 1 << p_precision
+    self.m_halfCount = 1 << (p_precision - 1)
+    self.m_size      = self.m_subCount + (self.m_maxBits - p_precision) * self.m_halfCount
+    self.m_counts    = array.array('L', [0]) * self.m_size
+    self.m_count     = 0
+    self.m_min       = None
+    self.m_max       = None
+
+  def index(self, p_val):
+    """ Get bucket index of given value """
+    if p_val < self.m_subCount:
+      return max(p_val, 0)
+    l_shift = p_val.bit_length() - self.m_precision
+    l_idx   = self.m_subCount + (l_shift - 1) * self.m_halfCount
+    l_idx  += (p_val >> l_shift) - self.m_halfCount
+    return min(l_idx, self.m_size - 1)
+
+  def value(self, p_idx):
+    """ Get representative value (middle of range) of given bucket index """
+    if p_idx < self.m_subCount:
+      return p_idx
+    l_offset = p_idx - self.m_subCount
+    l_shift  = l_offset // self.m_halfCount + 1
+    l_low    = (l_offset % self.m_halfCount + self.m_halfCount) << l_shift
+    return l_low + ((1 << l_shift) - 1) // 2
+
+  def add(self, p_val, p_count = 1):
+    """ Count ``p_count`` occurrences of ``p_val`` """
+    l_val = max(p_val, 0)
+    self.m_counts[self.index(l_val)] += p_count
+    self.m_count += p_count
+    if self.m_min is None or l_val < self.m_min:
+      self.m_min = l_val
+    if self.m_max is None or l_val > self.m_max:
+      self.m_max = l_val
+
+  def clear(self):
+    """ Reset all buckets """
+    self.m_counts = array.array('L', [0]) * self.m_size
+    self.m_count  = 0
+    self.m_min    = None
+    self.m_max    = None
+
+  def merge(self, p_other):
+    """ Add buckets of ``p_other`` to current object
+
+    Args:
+      p_other (QuantileSketch) : sketch to merge
+
+    Raises:
+      ValueError: ``p_other`` has a different layout
+    """
+    if (p_other.m_precision, p_other.m_maxBits) != (self.m_precision, self.m_maxBits):
+      raise ValueError("unable to merge sketches with different layouts")
+    l_counts = self.m_counts
+    for c_idx, c_count in enumerate(p_other.m_counts):
+      if c_count:
+        l_counts[c_idx] += c_count
+    self.m_count += p_other.m_count
+    for c_val in [ p_other.m_min, p_other.m_max ]:
+      if c_val is None:
+        continue
+      if self.m_min is None or c_val < self.m_min:
+        self.m_min = c_val
+      if self.m_max is None or c_val > self.m_max:
+        self.m_max = c_val
+
+  def quantiles(self, p_percentiles):
+    """ Estimate values at given percentiles in a single pass
+
+    Args:
+      p_percentiles (list) : percentiles, between 0 and 100
+
+    Returns:
+      list: estimated value for each percentile, None when sketch is empty
+    """
+    if not self.m_count:
+      return [ None for x in p_percentiles ]
+    l_ranks = sorted((max(1, int(math.ceil(x * self.m_count / 100.0))), y)
+                     for y, x in enumerate(p_percentiles))
+    l_res  = [ None ] * len(p_percentiles)
+    l_pos  = 0
+    l_cumul = 0
+    for c_idx, c_count in enumerate(self.m_counts):
+      if not c_count:
+        continue
+      l_cumul += c_count
+      while l_pos < len(l_ranks) and l_ranks[l_pos][0] <= l_cumul:
+        l_res[l_ranks[l_pos][1]] = min(max(self.value(c_idx), self.m_min), self.m_max)
+        l_pos += 1
+      if l_pos == len(l_ranks):
+        break
+    return l_res
+
+  def state(self):
+    """ Get a sparse, json-serializable, representation of the sketch
+
+    Returns:
+      dict: see :py:meth:`from_state`
+    """
+    return {
+      "precision" : self.m_precision,
+      "maxBits"   : self.m_maxBits,
+      "min"       : self.m_min,
+      "max"       : self.m_max,
+      "counts"    : { str(x) : y for x, y in enumerate(self.m_counts) if y }
+    }
+
+  @classmethod
+  def from_state(cls, p_state):
+    """ Build a sketch from the output of :py:meth:`state` """
+    l_obj = cls(p_state["precision"], p_state["maxBits"])
+    for c_idx, c_count in p_state["counts"].items():
+      l_obj.m_counts[int(c_idx)] = c_count
+      l_obj.m_count += c_count
+    l_slots = [ int(x) for x in p_state["counts"].keys() ]
+    if l_slots:
+      l_obj.m_min = p_state.get("min", l_obj.value(min(l_slots)))
+      l_obj.m_max = p_state.get("max", l_obj.value(max(l_slots)))
+    return l_obj
+
+#------------------------------------------------------------------#
+
+class Quantile(Composed):
+  """ Estimates percentiles of collected items over a fixed period of time
+
+  Items are counted in a :py:class:`QuantileSketch`, memory usage doesn't
+  depend on the amount of collected items. The period is split in
+  :py:attr:`SLICES` sub-periods rotated as time goes by.
+
+  For each requested percentile ``P``, the counter holds a child value
+  named ``pP`` (dot removed, ``99.9`` gives ``p999``). When no items are
+  available for the last ``p_timeMs``, the children are undefined, thus,
+  collected by visitors as ``NaN``.
+
+  Args:
+    p_name (str) : counter name
+    p_percentiles (list) : percentiles to compute, between 0 and 100
+    p_timeMs (int) : amount of time (millisecond) to keep collected values
+    p_type (str) : children type representation, see :py:class:`multiprocessing.Value`
+    p_precision (int) : see :py:class:`QuantileSketch`
+  """
+
+  SLICES = 4
+  """ Number of sub-periods the time window is split in """
+
+  def __init__(self, p_name, p_percentiles = (50, 90, 99, 99.9), p_timeMs = 10000,
+               p_type = 'L', p_precision = 7):
+    super(Quantile, self).__init__(p_name)
+    self.m_percentiles = list(p_percentiles)
+    self.m_sliceMs     = max(1, int(p_timeMs / self.SLICES))
+    self.m_sketches    = [ QuantileSketch(p_precision) for x in range(self.SLICES + 1) ]
+    self.m_epochs      = [ None ] * (self.SLICES + 1)
+    self.m_values      = []
+    for c_percentile in self.m_percentiles:
+      l_value = Value(self.percentile_name(c_percentile), None, p_type)
+      self.m_values.append(l_value)
+      self.register(l_value)
+
+  @staticmethod
+  def percentile_name(p_percentile):
+    """ Get child counter name of given percentile """
+    return "p" + ("%g" % p_percentile).replace(".", "")
+
+  def _epoch(self):
+    return int(time.time() * 1000) // self.m_sliceMs
+
+  def push(self, p_val):
+    """ Add a value in collection
+
+    Args:
+      p_val (int): value to add
+
+    Raises:
+      TypeError: ``p_val`` is not a number
+    """
+    try:
+      l_val = int(p_val)
+    except ValueError:
+      raise TypeError
+    l_epoch = self._epoch()
+    l_slot  = l_epoch % len(self.m_sketches)
+    with self.m_lock:
+      if self.m_epochs[l_slot] != l_epoch:
+        self.m_sketches[l_slot].clear()
+        self.m_epochs[l_slot] = l_epoch
+      self.m_sketches[l_slot].add(l_val)
+
+  def merge(self, p_sketch):
+    """ Merge externally collected data into current time slice
+
+    Args:
+      p_sketch (QuantileSketch) : data to merge
+
+    Raises:
+      ValueError: ``p_sketch`` has a different layout
+    """
+    l_epoch = self._epoch()
+    l_slot  = l_epoch % len(self.m_sketches)
+    with self.m_lock:
+      if self.m_epochs[l_slot] != l_epoch:
+        self.m_sketches[l_slot].clear()
+        self.m_epochs[l_slot] = l_epoch
+      self.m_sketches[l_slot].merge(p_sketch)
+
+  def _sketch(self):
+    l_epoch = self._epoch()
+    l_res   = None
+    for c_epoch, c_sketch in zip(self.m_epochs, self.m_sketches):
+      if c_epoch is None or c_epoch <= l_epoch - len(self.m_sketches) or not c_sketch.m_count:
+        continue
+      if l_res is None:
+        l_res = QuantileSketch(c_sketch.m_precision, c_sketch.m_maxBits)
+      l_res.merge(c_sketch)
+    return l_res
+
+  def sketch(self):
+    """ Get data collected over the time window
+
+    Returns:
+      QuantileSketch: merged data, None when no items are available
+    """
+    with self.m_lock:
+      return self._sketch()
+
+  def _update_safe(self):
+    l_sketch = self._sketch()
+    if l_sketch is None:
+      for c_value in self.m_values:
+        c_value.unset()
+      return
+    l_results = l_sketch.quantiles(self.m_percentiles)
+    for c_value, c_result in zip(self.m_values, l_results):
+      c_value.val = c_result
+
+#------------------------------------------------------------------#
+
+class SampleRing(object):
+  """ Fixed-size circular buffer of timestamped samples
+
+  Timestamps and values are stored in two preallocated :py:mod:`array` columns
+  indexed by a monotonic sequence number. The minimum and maximum values of the
+  retained samples are tracked with monotonic deques and their sum is kept
+  up to date on each insertion and eviction, so that :py:meth:`push` and
+  :py:meth:`expire` are amortized O(1) and never reallocate the storage.
+
+  Values that don't fit in ``p_type`` switch the storage to ``d`` (double)
+  arrays, see :py:meth:`widen`.
+
+  Args:
+    p_size (int) : maximum amount of samples to keep
+    p_type (str) : :py:mod:`array` type code of stored values, see
+     :py:class:`multiprocessing.Value`
+
+  Raises:
+    TypeError: invalid ``p_type``
+  """
+  def __init__(self, p_size, p_type = 'i'):
+    self.m_size   = max(1, int(p_size))
+    self.m_times  = array.array('d', [0.0]) * self.m_size
+    self.m_values = array.array(p_type, [0]) * self.m_size
+    self.m_head   = 0
+    self.m_tail   = 0
+    self.m_sum    = 0
+    self.m_mins   = collections.deque()
+    self.m_maxs   = collections.deque()
+
+  def __len__(self):
+    return self.m_tail - self.m_head
+
+  def __getitem__(self, p_idx):
+    """ Get the ``(timestamp, value)`` pair of the ``p_idx``-th oldest sample """
+    l_len = len(self)
+    if p_idx < 0:
+      p_idx += l_len
+    if not 0 <= p_idx < l_len:
+      raise IndexError("sample index out of range")
+    l_slot = (self.m_head + p_idx) % self.m_size
+    return (self.m_times[l_slot], self.m_values[l_slot])
+
+  def _pop(self):
+    l_seq = self.m_head
+    self.m_sum -= self.m_values[l_seq % self.m_size]
+    if self.m_mins[0] == l_seq:
+      self.m_mins.popleft()
+    if self.m_maxs[0] == l_seq:
+      self.m_maxs.popleft()
+    self.m_head += 1
+
+  def widen(self):
+    """ Convert value storage to ``d`` (double) arrays """
+    self.m_values = array.array('d', self.m_values)
+
+  def push(self, p_time, p_val):
+    """ Add a sample, evicting the oldest one when the buffer is full
+
+    Args:
+      p_time (float) : sample timestamp
+      p_val (numeric) : sample value
+    """
+    if len(self) == self.m_size:
+      self._pop()
+    l_seq  = self.m_tail
+    l_slot = l_seq % self.m_size
+    try:
+      self.m_values[l_slot] = p_val
+    except OverflowError:
+      self.widen()
+      self.m_values[l_slot] = p_val
+    self.m_times[l_slot]  = p_time
+    self.m_tail += 1
+    self.m_sum  += p_val
+
+    l_values = self.m_values
+    l_size   = self.m_size
+    while self.m_mins and l_values[self.m_mins[-1] % l_size] >= p_val:
+      self.m_mins.pop()
+    self.m_mins.append(l_seq)
+    while self.m_maxs and l_values[self.m_maxs[-1] % l_size] <= p_val:
+      self.m_maxs.pop()
+    self.m_maxs.append(l_seq)
+
+  def expire(self, p_time):
+    """ Drop all samples older than ``p_time``
+
+    Args:
+      p_time (float) : oldest timestamp to keep
+    """
+    while self.m_head != self.m_tail and self.m_times[self.m_head % self.m_size] < p_time:
+      self._pop()
+
+  def min(self):
+    """ Smallest retained value, None when empty """
+    if not self.m_mins:
+      return None
+    return self.m_values[self.m_mins[0] % self.m_size]
+
+  def max(self):
+    """ Biggest retained value, None when empty """
+    if not self.m_maxs:
+      return None
+    return self.m_values[self.m_maxs[0] % self.m_size]
+
+  def sum(self):
+    """ Sum of retained values """
+    return self.m_sum
+
+#------------------------------------------------------------------#
+
+class SampleBuckets(object):
+  """ Constant-size sliding window of pre-aggregated samples
+
+  Alternative to :py:class:`SampleRing` with the same interface. Instead of
+  keeping each sample, time is split in buckets of ``p_bucketMs`` milliseconds
+  holding the count, sum, minimum and maximum of the values pushed during that
+  period. Pushing a value only touches the current bucket, buckets are reused
+  as time goes by. Memory doesn't depend on the amount of pushed values and
+  queries cost O(buckets).
+
+  Expiration has a bucket granularity : a bucket is kept as long as part of
+  its period is younger than the expiration time.
+
+  Values that don't fit in ``p_type`` switch the storage to ``d`` (double)
+  arrays, see :py:meth:`widen`.
+
+  Args:
+    p_timeMs (int) : window size in milliseconds
+    p_bucketMs (int) : bucket period in milliseconds
+    p_type (str) : :py:mod:`array` type code of values, see
+     :py:class:`multiprocessing.Value`
+
+  Raises:
+    TypeError: invalid ``p_type``
+  """
+  def __init__(self, p_timeMs, p_bucketMs = 1000, p_type = 'i'):
+    l_sumType = 'q'
+    if p_type in ['f', 'd']:
+      l_sumType = 'd'
+    self.m_bucketMs = max(1, int(p_bucketMs))
+    self.m_size     = int(math.ceil(float(p_timeMs) / self.m_bucketMs)) + 1
+    self.m_epochs   = array.array('q', [-1]) * self.m_size
+    self.m_counts   = array.array('L', [0]) * self.m_size
+    self.m_sums     = array.array(l_sumType, [0]) * self.m_size
+    self.m_mins     = array.array(p_type, [0]) * self.m_size
+    self.m_maxs     = array.array(p_type, [0]) * self.m_size
+    self.m_oldest   = 0
+
+  def _epoch(self, p_time):
+    return int(p_time * 1000) // self.m_bucketMs
+
+  def _slots(self):
+    return [ x for x, y in enumerate(self.m_epochs) if y >= self.m_oldest and self.m_counts[x] ]
+
+  def __len__(self):
+    return sum(self.m_counts[x] for x in self._slots())
+
+  def widen(self):
+    """ Convert sums, minimums and maximums storage to ``d`` (double) arrays """
+    self.m_sums = array.array('d', self.m_sums)
+    self.m_mins = array.array('d', self.m_mins)
+    self.m_maxs = array.array('d', self.m_maxs)
+
+  def push(self, p_time, p_val):
+    """ Add a sample to the bucket of ``p_time``
+
+    Args:
+      p_time (float) : sample timestamp
+      p_val (numeric) : sample value
+    """
+    try:
+      self._push(p_time, p_val)
+    except OverflowError:
+      self.widen()
+      self._push(p_time, p_val)
+
+  def _push(self, p_time, p_val):
+    l_epoch = self._epoch(p_time)
+    l_slot  = l_epoch % self.m_size
+    if self.m_epochs[l_slot] != l_epoch:
+      self.m_mins[l_slot]   = p_val
+      self.m_maxs[l_slot]   = p_val
+      self.m_sums[l_slot]   = 0
+      self.m_counts[l_slot] = 0
+      self.m_epochs[l_slot] = l_epoch
+    elif p_val < self.m_mins[l_slot]:
+      self.m_mins[l_slot] = p_val
+    elif p_val > self.m_maxs[l_slot]:
+      self.m_maxs[l_slot] = p_val
+    self.m_sums[l_slot]   += p_val
+    self.m_counts[l_slot] += 1
+
+  def expire(self, p_time):
+    """ Drop buckets entirely older than ``p_time``
+
+    Args:
+      p_time (float) : oldest timestamp to keep
+    """
+    self.m_oldest = self._epoch(p_time)
+
+  def min(self):
+    """ Smallest retained value, None when empty """
+    l_slots = self._slots()
+    if not l_slots:
+      return None
+    return min(self.m_mins[x] for x in l_slots)
+
+  def max(self):
+    """ Biggest retained value, None when empty """
+    l_slots = self._slots()
+    if not l_slots:
+      return None
+    return max(self.m_maxs[x] for x in l_slots)
+
+  def sum(self):
+    """ Sum of retained values """
+    return sum(self.m_sums[x] for x in self._slots())
+
+#------------------------------------------------------------------#
+
 class TimedSample(Composed):
   """ Holds the min, max and average value of collected items over a fixed period of time
 
   When no items are available for the last ``p_timeMs``, the 3 sub counters are
   undefined, thus, collected by visitors as ``NaN``.
 
+  Samples are kept in a preallocated :py:class:`SampleRing`, pushing a value
+  and expiring old ones doesn't copy the collection. When ``p_bucketMs`` is
+  given, samples are instead aggregated by periods of ``p_bucketMs``
+  milliseconds in a :py:class:`SampleBuckets`, memory usage doesn't depend
+  on the amount of pushed values and ``p_maxSamples`` is ignored.
+
+  When ``p_percentiles`` is given, values are also fed to a :py:class:`Quantile`
+  counter whose children (``p50``, ``p99``...) are visited next to the
+  ``min``, ``max`` and ``avg`` ones.
+
   Args:
     p_name (str) : counter name
     p_timeMs (int) : maximum amount of time (millisecond) to keep collected values
     p_maxSamples (int) : maximum amount of values to keep
     p_type (str) : internal type representation, see :py:class:`multiprocessing.Value`
+    p_percentiles (list) : percentiles to compute, None to disable
+    p_bucketMs (int) : aggregation period in milliseconds, None to keep each sample
   """
-  def __init__(self, p_name, p_timeMs = 10000, p_maxSamples = 20000, p_type = Int32.TYPE):
+  def __init__(self, p_name, p_timeMs = 10000, p_maxSamples = 20000, p_type = Int32.TYPE,
+               p_percentiles = None, p_bucketMs = None):
     super(TimedSample, self).__init__(p_name)
-    self.m_samples  = []
+    if p_bucketMs:
+      self.m_samples = SampleBuckets(p_timeMs, p_bucketMs, p_type)
+    else:
+      self.m_samples = SampleRing(p_maxSamples, p_type)
     self.m_timeMs   = p_timeMs
     self.m_maxSize  = p_maxSamples
     self.m_rttMin  = Value("min", None, p_type)
@@ -269,61 +1029,158 @@ class TimedSample(Composed):
     self.register(self.m_rttMin)
     self.register(self.m_rttMax)
     self.register(self.m_rttAvg)
+    self.m_quantile = None
+    if p_percentiles:
+      self.m_quantile = Quantile("", p_percentiles, p_timeMs, p_type)
+      self.register(self.m_quantile)
 
   def push(self, p_val):
     """ Add a value in collection
 
     p_val (int): value to add
+
+    Raises:
+      TypeError: ``p_val`` is not a number
     """
     with self.m_lock:
       try:
         l_val = int(p_val)
       except ValueError:
         raise TypeError
-
-      self.m_samples.append((time.time(), l_val))
-      if len(self.m_samples) > self.m_maxSize:
-        self.m_samples = self.m_samples[-self.m_maxSize:]
+      self.m_samples.push(time.time(), l_val)
+    if self.m_quantile is not None:
+      self.m_quantile.push(l_val)
 
   # pylint: disable=invalid-name
   def _update_safe(self):
-    l_max = time.time() - float(self.m_timeMs / 1000.0)
-    self.m_samples = [ x for x in self.m_samples if x[0] >= l_max ]
+    self.m_samples.expire(time.time() - float(self.m_timeMs / 1000.0))
     l_size = len(self.m_samples)
     if not l_size:
       self.m_rttMin.unset()
       self.m_rttMax.unset()
       self.m_rttAvg.unset()
     else:
-      l_max  = 0
-      l_sum  = 0
-      l_min  = sys.maxsize
-      for c_val in self.m_samples:
-        l_min = min(l_min, c_val[1])
-        l_max = max(l_max, c_val[1])
-        l_sum += c_val[1]
-      self.m_rttMin.val = int(l_min)
-      self.m_rttMax.val = int(l_max)
-      self.m_rttAvg.val = int(l_sum / l_size)
+      self.m_rttMin.val = int(self.m_samples.min())
+      self.m_rttMax.val = int(self.m_samples.max())
+      self.m_rttAvg.val = int(self.m_samples.sum() / l_size)
+    if self.m_quantile is not None:
+      self.m_quantile.update()
+
+#------------------------------------------------------------------#
+
+class PerfMeasure(object):
+  """ Measures the duration of a single event for a :py:class:`Perf` counter
+
+  Objects are returned by :py:meth:`Perf.measure`. The start time is held by
+  the object itself, independent measures can therefore be nested, interleaved,
+  or run by many asyncio tasks sharing the same thread.
+
+  Objects can be used :
+
+  - explicitly with :py:meth:`start` and :py:meth:`stop`
+  - as context manager, ``with l_perf.measure(): ...``
+  - as function decorator, ``@l_perf.measure()``. Each call of the decorated
+    function is measured. Coroutine functions are also supported, the time
+    spent until the coroutine returns is measured.
+  """
+  __slots__ = ("m_perf", "m_start")
+
+  def __init__(self, p_perf):
+    self.m_perf  = p_perf
+    self.m_start = None
+
+  def start(self):
+    """ Record event start time
+
+    Returns:
+      PerfMeasure: current object
+    """
+    self.m_start = clock_ns()
+    return self
+
+  def stop(self):
+    """ Push elapsed time since :py:meth:`start` to the counter
+
+    Raises:
+      CounterError: measure wasn't started
+    """
+    l_start = self.m_start
+    if l_start is None:
+      raise CounterError(__name__, self.m_perf.m_name, "measure stopped before being started")
+    self.m_start = None
+    self.m_perf.push((clock_ns() - l_start) // 1000)
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, p_type, p_value, p_traceback):
+    self.stop()
+
+  def __call__(self, p_func):
+    l_perf = self.m_perf
+    if getattr(inspect, "iscoroutinefunction", lambda x: False)(p_func):
+      from .aio import measure_coroutine
+      return measure_coroutine(l_perf, p_func)
+
+    @functools.wraps(p_func)
+    def wrapper(*p_args, **p_kwds):
+      with PerfMeasure(l_perf):
+        return p_func(*p_args, **p_kwds)
+    return wrapper
 
 #------------------------------------------------------------------#
 
 class Perf(TimedSample):
   """ Designed to monitor the min, max and average time of an event
 
-  At event start call :py:meth:`work_begin` to store the current time.
-  At event end, call :py:meth:`work_end` to calculate the time detla and add it
-  the base class samples that monitors the min max and average values
+  The preferred way to measure an event is :py:meth:`measure`, which
+  returns a per-event :py:class:`PerfMeasure` usable as context manager or
+  function decorator.
+
+  Alternatively, at event start call :py:meth:`work_begin` to store the
+  current time. At event end, call :py:meth:`work_end` to calculate the time
+  delta and add it the base class samples that monitors the min max and
+  average values
 
-  The time resolution is the microsecond (10^-6 second).
+  Times are taken from a monotonic clock, see :py:func:`clock_ns`. The time
+  resolution is the microsecond (10^-6 second).
 
   Note:
-    Events beginnings and ends can't be interleaved in the same thread.
+    With :py:meth:`work_begin` and :py:meth:`work_end`, events beginnings and
+    ends can't be interleaved in the same thread.
+
+  Args:
+    p_name (str) : counter name
+    p_timeMs (int) : maximum amount of time (millisecond) to keep collected values
+    p_maxSamples (int) : maximum amount of values to keep
+    p_percentiles (list) : latency percentiles to compute, see :py:class:`TimedSample`
+    p_bucketMs (int) : aggregation period, see :py:class:`TimedSample`
   """
-  def __init__(self, p_name, p_timeMs = 10000, p_maxSamples = 20000):
-    super(Perf, self).__init__(p_name, p_timeMs, p_maxSamples, p_type=UInt64.TYPE)
+  def __init__(self, p_name, p_timeMs = 10000, p_maxSamples = 20000, p_percentiles = None,
+               p_bucketMs = None):
+    super(Perf, self).__init__(p_name, p_timeMs, p_maxSamples, UInt64.TYPE, p_percentiles,
+                               p_bucketMs)
     self.m_startTimes = {}
 
+  def measure(self):
+    """ Create a measure object for a new event
+
+    Example:
+
+      ::
+
+        with l_perf.measure():
+          do_something()
+
+        @l_perf.measure()
+        def do_something():
+          pass
+
+    Returns:
+      PerfMeasure: measure object
+    """
+    return PerfMeasure(self)
+
   def work_begin(self):
     """ Record begin time of an event
 
@@ -334,7 +1191,7 @@ class Perf(TimedSample):
     l_value = self.m_startTimes.get(l_name, None)
     if l_value is not None:
       raise CounterError(__name__, self.m_name, "missing work_end for thread '%s'", l_name)
-    self.m_startTimes[l_name] = time.time()
+    self.m_startTimes[l_name] = clock_ns()
 
   def work_end(self):
     """ Record end time of an event and push it into base class
@@ -346,9 +1203,315 @@ class Perf(TimedSample):
     l_value = self.m_startTimes.get(l_name, None)
     if l_value is None:
       raise CounterError(__name__, self.m_name, "missing work_begin for thread '%s'", l_name)
-    self.push((time.time() - self.m_startTimes[l_name]) * 1000000)
+    self.push((clock_ns() - l_value) // 1000)
     del self.m_startTimes[l_name]
 
+#------------------------------------------------------------------#
+
+class Meter(Composed):
+  """ Measures the throughput of an event
+
+  Call :py:meth:`mark` each time the event occurs. Marks are counted in a
+  :py:class:`ShardedUInt64`, thus without taking any lock.
+
+  On each update, the counter computes the instantaneous rate since previous
+  update and exponentially-weighted moving average rates over 1, 5 and 15
+  minutes, in the fashion of unix load averages. Rates are expressed in events
+  per second. The instantaneous rate is computed over at least
+  :py:attr:`MIN_INTERVAL` seconds, more frequent updates keep previous rates.
+
+  Sub counters :
+
+  - ``count`` : total number of marked events
+  - ``rate`` : instantaneous rate
+  - ``m1``, ``m5``, ``m15`` : 1, 5 and 15 minutes moving average rates
+
+  Rates are undefined until the first computation.
+
+  Args:
+    p_name (str) : counter name
+  """
+
+  MIN_INTERVAL = 1.0
+  """ Minimum time, in seconds, between two rate computations """
+
+  WINDOWS = [ ("m1", 60.0), ("m5", 300.0), ("m15", 900.0) ]
+  """ Moving average sub counter names and their time window in seconds """
+
+  def __init__(self, p_name):
+    super(Meter, self).__init__(p_name)
+    self.m_count    = ShardedUInt64("count", 0)
+    self.m_rate     = Double("rate")
+    self.m_averages = [ (Double(x), y) for x, y in self.WINDOWS ]
+    self.m_lastTime = clock_ns()
+    self.m_lastCount = 0
+    self.register(self.m_count)
+    self.register(self.m_rate)
+    for c_value, _ in self.m_averages:
+      self.register(c_value)
+
+  def mark(self, p_count = 1):
+    """ Record ``p_count`` occurrences of the event
+
+    Raises:
+      TypeError: ``p_count`` is not an integer
+    """
+    self.m_count.incr(p_count)
+
+  def _update_safe(self):
+    l_now   = clock_ns()
+    l_delay = (l_now - self.m_lastTime) / 1000000000.0
+    if l_delay < self.MIN_INTERVAL:
+      return
+    l_count = self.m_count.val
+    l_rate  = (l_count - self.m_lastCount) / l_delay
+    self.m_lastTime  = l_now
+    self.m_lastCount = l_count
+    self.m_rate.val  = l_rate
+    for c_value, c_window in self.m_averages:
+      l_prev = c_value.val
+      if l_prev is None:
+        c_value.val = l_rate
+      else:
+        l_alpha = 1.0 - math.exp(-l_delay / c_window)
+        c_value.val = l_prev + l_alpha * (l_rate - l_prev)
+
+#------------------------------------------------------------------#
+
+class Histogram(Composed):
+  """ Counts collected items in fixed buckets
+
+  Bucket upper bounds are given at construction, see :py:meth:`linear` and
+  :py:meth:`exponential` helpers. Each observed value increments the first
+  bucket whose bound is greater or equal to the value, or an implicit
+  ``+inf`` bucket. Finding the bucket is a bisection over preallocated
+  bounds, values are not kept.
+
+  Sub counters, visited as cumulative values :
+
+  - ``le_<bound>`` : number of items lower or equal to ``bound``, dots of
+    bound are replaced by underscores (``le_0_5`` for ``0.5``)
+  - ``le_inf`` : total number of items
+  - ``sum`` : sum of items
+  - ``count`` : total number of items
+
+  Args:
+    p_name (str) : counter name
+    p_bounds (list) : bucket upper bounds
+
+  Raises:
+    CounterError: empty bound list
+  """
+  def __init__(self, p_name, p_bounds):
+    super(Histogram, self).__init__(p_name)
+    self.m_bounds = sorted(set(float(x) for x in p_bounds))
+    if not self.m_bounds:
+      raise CounterError(__name__, p_name, "histogram needs at least one bucket")
+    self.m_counts  = array.array('L', [0]) * (len(self.m_bounds) + 1)
+    self.m_sum     = 0
+    self.m_buckets = []
+    for c_bound in self.m_bounds:
+      self.m_buckets.append(UInt64(self.bound_name(c_bound), 0))
+    self.m_buckets.append(UInt64("le_inf", 0))
+    self.m_sumValue   = Double("sum", 0)
+    self.m_countValue = UInt64("count", 0)
+    for c_value in self.m_buckets + [ self.m_sumValue, self.m_countValue ]:
+      self.register(c_value)
+
+  @staticmethod
+  def bound_name(p_bound):
+    """ Get child counter name of given bucket bound """
+    return "le_" + ("%g" % p_bound).replace(".", "_").replace("-", "m")
+
+  @staticmethod
+  def linear(p_start, p_width, p_count):
+    """ Get ``p_count`` bounds starting at ``p_start``, spaced by ``p_width`` """
+    return [ p_start + x * p_width for x in range(0, p_count) ]
+
+  @staticmethod
+  def exponential(p_start, p_factor, p_count):
+    """ Get ``p_count`` bounds starting at ``p_start``, each one ``p_factor`` times bigger """
+    return [ p_start * (p_factor ** x) for x in range(0, p_count) ]
+
+  def observe(self, p_val):
+    """ Count a value
+
+    Raises:
+      TypeError: ``p_val`` is not a number
+    """
+    l_idx = bisect.bisect_left(self.m_bounds, p_val)
+    with self.m_lock:
+      self.m_counts[l_idx] += 1
+      self.m_sum += p_val
+      self.m_version += 1
+
+  def observe_many(self, p_values):
+    """ Count many values at once
+
+    When :py:mod:`numpy` is available, bucket lookup is vectorized. The
+    module is imported on first call, see :py:func:`get_numpy`.
+
+    Args:
+      p_values (iterable) : values to count
+
+    Raises:
+      TypeError: a value is not a number
+    """
+    l_numpy = get_numpy()
+    if l_numpy is not None:
+      if not isinstance(p_values, (list, tuple, l_numpy.ndarray)):
+        p_values = list(p_values)
+      try:
+        l_values = l_numpy.asarray(p_values, dtype=float)
+      except ValueError:
+        raise TypeError
+      l_counts = l_numpy.bincount(l_numpy.searchsorted(self.m_bounds, l_values, side="left"),
+                                  minlength=len(self.m_counts))
+      l_sum = float(l_values.sum())
+      with self.m_lock:
+        for c_idx, c_count in enumerate(l_counts.tolist()):
+          self.m_counts[c_idx] += c_count
+        self.m_sum += l_sum
+        self.m_version += 1
+      return
+
+    l_bounds = self.m_bounds
+    l_counts = [ 0 ] * len(self.m_counts)
+    l_sum    = 0
+    for c_val in p_values:
+      l_counts[bisect.bisect_left(l_bounds, c_val)] += 1
+      l_sum += c_val
+    with self.m_lock:
+      for c_idx, c_count in enumerate(l_counts):
+        self.m_counts[c_idx] += c_count
+      self.m_sum += l_sum
+      self.m_version += 1
+
+  def version(self):
+    """ See :py:meth:`BaseCounter.version` """
+    return self.m_version
+
+  def _update_safe(self):
+    l_total = 0
+    for c_value, c_count in zip(self.m_buckets, self.m_counts):
+      l_total += c_count
+      c_value.val = l_total
+    self.m_sumValue.val   = float(self.m_sum)
+    self.m_countValue.val = l_total
+
+
+class Family(Composed):
+  """ Set of counters distinguished by label values
+
+  Child counters are created on first use of each combination of label
+  values, see :py:meth:`labels`, and are visited as any :py:class:`Composed`
+  child. Child names are made of ``<label>=<value>`` pairs separated by
+  commas, in label declaration order : ``requests.path=/x,code=200``.
+  Characters ``%``, ``/``, ``,`` and ``=`` of label values are percent-encoded.
+
+  Once ``p_maxChildren`` children are created, new combinations share a
+  single ``overflow`` child, so an unbounded set of values (one per URL
+  path for instance) can't exhaust memory.
+
+  Example:
+
+    ::
+
+      l_requests = Family("requests", [ "path", "code" ])
+      StatManager().register_counter("app.http", l_requests)
+      l_requests.labels(path="/x", code=200).incr()
+
+  Args:
+    p_name (str) : counter name
+    p_labels (list) : label names
+    p_factory (function) : functor creating a child counter from its name,
+     defaults to a zero :py:class:`UInt64`
+    p_maxChildren (int) : maximum number of children, overflow excluded
+
+  Raises:
+    CounterError: empty label list
+  """
+
+  OVERFLOW = "overflow"
+  """ Name of child shared by combinations beyond maximum cardinality """
+
+  def __init__(self, p_name, p_labels, p_factory = None, p_maxChildren = 100):
+    super(Family, self).__init__(p_name)
+    if not p_labels:
+      raise CounterError(__name__, p_name, "family needs at least one label")
+    if p_factory is None:
+      p_factory = self._default
+    self.m_labels      = list(p_labels)
+    self.m_factory     = p_factory
+    self.m_maxChildren = p_maxChildren
+    self.m_children    = {}
+    self.m_overflow    = None
+    self.m_createLock  = threading.Lock()
+
+  @staticmethod
+  def _default(p_name):
+    return UInt64(p_name, 0)
+
+  @staticmethod
+  def _escape(p_value):
+    l_value = str(p_value)
+    for c_char, c_code in [ ("%", "%25"), ("/", "%2F"), (",", "%2C"), ("=", "%3D") ]:
+      l_value = l_value.replace(c_char, c_code)
+    return l_value
+
+  def _key(self, p_args, p_kwds):
+    if p_kwds:
+      if p_args or len(p_kwds) != len(self.m_labels):
+        raise CounterError(__name__, self.m_name, "invalid labels %s, expected %s" %
+                           (sorted(p_kwds), self.m_labels))
+      try:
+        return tuple(self._escape(p_kwds[x]) for x in self.m_labels)
+      except KeyError:
+        raise CounterError(__name__, self.m_name, "invalid labels %s, expected %s" %
+                           (sorted(p_kwds), self.m_labels))
+    if len(p_args) != len(self.m_labels):
+      raise CounterError(__name__, self.m_name, "expected %d label values" % len(self.m_labels))
+    return tuple(self._escape(x) for x in p_args)
+
+  def labels(self, *p_args, **p_kwds):
+    """ Get child counter of given label values
+
+    Values are given either by name or by position, in label declaration
+    order. Children are identified by the string form of values, ``200`` and
+    ``"200"`` give the same child. Lookup of an existing child takes no lock.
+
+    Returns:
+      BaseCounter: child counter, or overflow child when maximum cardinality is reached
+
+    Raises:
+      CounterError: given labels don't match family labels
+    """
+    l_key   = self._key(p_args, p_kwds)
+    l_child = self.m_children.get(l_key, None)
+    if l_child is not None:
+      return l_child
+    if len(self.m_children) >= self.m_maxChildren and self.m_overflow is not None:
+      return self.m_overflow
+    with self.m_createLock:
+      l_child = self.m_children.get(l_key, None)
+      if l_child is not None:
+        return l_child
+      if len(self.m_children) >= self.m_maxChildren:
+        if self.m_overflow is None:
+          l_overflow = self.m_factory(self.OVERFLOW)
+          self.register(l_overflow)
+          self.m_overflow = l_overflow
+        return self.m_overflow
+      l_name  = ",".join("%s=%s" % (x, y) for x, y in zip(self.m_labels, l_key))
+      l_child = self.m_factory(l_name)
+      self.register(l_child)
+      self.m_children[l_key] = l_child
+      return l_child
+
+  def __len__(self):
+    """ Number of children, overflow excluded """
+    return len(self.m_children)
+
 
 class CounterError(XtdError):
   """ Generic counter error class
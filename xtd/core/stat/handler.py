@@ -7,10 +7,14 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 import json
 import abc
+import collections
 import os
+import socket
+import zlib
 import requests
 
 from ..tools.thread import SafeThread
+from .              import counter
 from ..error        import XtdError
 from ..             import logger
 
@@ -23,8 +27,10 @@ class BaseHandler(SafeThread):
   ``p_interval`` seconds.
 
   User can provide a custom function to get the counters to output.
-  By default the object gets all counters registered in the
-  :py:class:`~xtd.core.stat.manager.StatManager` singleton.
+  By default the object gets the
+  :py:meth:`~xtd.core.stat.manager.StatManager.snapshot` of the
+  :py:class:`~xtd.core.stat.manager.StatManager` singleton, shared with
+  other handlers ticking at the same time.
 
   User should inherit this class and define :py:meth:`write` method.
 
@@ -45,18 +51,54 @@ class BaseHandler(SafeThread):
     if p_fetcher is None:
       self.m_fetcher = self._fetch
 
+  def counters(self):
+    """ Get handler's own counters
+
+    Returned counters are registered by
+    :py:meth:`~xtd.core.stat.manager.StatManager.register_handler` in a
+    namespace named after the handler. Default implementation returns an
+    empty list.
+
+    Returns:
+      list: list of :py:class:`~xtd.core.stat.counter.BaseCounter`
+    """
+    return []
+
   @staticmethod
   def _fetch():
     from .manager import StatManager
-    return StatManager().get_all()
+    return StatManager().snapshot()
+
+  @staticmethod
+  def _values(p_counters):
+    """ Get counter values by namespace
+
+    Args:
+      p_counters (dict|StatSnapshot): see :py:meth:`write`
+
+    Returns:
+      list: ``[ ("<namespace>", { "<name>" : <value>, ... }), ... ]``
+    """
+    from .manager import StatSnapshot
+    if isinstance(p_counters, StatSnapshot):
+      return p_counters.items()
+    l_res = {}
+    for c_ns, c_counters in p_counters.items():
+      l_values = l_res[c_ns] = {}
+      for c_counter in c_counters:
+        c_counter.update()
+        c_counter.visit(l_values.__setitem__)
+    return l_res.items()
 
   @abc.abstractmethod
   def write(self, p_counters):
     """ Ouput available counter data (abstract)
 
     Args:
-      p_counters (dict): dictionary holding all available counters assiciated with
-       their namespace. ``{ "<namespace>" : [ <counter1>, <counter2>, ... ] }``
+      p_counters (dict|StatSnapshot): a
+       :py:class:`~xtd.core.stat.manager.StatSnapshot` or a dictionary holding
+       counters associated with their namespace.
+       ``{ "<namespace>" : [ <counter1>, <counter2>, ... ] }``
     """
     raise NotImplementedError
 
@@ -82,37 +124,97 @@ class DiskHandler(BaseHandler):
 
   This will create a file ``/var/snmp/a/b/c/counter.name`` containing the string ``55``
 
+  Files are only rewritten when their value changed since last output. Each
+  file is written to a temporary file of the same directory, then renamed
+  to its final name, so readers never see a partially written value.
+
+  When ``p_format`` is given, the object writes a single file per namespace,
+  holding all its counter values, instead of one file per counter :
+
+   - ``json`` : ``/var/snmp/a.b.c.json`` contains ``{"counter.name": 55}``
+   - ``kv`` : ``/var/snmp/a.b.c.kv`` contains ``counter.name=55``, one line per counter
+
+  Note:
+    Output directories are created once and cached. A file removed by an
+    external process will only be written again when its value changes.
 
   Args:
     p_directory (str): target output directory path.  If given directory doesn't exist,
      the object will attempt to create it (and all necessary parent directories).
     p_interval (int): interval between two outputs (in seconds)
+    p_fetcher (function) : functor that retrieves data counters
+    p_format (str): None for one file per counter, ``json`` or ``kv`` for one
+     file per namespace
 
   Raises:
     XtdError: ``p_directory`` isn't writable or could ne be created
+    XtdError: invalid ``p_format``
   """
-  def __init__(self, p_directory, p_interval = 50, p_fetcher = None):
+
+  FORMATS = [ "json", "kv" ]
+  """ Available single-file formats """
+
+  def __init__(self, p_directory, p_interval = 50, p_fetcher = None, p_format = None):
     super(DiskHandler, self).__init__(__name__ + "." + self.__class__.__name__, p_interval, p_fetcher)
-    self.m_dir = p_directory
+    if p_format is not None and not p_format in self.FORMATS:
+      raise XtdError(self.m_name, "invalid output format '%s', must be one of %s" % (p_format, self.FORMATS))
+    self.m_dir    = p_directory
+    self.m_format = p_format
+    self.m_dirs   = set()
+    self.m_last   = {}
     self._create_dir(self.m_dir)
 
   def _create_dir(self, p_dir):
+    if p_dir in self.m_dirs:
+      return
     if not os.path.isdir(p_dir):
       try:
         os.makedirs(p_dir, mode=0o0750)
       except Exception as l_error:
         l_fmt = "unable to create output directory '%s' : %s"
         raise XtdError(self.m_name,  l_fmt % (p_dir, str(l_error)))
+    self.m_dirs.add(p_dir)
+
+  def _write_file(self, p_dir, p_name, p_content):
+    l_path = os.path.join(p_dir, p_name)
+    l_tmp  = os.path.join(os.path.dirname(l_path), "." + os.path.basename(l_path) + ".tmp")
+    try:
+      with open(l_tmp, mode="w") as l_file:
+        l_file.write(p_content)
+      os.rename(l_tmp, l_path)
+    except (IOError, OSError) as l_error:
+      logger.error(self.m_name, "unable to output counter file '%s' : %s", l_path, str(l_error))
+      self.m_dirs.discard(p_dir)
+      return False
+    return True
 
   def _write_item(self, p_ns, p_name, p_value):
+    l_key     = (p_ns, p_name)
+    l_content = str(p_value)
+    if self.m_last.get(l_key) == l_content:
+      return
     l_path = os.path.join(self.m_dir, p_ns.replace(".", "/"))
     self._create_dir(l_path)
-    l_path = os.path.join(l_path, p_name)
-    try:
-      with open(l_path, mode="w") as l_file:
-        l_file.write(str(p_value))
-    except IOError as l_error:
-      logger.error(self.m_name, "unable to output counter file '%s' : %s", l_path, str(l_error))
+    if self._write_file(l_path, p_name, l_content):
+      self.m_last[l_key] = l_content
+    else:
+      self.m_last.pop(l_key, None)
+
+  def _render(self, p_values):
+    if self.m_format == "json":
+      return json.dumps(p_values, sort_keys=True)
+    l_lines = [ "%s=%s\n" % (x, p_values[x]) for x in sorted(p_values) ]
+    return "".join(l_lines)
+
+  def _write_ns(self, p_ns, p_values):
+    l_content = self._render(p_values)
+    if self.m_last.get(p_ns) == l_content:
+      return
+    self._create_dir(self.m_dir)
+    if self._write_file(self.m_dir, p_ns + "." + self.m_format, l_content):
+      self.m_last[p_ns] = l_content
+    else:
+      self.m_last.pop(p_ns, None)
 
   def write(self, p_counters):
     """ Write all available counters to filesystem
@@ -122,15 +224,14 @@ class DiskHandler(BaseHandler):
     thread.
 
     Args:
-      p_counters (dict) : see :py:meth:`BaseHandler.write`
+      p_counters (dict|StatSnapshot) : see :py:meth:`BaseHandler.write`
     """
-    for c_path, c_counters in p_counters.items():
-      for c_counter in c_counters:
-        c_counter.update()
-        def visitor(p_name, p_value):
-          #pylint: disable=cell-var-from-loop
-          self._write_item(c_path, p_name, p_value)
-        c_counter.visit(visitor)
+    for c_path, c_values in self._values(p_counters):
+      if self.m_format is not None:
+        self._write_ns(c_path, c_values)
+        continue
+      for c_name, c_value in c_values.items():
+        self._write_item(c_path, c_name, c_value)
 
 #------------------------------------------------------------------#
 
@@ -144,6 +245,7 @@ class HttpHandler(BaseHandler):
 
   - Method : ``POST``
   - Content-Type : ``application/json``
+  - Content-Encoding : ``gzip``, only when ``p_gzip`` is True
   - Body :
 
     ::
@@ -161,6 +263,20 @@ class HttpHandler(BaseHandler):
         }
       }
 
+  Requests go through a persistent keep-alive session. When a request fails
+  (connection error, timeout or non-2xx status), its tick is dropped, unless
+  ``p_queueSize`` is strictly positive. Ticks are then queued, and each tick
+  sends all queued ticks in a single request whose body is a json array of
+  the above objects, oldest first. Ticks stay queued until their request
+  succeeds. When the queue holds ``p_queueSize`` ticks, the oldest one is
+  dropped.
+
+  Each tick sends a single request, and thus takes up to ``p_timeout``
+  seconds. The handler always runs in its own thread, even when
+  :py:meth:`~xtd.core.tools.thread.SafeThreadGroup.use_scheduler` is
+  enabled, so that a slow server doesn't delay other handlers, see
+  :py:attr:`~xtd.core.tools.thread.SafeThread.ms_blocking`.
+
   Note:
     Keep in mind that counter values can be undefined.
 
@@ -170,42 +286,239 @@ class HttpHandler(BaseHandler):
     p_url : target url for post request
     p_interval(int): interval, in second, between two outputs
     p_fetcher (function) : functor that retrieves data counters
+    p_timeout (float|tuple) : request timeout in seconds, or
+     ``(connect, read)`` timeouts, see :py:mod:`requests`
+    p_gzip (bool) : compress request bodies
+    p_queueSize (int) : maximum number of ticks kept for retry and sent in a
+      single request, 0 to disable retries and send one object per request
+
+  **Counters**
+
+  See :py:meth:`counters`, registered by
+  :py:meth:`~xtd.core.stat.manager.StatManager.register_handler` in
+  namespace ``xtd.core.stat.handler.HttpHandler`` :
+
+  - ``sent`` : number of ticks successfully sent
+  - ``dropped`` : number of ticks dropped, because of a failed request when
+    retries are disabled, or because of a full queue
+  - ``errors`` : number of failed requests
+  - ``latency`` : request time statistics, see :py:class:`~xtd.core.stat.counter.Perf`
   """
-  def __init__(self, p_url, p_interval = 50, p_fetcher = None):
+
+  ms_blocking = True
+
+  # pylint: disable=too-many-arguments
+  def __init__(self, p_url, p_interval = 50, p_fetcher = None, p_timeout = 10, p_gzip = False,
+               p_queueSize = 0):
     super(HttpHandler, self).__init__(__name__ + "." + self.__class__.__name__, p_interval, p_fetcher)
-    self.m_url = p_url
+    self.m_url       = p_url
+    self.m_timeout   = p_timeout
+    self.m_gzip      = p_gzip
+    self.m_queue     = collections.deque(maxlen=max(0, p_queueSize))
+    self.m_session   = requests.Session()
+    self.m_sent      = counter.UInt64("sent", 0)
+    self.m_dropped   = counter.UInt64("dropped", 0)
+    self.m_errors    = counter.UInt64("errors", 0)
+    self.m_latency   = counter.Perf("latency")
+
+  def counters(self):
+    """ Get handler's own counters """
+    return [ self.m_sent, self.m_dropped, self.m_errors, self.m_latency ]
+
+  def _encode(self, p_json):
+    l_body = json.dumps(p_json).encode("utf-8")
+    if self.m_gzip:
+      l_zip  = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+      l_body = l_zip.compress(l_body) + l_zip.flush()
+    return l_body
 
   def _send_request(self, p_json):
+    l_headers = { "Content-Type" : "application/json" }
+    if self.m_gzip:
+      l_headers["Content-Encoding"] = "gzip"
     try:
-      l_headers = { "Content-Type" : "application/json" }
-      l_req     = requests.post(self.m_url, headers=l_headers, data=json.dumps(p_json))
-      if l_req.status_code != 200:
+      with self.m_latency.measure():
+        l_req = self.m_session.post(self.m_url, headers=l_headers, data=self._encode(p_json),
+                                    timeout=self.m_timeout)
+      if not 200 <= l_req.status_code < 300:
         l_message = "received invalid http response '%d' on posting json"
         logger.error(self.m_name, l_message, l_req.status_code)
+        return False
     except requests.exceptions.RequestException as l_error:
       logger.error(self.m_name, "error while sending counters data : '%s'", str(l_error))
+      return False
+    return True
 
   def write(self, p_counters):
-    """ Write all available counters to filesystem
+    """ Send all available counters, along with queued ticks
 
     When object fails to send HTTP request, an error log is triggered. Raising an
     exception woudn't be helpfull since this part of the code runs in a dedicated
     thread.
 
     Args:
-      p_counters (dict) : see :py:meth:`BaseHandler.write`
+      p_counters (dict|StatSnapshot) : see :py:meth:`BaseHandler.write`
     """
-    l_res = {}
+    l_tick = { x : y for x, y in self._values(p_counters) }
+    if not self.m_queue.maxlen:
+      if self._send_request(l_tick):
+        self.m_sent.incr()
+      else:
+        self.m_errors.incr()
+        self.m_dropped.incr()
+      return
+    if len(self.m_queue) == self.m_queue.maxlen:
+      self.m_dropped.incr()
+    self.m_queue.append(l_tick)
+    l_ticks = list(self.m_queue)
+    if not self._send_request(l_ticks):
+      self.m_errors.incr()
+      return
+    self.m_queue.clear()
+    self.m_sent.incr(len(l_ticks))
+
+#------------------------------------------------------------------#
+
+class StatsdHandler(BaseHandler):
+  """ Send counter values to a StatsD server
+
+  Each counter value is converted to a StatsD line
+  ``<prefix>.<namespace>.<name>:<value>|<type>``, optionally followed by
+  DogStatsD tags ``|#<tag1>,<tag2>``. Lines are packed in UDP datagrams of at
+  most ``p_mtu`` bytes, sent from a non-blocking socket opened at
+  construction.
+
+  Metric types :
+
+  - children of :py:class:`~xtd.core.stat.counter.Perf` counters are sent as
+    timers (``ms``), values are converted from microseconds to milliseconds
+  - any other value, including children of
+    :py:class:`~xtd.core.stat.counter.TimedSample`, is sent as a gauge (``g``)
+
+  Undefined values (``NaN``) are not sent. Characters reserved by the StatsD
+  protocol (``:``, ``|``, ``@``, ``#`` and spaces) are replaced by ``_`` in
+  metric names.
+
+  Args:
+    p_host (str) : StatsD server host
+    p_port (int) : StatsD server port
+    p_interval (int) : interval, in second, between two outputs
+    p_fetcher (function) : functor that retrieves data counters
+    p_prefix (str) : metric name prefix
+    p_tags (list) : DogStatsD tags added to each line, ``[ "<key>:<value>", ... ]``
+
+  Raises:
+    XtdError: unable to resolve ``p_host``
+
+  **Counters**
+
+  See :py:meth:`BaseHandler.counters` :
+
+  - ``sent`` : number of sent datagrams
+  - ``dropped`` : number of datagrams that could not be sent
+  """
+
+  MTU = 1432
+  """ Maximum datagram size, in bytes """
+
+  TIMER = "ms"
+  GAUGE = "g"
+
+  # pylint: disable=too-many-arguments
+  def __init__(self, p_host = "localhost", p_port = 8125, p_interval = 10, p_fetcher = None,
+               p_prefix = "", p_tags = None):
+    super(StatsdHandler, self).__init__(__name__ + "." + self.__class__.__name__, p_interval, p_fetcher)
+    try:
+      l_info = socket.getaddrinfo(p_host, p_port, 0, socket.SOCK_DGRAM)[0]
+    except socket.error as l_error:
+      raise XtdError(self.m_name, "unable to resolve statsd host '%s' : %s" % (p_host, str(l_error)))
+    self.m_address = l_info[4]
+    self.m_socket  = socket.socket(l_info[0], socket.SOCK_DGRAM)
+    self.m_socket.setblocking(False)
+    self.m_prefix  = self._sanitize(p_prefix + ".") if p_prefix else ""
+    l_tags         = [ x for x in (p_tags or []) if x ]
+    self.m_suffix  = "|#" + ",".join(l_tags) if l_tags else ""
+    self.m_sent    = counter.UInt64("sent", 0)
+    self.m_dropped = counter.UInt64("dropped", 0)
+
+  def counters(self):
+    """ Get handler's own counters """
+    return [ self.m_sent, self.m_dropped ]
+
+  @staticmethod
+  def _sanitize(p_name):
+    for c_char in ":|@# ":
+      p_name = p_name.replace(c_char, "_")
+    return p_name
+
+  def _timers(self, p_counters):
+    """ Get names of values sent as timers, by namespace
+
+    Counter types are taken from the written counters themselves, so that
+    they match the written values.
+    """
+    from .manager import StatSnapshot
+    l_timers = {}
+    if isinstance(p_counters, StatSnapshot):
+      for c_ns, c_groups in p_counters.counters():
+        l_names = l_timers[c_ns] = set()
+        for c_counter, c_items in c_groups:
+          if isinstance(c_counter, counter.Perf):
+            l_names.update(x for x, y in c_items)
+      return l_timers
     for c_ns, c_counters in p_counters.items():
-      l_res[c_ns] = {}
+      l_names = l_timers[c_ns] = set()
       for c_counter in c_counters:
-        c_counter.update()
-        def visitor(p_name, p_value):
-          #pylint: disable=cell-var-from-loop
-          l_res[c_ns][p_name] = p_value
-        c_counter.visit(visitor)
-    self._send_request(l_res)
+        if isinstance(c_counter, counter.Perf):
+          c_counter.visit(lambda x, y, p_names=l_names: p_names.add(x))
+    return l_timers
+
+  def _lines(self, p_counters):
+    l_timers = self._timers(p_counters)
+    for c_ns, c_values in self._values(p_counters):
+      l_names = l_timers.get(c_ns, ())
+      l_ns    = self.m_prefix + self._sanitize(c_ns) + "."
+      for c_name, c_value in c_values.items():
+        if c_value == "NaN":
+          continue
+        l_kind = self.GAUGE
+        if c_name in l_names:
+          l_kind  = self.TIMER
+          c_value = c_value / 1000.0
+        yield "%s%s:%s|%s%s" % (l_ns, self._sanitize(c_name), c_value, l_kind, self.m_suffix)
+
+  def _packets(self, p_lines):
+    l_packet = b""
+    for c_line in p_lines:
+      l_line = c_line.encode("utf-8")
+      if l_packet and len(l_packet) + 1 + len(l_line) > self.MTU:
+        yield l_packet
+        l_packet = b""
+      l_packet = l_packet + b"\n" + l_line if l_packet else l_line
+    if l_packet:
+      yield l_packet
+
+  def write(self, p_counters):
+    """ Send all available counters to StatsD server
+
+    Datagrams that can't be sent without blocking are dropped and trigger an
+    error log.
 
+    Args:
+      p_counters (dict|StatSnapshot) : see :py:meth:`BaseHandler.write`
+    """
+    l_errors = 0
+    l_last   = None
+    for c_packet in self._packets(self._lines(p_counters)):
+      try:
+        self.m_socket.sendto(c_packet, self.m_address)
+        self.m_sent.incr()
+      except socket.error as l_error:
+        self.m_dropped.incr()
+        l_errors += 1
+        l_last = str(l_error)
+    if l_errors:
+      logger.error(self.m_name, "unable to send %d statsd datagrams : %s", l_errors, l_last)
 
 #------------------------------------------------------------------#
 
@@ -224,18 +537,12 @@ class LoggingHandler(BaseHandler):
   def write(self, p_counters):
     """ Output all available counters to logging facility
     Args:
-      p_counters (dict) : see :py:meth:`BaseHandler.write`
+      p_counters (dict|StatSnapshot) : see :py:meth:`BaseHandler.write`
     """
-    l_res = {}
-    for c_ns, c_counters in p_counters.items():
-      l_res[c_ns] = {}
-      for c_counter in c_counters:
-        c_counter.update()
-        # pylint: disable=cell-var-from-loop
-        def visitor(p_name, p_value):
-          logger.info(self.m_loggerName, "ns='%s', name='%s', value='%s'",
-                      c_ns, p_name, p_value)
-        c_counter.visit(visitor)
+    for c_ns, c_values in self._values(p_counters):
+      for c_name, c_value in c_values.items():
+        logger.info(self.m_loggerName, "ns='%s', name='%s', value='%s'",
+                    c_ns, c_name, c_value)
 
 #------------------------------------------------------------------#
 
@@ -0,0 +1,244 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+"""
+
+.. inheritance-diagram:: xtd.core.stat.history
+   :parts: 1
+
+"""
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import array
+import math
+import numbers
+import threading
+import time
+
+from ..error   import XtdError
+from .handler  import BaseHandler
+
+#------------------------------------------------------------------#
+
+class HistoryTier(object):
+  """ Fixed-size ring of time slots holding averaged values
+
+  Slot epochs are shared by all series : a slot is reset for every series
+  when it is reused for a new period. Each series is a pair of columns
+  (sum and count of recorded values) preallocated to ``p_size`` slots.
+
+  Args:
+    p_step (int) : slot duration, in seconds
+    p_size (int) : number of slots
+  """
+
+  MAX_COUNT = 65535
+  """ Maximum number of values aggregated in a slot """
+
+  def __init__(self, p_step, p_size):
+    self.m_step   = p_step
+    self.m_size   = p_size
+    self.m_epochs = array.array('q', [-1]) * p_size
+    self.m_sums   = []
+    self.m_counts = []
+
+  def step(self):
+    """ Get slot duration, in seconds """
+    return self.m_step
+
+  def span(self):
+    """ Get duration covered by the tier, in seconds """
+    return self.m_step * self.m_size
+
+  def add_series(self):
+    """ Allocate columns of a new series
+
+    Returns:
+      int: series index
+    """
+    self.m_sums.append(array.array('d', [0.0]) * self.m_size)
+    self.m_counts.append(array.array('H', [0]) * self.m_size)
+    return len(self.m_sums) - 1
+
+  def slot(self, p_time):
+    """ Get slot index of given time, resetting it when it holds an older period """
+    l_epoch = int(p_time // self.m_step)
+    l_slot  = l_epoch % self.m_size
+    if self.m_epochs[l_slot] != l_epoch:
+      self.m_epochs[l_slot] = l_epoch
+      for c_sums, c_counts in zip(self.m_sums, self.m_counts):
+        c_sums[l_slot]   = 0.0
+        c_counts[l_slot] = 0
+    return l_slot
+
+  def add(self, p_slot, p_series, p_value):
+    """ Record a value in given slot of given series """
+    l_counts = self.m_counts[p_series]
+    if l_counts[p_slot] < self.MAX_COUNT:
+      self.m_sums[p_series][p_slot] += p_value
+      l_counts[p_slot] += 1
+
+  def points(self, p_series, p_from, p_to):
+    """ Get recorded slots of given series between two times
+
+    Returns:
+      list: ``[ (<slot-start-time>, <sum>, <count>), ... ]``, sorted by time
+    """
+    l_res   = []
+    l_last  = int(p_to // self.m_step)
+    l_first = max(int(p_from // self.m_step), l_last - self.m_size + 1)
+    l_sums   = self.m_sums[p_series]
+    l_counts = self.m_counts[p_series]
+    for c_epoch in range(l_first, l_last + 1):
+      l_slot = c_epoch % self.m_size
+      if self.m_epochs[l_slot] == c_epoch and l_counts[l_slot]:
+        l_res.append((c_epoch * self.m_step, l_sums[l_slot], l_counts[l_slot]))
+    return l_res
+
+#------------------------------------------------------------------#
+
+class CounterHistory(BaseHandler):
+  """ Keep recent values of all counters in memory
+
+  Each numeric value visited in the
+  :py:class:`~xtd.core.stat.manager.StatManager` snapshot is a *series*,
+  identified by its namespace and name (``rtt.avg`` for instance). Series
+  are recorded in each :py:class:`HistoryTier`, from the finest to the
+  coarsest resolution. Memory usage is fixed by the tiers and the number of
+  series. Recording costs one slot update per series and per tier.
+
+  The object is a handler : it records a snapshot every ``step`` seconds of
+  the finest tier, see
+  :py:meth:`~xtd.core.stat.manager.StatManager.enable_history`.
+
+  Args:
+    p_tiers (list) : ``[ (<step-seconds>, <slot-count>), ... ]``, defaults
+     to :py:attr:`TIERS`
+    p_fetcher (function) : functor that retrieves data counters
+
+  Raises:
+    XtdError: empty or invalid tier list
+  """
+
+  TIERS = [ (10, 360), (60, 1440) ]
+  """ Default tiers : 10 seconds for 1 hour, 1 minute for 24 hours """
+
+  def __init__(self, p_tiers = None, p_fetcher = None):
+    if p_tiers is None:
+      p_tiers = self.TIERS
+    l_tiers = sorted(p_tiers)
+    if not l_tiers or [ x for x in l_tiers if x[0] <= 0 or x[1] <= 0 ]:
+      raise XtdError(__name__, "invalid counter history tiers '%s'" % str(p_tiers))
+    super(CounterHistory, self).__init__(__name__ + "." + self.__class__.__name__,
+                                         l_tiers[0][0], p_fetcher)
+    self.m_tiers  = [ HistoryTier(x, y) for x, y in l_tiers ]
+    self.m_series = {}
+    self.m_lock   = threading.Lock()
+
+  def tiers(self):
+    """ Get history tiers, from finest to coarsest """
+    return list(self.m_tiers)
+
+  def record(self, p_time, p_counters):
+    """ Record counter values at given time
+
+    Non numeric values (``NaN`` for undefined counters) are ignored.
+
+    Args:
+      p_time (float) : timestamp
+      p_counters (dict|StatSnapshot) : see :py:meth:`BaseHandler.write`
+    """
+    with self.m_lock:
+      l_slots = [ (x, x.slot(p_time)) for x in self.m_tiers ]
+      for c_ns, c_values in self._values(p_counters):
+        for c_name, c_value in c_values.items():
+          if isinstance(c_value, bool) or not isinstance(c_value, numbers.Real):
+            continue
+          if math.isnan(c_value):
+            continue
+          l_key    = (c_ns, c_name)
+          l_series = self.m_series.get(l_key)
+          if l_series is None:
+            l_series = self.m_series[l_key] = [ x.add_series() for x in self.m_tiers ][0]
+          for c_tier, c_slot in l_slots:
+            c_tier.add(c_slot, l_series, c_value)
+
+  def write(self, p_counters):
+    """ Record counter values at current time, see :py:meth:`record` """
+    self.record(time.time(), p_counters)
+
+  def _tier(self, p_from, p_to, p_step):
+    for c_tier in self.m_tiers:
+      if p_step is not None and c_tier.step() > p_step:
+        break
+      if p_to - p_from <= c_tier.span():
+        return c_tier
+    for c_tier in self.m_tiers:
+      if p_to - p_from <= c_tier.span():
+        return c_tier
+    return self.m_tiers[-1]
+
+  @staticmethod
+  def _downsample(p_points, p_step):
+    l_res = []
+    for c_time, c_sum, c_count in p_points:
+      l_time = int(c_time // p_step) * p_step
+      if l_res and l_res[-1][0] == l_time:
+        l_res[-1][1] += c_sum
+        l_res[-1][2] += c_count
+      else:
+        l_res.append([ l_time, c_sum, c_count ])
+    return l_res
+
+  def query(self, p_ns, p_name, p_from = None, p_step = None, p_to = None):
+    """ Get recorded values of a counter
+
+    Data is read from the finest tier covering the requested period. When
+    ``p_step`` is coarser than the tier resolution, slots are merged.
+
+    Args:
+      p_ns (str) : counter namespace
+      p_name (str) : counter name, matches the series of this name and the
+       series of its children (``rtt`` matches ``rtt.min``, ``rtt.max``...)
+      p_from (float) : period start timestamp, negative values are relative
+       to current time, defaults to the span of the finest tier
+      p_step (int) : resolution, in seconds, defaults to the tier step
+      p_to (float) : period end timestamp, defaults to current time
+
+    Returns:
+      dict: ``{ "<name>" : [ [ <timestamp>, <average-value> ], ... ], ... }``
+
+    Raises:
+      XtdError: no series matches ``p_ns`` and ``p_name``
+    """
+    l_now = time.time()
+    if p_to is None:
+      p_to = l_now
+    if p_from is None:
+      p_from = p_to - self.m_tiers[0].span()
+    elif p_from < 0:
+      p_from = l_now + p_from
+    if p_step is not None and p_step <= 0:
+      p_step = None
+
+    with self.m_lock:
+      l_keys = [ x for x in self.m_series
+                 if x[0] == p_ns and (x[1] == p_name or x[1].startswith(p_name + ".")) ]
+      if not l_keys:
+        raise XtdError(__name__, "undefined counter history '%s' in namespace '%s'" % (p_name, p_ns))
+      l_tier = self._tier(p_from, p_to, p_step)
+      l_res  = {}
+      for c_key in sorted(l_keys):
+        l_points = l_tier.points(self.m_series[c_key], p_from, p_to)
+        if p_step is not None and p_step > l_tier.step():
+          l_points = self._downsample(l_points, p_step)
+        l_res[c_key[1]] = [ [ x[0], x[1] / x[2] ] for x in l_points ]
+      return l_res
+
+#------------------------------------------------------------------#
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -6,6 +6,10 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 #------------------------------------------------------------------#
 
+import fnmatch
+import re
+import threading
+import time
 from future.utils import with_metaclass
 from ..error      import XtdError
 from ..           import mixin
@@ -13,18 +17,76 @@ from ..tools      import thread
 from ..           import error
 from .counter     import BaseCounter
 from .handler     import BaseHandler
+from .history     import CounterHistory
     
 #------------------------------------------------------------------#
 
+class StatSnapshot(object):
+  """ Immutable view of all counter values at a given time
+
+  Built by :py:meth:`StatManager.snapshot`, shared by all handlers.
+
+  Args:
+    p_time (float) : snapshot creation timestamp
+    p_data (dict) : counter values by namespace,
+     ``{ "<namespace>" : { "<counter-name>" : <value>, ... }, ... }``
+    p_counters (dict) : values of each counter object by namespace,
+     ``{ "<namespace>" : [ (<counter>, [ (<name>, <value>), ... ]), ... ], ... }``
+  """
+  def __init__(self, p_time, p_data, p_counters = None):
+    self.m_time     = p_time
+    self.m_data     = p_data
+    self.m_counters = p_counters
+    if p_counters is None:
+      self.m_counters = {}
+
+  def time(self):
+    """ Get snapshot creation timestamp """
+    return self.m_time
+
+  def items(self):
+    """ Iterate over namespaces and their ``{ name : value }`` dictionary
+
+    Note:
+      yielded dictionaries are shared and must not be modified
+    """
+    return self.m_data.items()
+
+  def counters(self):
+    """ Iterate over namespaces and their ``[ (<counter>, <values>), ... ]`` list
+
+    Gives the values visited for each counter object, for consumers that
+    need counter types.
+
+    Note:
+      yielded lists are shared and must not be modified
+    """
+    return self.m_counters.items()
+
+  def json(self):
+    """ Get a copy of snapshot data, see :py:meth:`StatManager.get_json` """
+    return { x : dict(y) for x, y in self.m_data.items() }
+
+#------------------------------------------------------------------#
+
 class StatManager(with_metaclass(mixin.Singleton, thread.SafeThreadGroup)):
+
+  SNAPSHOT_MAX_AGE = 1.0
+  """ Default age, in seconds, under which a snapshot is shared by consumers """
+
   def __init__(self):
     super(StatManager, self).__init__(__name__)
     self.m_counters  = {}
+    self.m_index     = {}
+    self.m_regLock   = threading.RLock()
+    self.m_patterns  = {}
+    self.m_snapLock  = threading.Lock()
+    self.m_snapshot  = None
+    self.m_cache     = {}
+    self.m_history   = None
 
   def exists(self, p_ns, p_name):
-    l_list     = self.m_counters.get(p_ns, [])
-    l_counters = [ x for x in l_list if x.m_name == p_name ]
-    return len(l_counters) != 0
+    return (p_ns, p_name) in self.m_index
 
   def register_counter(self, p_ns, p_counter):
     """ Register a counter in global statistics
@@ -40,18 +102,48 @@ class StatManager(with_metaclass(mixin.Singleton, thread.SafeThreadGroup)):
     if not issubclass(p_counter.__class__, BaseCounter):
       raise XtdError(__name__, "attempt to add invalid object type")
 
-    if self.exists(p_ns, p_counter.m_name):
-      raise XtdError(__name__, "already defined counter '%s' in namespace '%s'",
-                     p_counter.m_name, p_ns)
+    with self.m_regLock:
+      if self.exists(p_ns, p_counter.m_name):
+        raise XtdError(__name__, "already defined counter '%s' in namespace '%s'",
+                       p_counter.m_name, p_ns)
 
-    if not p_ns in self.m_counters:
-      self.m_counters[p_ns] = []
+      if not p_ns in self.m_counters:
+        self.m_counters[p_ns] = []
+
+      self.m_counters[p_ns].append(p_counter)
+      self.m_index[(p_ns, p_counter.m_name)] = p_counter
+
+  def get_or_create(self, p_ns, p_name, p_factory):
+    """ Get a counter, registering a new one if not defined yet
 
-    self.m_counters[p_ns].append(p_counter)
+    Lookup and registration are atomic : concurrent callers get the same counter.
+
+    Args:
+      p_ns (str) : namespace
+      p_name (str) : counter name
+      p_factory (function) : functor returning the counter to register, takes
+       the counter name as parameter
+
+    Returns:
+      BaseCounter: registered counter
+    """
+    l_counter = self.m_index.get((p_ns, p_name), None)
+    if l_counter is not None:
+      return l_counter
+    with self.m_regLock:
+      l_counter = self.m_index.get((p_ns, p_name), None)
+      if l_counter is None:
+        l_counter = p_factory(p_name)
+        self.register_counter(p_ns, l_counter)
+      return l_counter
 
   def register_handler(self, p_handler):
     """ Register an counter output handler
 
+    Handler's own counters, see
+    :py:meth:`~xtd.core.stat.handler.BaseHandler.counters`, are registered
+    in a namespace named after the handler.
+
     Args:
       p_handler (BaseHandler) : new handler to add
 
@@ -61,6 +153,34 @@ class StatManager(with_metaclass(mixin.Singleton, thread.SafeThreadGroup)):
     if not issubclass(p_handler.__class__, BaseHandler):
       raise error.XtdError(__name__, "handlers must be BaseHandler based class")
     self.add_thread(p_handler)
+    for c_counter in p_handler.counters():
+      self.register_counter(p_handler.m_name, c_counter)
+
+  def enable_history(self, p_tiers = None):
+    """ Keep recent counter values in memory
+
+    Registers a :py:class:`~xtd.core.stat.history.CounterHistory` handler,
+    must be called before :py:meth:`start`. Does nothing when history is
+    already enabled.
+
+    Args:
+      p_tiers (list) : see :py:class:`~xtd.core.stat.history.CounterHistory`
+
+    Returns:
+      CounterHistory: history handler
+    """
+    if self.m_history is None:
+      self.m_history = CounterHistory(p_tiers)
+      self.register_handler(self.m_history)
+    return self.m_history
+
+  def history(self):
+    """ Get counter history
+
+    Returns:
+      CounterHistory: history handler, None when not enabled, see :py:meth:`enable_history`
+    """
+    return self.m_history
 
   def get(self, p_ns, p_name):
     """ Get a counter in a particular namespace
@@ -72,17 +192,107 @@ class StatManager(with_metaclass(mixin.Singleton, thread.SafeThreadGroup)):
       XtdError: undefined namespace ``p_ns``
       XtdError: undefined counter ``p_name`` for given namespace
     """
+    l_counter = self.m_index.get((p_ns, p_name), None)
+    if l_counter is not None:
+      return l_counter
     if not p_ns in self.m_counters:
       raise error.XtdError(__name__, "undefined namespace '%s'" % p_ns)
-    for c_counter in self.m_counters[p_ns]:
-      if c_counter.m_name == p_name:
-        return c_counter
     raise error.XtdError(__name__, "undefined counter '%s' in namespace '%s'" % (p_name, p_ns))
 
+  @staticmethod
+  def _is_glob(p_pattern):
+    return "*" in p_pattern or "?" in p_pattern or "[" in p_pattern
+
+  def _pattern(self, p_pattern):
+    l_regex = self.m_patterns.get(p_pattern, None)
+    if l_regex is None:
+      l_regex = self.m_patterns[p_pattern] = re.compile(fnmatch.translate(p_pattern)).match
+    return l_regex
+
+  def get_many(self, p_ns = "*", p_name = "*"):
+    """ Get counters matching namespace and name patterns
+
+    Patterns follow :py:mod:`fnmatch` syntax, matched case-sensitively.
+    Since ``*`` also matches dots, ``app.*`` selects all namespaces below
+    ``app`` and ``rtt*`` selects all names starting with ``rtt``. Patterns
+    without wildcards are resolved by direct lookup.
+
+    Example:
+
+      ::
+
+        for c_ns, c_counter in StatManager().get_many("app.*", "rtt*"):
+          ...
+
+    Args:
+      p_ns (str) : namespace pattern
+      p_name (str) : counter name pattern
+
+    Returns:
+      list: ``[ ("<namespace>", <counter>), ... ]``, sorted by namespace, in
+      registration order within a namespace
+    """
+    if not self._is_glob(p_ns) and not self._is_glob(p_name):
+      l_counter = self.m_index.get((p_ns, p_name), None)
+      return [ (p_ns, l_counter) ] if l_counter is not None else []
+
+    if self._is_glob(p_ns):
+      l_match = self._pattern(p_ns)
+      l_namespaces = sorted(x for x in list(self.m_counters) if l_match(x))
+    else:
+      l_namespaces = [ p_ns ] if p_ns in self.m_counters else []
+
+    l_match = self._pattern(p_name)
+    l_res   = []
+    for c_ns in l_namespaces:
+      l_res += [ (c_ns, x) for x in list(self.m_counters[c_ns]) if l_match(x.m_name) ]
+    return l_res
+
   def write(self):
     """ Output counter is all registered handlers """
+    l_snapshot = self.snapshot(0)
     for c_handler in self.m_threads:
-      c_handler.write()
+      c_handler.write(l_snapshot)
+
+  def snapshot(self, p_maxAge = None):
+    """ Get values of all counters
+
+    Counters are updated and visited at most once per call, and only when
+    their :py:meth:`~xtd.core.stat.counter.BaseCounter.version` changed since
+    previous snapshot. Concurrent callers wait for the snapshot being built
+    instead of computing their own.
+
+    Args:
+      p_maxAge (float): return previous snapshot if it was built less than
+       ``p_maxAge`` seconds ago. Defaults to :py:attr:`SNAPSHOT_MAX_AGE`
+
+    Returns:
+      StatSnapshot: counter values
+    """
+    if p_maxAge is None:
+      p_maxAge = self.SNAPSHOT_MAX_AGE
+    with self.m_snapLock:
+      l_now = time.time()
+      if self.m_snapshot is not None and (l_now - self.m_snapshot.time()) < p_maxAge:
+        return self.m_snapshot
+      l_data   = {}
+      l_groups = {}
+      for c_ns, c_counters in list(self.m_counters.items()):
+        l_values = l_data[c_ns] = {}
+        l_group  = l_groups[c_ns] = []
+        for c_counter in list(c_counters):
+          l_version = c_counter.version()
+          l_cached  = self.m_cache.get(c_counter, None)
+          if l_version is None or l_cached is None or l_cached[0] != l_version:
+            l_items = []
+            c_counter.update()
+            c_counter.visit(lambda x, y, p_items=l_items: p_items.append((x, y)))
+            l_cached = (l_version, l_items)
+            self.m_cache[c_counter] = l_cached
+          l_values.update(l_cached[1])
+          l_group.append((c_counter, l_cached[1]))
+      self.m_snapshot = StatSnapshot(l_now, l_data, l_groups)
+      return self.m_snapshot
 
   def get_all(self):
     """ Get registered counters
@@ -126,16 +336,7 @@ class StatManager(with_metaclass(mixin.Singleton, thread.SafeThreadGroup)):
       dict: counter's name and value organized by namespace
 
     """
-    l_res = {}
-    for c_ns, c_counters in self.m_counters.items():
-      l_res[c_ns] = {}
-      for c_counter in c_counters:
-        c_counter.update()
-        def functor(p_name, p_value):
-          # pylint: disable=cell-var-from-loop
-          l_res[c_ns][p_name] = p_value
-        c_counter.visit(functor)
-    return l_res
+    return self.snapshot(0).json()
 
 #------------------------------------------------------------------#
 
@@ -5,26 +5,42 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 #------------------------------------------------------------------#
 
+import heapq
+import itertools
 import threading
 import time
 
 from ..      import logger
 from ..      import error
+
+#-----------------------------------------------------------------------------#
+
+if hasattr(time, "monotonic"):
+  monotonic = time.monotonic
+else:
+  monotonic = time.time
+
 #-----------------------------------------------------------------------------#
 
 class SafeThread(threading.Thread):
+  ms_blocking = False
+  """ When True, :py:meth:`work` may block for long and the thread is never
+  run by a :py:class:`Scheduler`, see :py:meth:`SafeThreadGroup.use_scheduler` """
+
   def __init__(self, p_name, p_interval):
     super(SafeThread, self).__init__(name=p_name)
     self.m_name         = p_name
     self.m_terminated   = False
     self.m_loopInterval = p_interval
     self.m_interrupted  = False
+    self.m_event        = threading.Event()
 
   def work(self):
     raise NotImplementedError
 
   def run(self):
     self.m_terminated = False
+    self.m_event.clear()
     logger.info(self.m_name, "starting thread...")
     while not self.m_terminated:
       logger.debug(self.m_name, "starting loop...")
@@ -32,22 +48,20 @@ class SafeThread(threading.Thread):
       logger.debug(self.m_name, "loop ended")
       if not self.m_terminated:
         logger.debug(self.m_name, "sleeping...")
-        l_count = self.m_loopInterval
-        while l_count and not self.m_terminated:
-          time.sleep(1)
-          l_count -= 1
+        self.m_event.wait(self.m_loopInterval)
     logger.info(self.m_name, "thread ended")
 
   def stop(self):
     logger.info(self.m_name, "stopping thread...")
     self.m_terminated = True
+    self.m_event.set()
 
   def safe_join(self):
     logger.info(self.m_name, "joining thread...")
     while True:
       try:
         self.join(1)
-        if not self.isAlive():
+        if not self.is_alive():
           break
       except KeyboardInterrupt:
         logger.warning(self.m_name, "recieved keyboard interrupt, preaparing for exit")
@@ -56,23 +70,162 @@ class SafeThread(threading.Thread):
 
 #-----------------------------------------------------------------------------#
 
+class Scheduler(SafeThread):
+  """ Runs many periodic jobs from a single thread
+
+  Each job is given a deadline on a monotonic clock. The thread sleeps until
+  the earliest deadline, or until woken up by :py:meth:`add_job`,
+  :py:meth:`remove_job` or :py:meth:`stop`, and runs due jobs in deadline
+  order. Next deadlines are computed from previous ones, not from the end of
+  job executions, so that job periods don't drift. When a job overruns its
+  period, missed executions are skipped.
+
+  An exception raised by a job is logged and doesn't stop the scheduler.
+
+  Args:
+    p_name (str) : thread name
+    p_clock (function) : monotonic clock returning seconds, defaults to
+      :py:func:`time.monotonic`
+  """
+  def __init__(self, p_name, p_clock = None):
+    super(Scheduler, self).__init__(p_name, 0)
+    self.m_lock  = threading.Lock()
+    self.m_jobs  = []
+    self.m_ids   = itertools.count()
+    self.m_clock = p_clock
+    if p_clock is None:
+      self.m_clock = monotonic
+
+  def add_job(self, p_func, p_interval, p_name = None, p_delay = 0):
+    """ Register a periodic job
+
+    Args:
+      p_func (function) : functor to call, takes no parameter
+      p_interval (float) : period, in seconds
+      p_name (str) : job name for logs, defaults to functor name
+      p_delay (float) : delay, in seconds, before first execution
+
+    Returns:
+      int: job identifier, see :py:meth:`remove_job`
+
+    Raises:
+      XtdError: ``p_interval`` is not strictly positive
+    """
+    if not p_interval > 0:
+      raise error.XtdError(self.m_name, "job interval must be strictly positive")
+    if p_name is None:
+      p_name = getattr(p_func, "__name__", str(p_func))
+    l_id = next(self.m_ids)
+    with self.m_lock:
+      heapq.heappush(self.m_jobs, [ self.m_clock() + p_delay, l_id, p_interval, p_func, p_name ])
+    self.m_event.set()
+    return l_id
+
+  def remove_job(self, p_id):
+    """ Unregister a job
+
+    Args:
+      p_id (int) : job identifier returned by :py:meth:`add_job`
+    """
+    with self.m_lock:
+      self.m_jobs = [ x for x in self.m_jobs if x[1] != p_id ]
+      heapq.heapify(self.m_jobs)
+    self.m_event.set()
+
+  def _next(self):
+    with self.m_lock:
+      if not self.m_jobs:
+        return None, None
+      l_job   = self.m_jobs[0]
+      l_delay = l_job[0] - self.m_clock()
+      if l_delay > 0:
+        return None, l_delay
+      return heapq.heappop(self.m_jobs), 0
+
+  def _reschedule(self, p_job):
+    l_now = self.m_clock()
+    l_missed = int((l_now - p_job[0]) // p_job[2]) + 1
+    p_job[0] += max(1, l_missed) * p_job[2]
+    with self.m_lock:
+      heapq.heappush(self.m_jobs, p_job)
+
+  def run_pending(self):
+    """ Run due jobs in deadline order
+
+    Returns:
+      float: delay, in seconds, until next deadline, None when no job is registered
+    """
+    while not self.m_terminated:
+      l_job, l_delay = self._next()
+      if l_job is None:
+        return l_delay
+      try:
+        l_job[3]()
+      except Exception as l_error: # pylint: disable=broad-except
+        logger.exception(self.m_name, "error while running job '%s' : %s", l_job[4], str(l_error))
+      self._reschedule(l_job)
+    return None
+
+  def work(self):
+    """ Run due jobs, then sleep until next deadline """
+    while not self.m_terminated:
+      l_delay = self.run_pending()
+      if self.m_terminated:
+        break
+      self.m_event.wait(l_delay)
+      self.m_event.clear()
+
+#-----------------------------------------------------------------------------#
+
 class SafeThreadGroup(object):
   STATUS_STARTED = 1
   STATUS_STOPPED = 2
   STATUS_JOINED  = 3
 
   def __init__(self, p_name):
-    self.m_name    = p_name
-    self.m_threads = []
+    self.m_name      = p_name
+    self.m_threads   = []
+    self.m_scheduled = False
+    self.m_scheduler = None
 
   def add_thread(self, p_obj):
     if not issubclass(p_obj.__class__, SafeThread):
       raise error.XtdError(self.m_name, "child thread must be SafeThread objects")
     self.m_threads.append(p_obj)
 
+  def use_scheduler(self, p_enable = True):
+    """ Run all threads works from a single :py:class:`Scheduler` thread
+
+    Must be called before :py:meth:`start`. Instead of starting one thread per
+    child, each child's ``work`` method is registered as a scheduler job with
+    the child's loop interval. Children with :py:attr:`SafeThread.ms_blocking`
+    still run in their own thread.
+
+    Args:
+      p_enable (bool) : enable or disable scheduler
+    """
+    self.m_scheduled = p_enable
+
+  def _blocking(self):
+    return [ x for x in self.m_threads if x.ms_blocking ]
+
+  def _targets(self):
+    if self.m_scheduler is not None:
+      return [ self.m_scheduler ] + self._blocking()
+    return self.m_threads
 
   def start(self):
     if len(self.m_threads):
+      if self.m_scheduled:
+        logger.debug(self.m_name, "scheduling all %d threads", len(self.m_threads))
+        self.m_scheduler = Scheduler(self.m_name + ".scheduler")
+        for c_thread in self.m_threads:
+          if not c_thread.ms_blocking:
+            self.m_scheduler.add_job(c_thread.work, c_thread.m_loopInterval, c_thread.m_name)
+        self.m_scheduler.start()
+        for c_thread in self._blocking():
+          c_thread.start()
+        return
       logger.debug(self.m_name, "starting all %d threads", len(self.m_threads))
       for c_thread in self.m_threads:
         c_thread.start()
@@ -80,7 +233,7 @@ class SafeThreadGroup(object):
   def stop(self):
     if len(self.m_threads):
       logger.debug(self.m_name, "stopping all %d threads", len(self.m_threads))
-      for c_thread in self.m_threads:
+      for c_thread in self._targets():
         c_thread.stop()
 
   def join(self):
@@ -89,9 +242,9 @@ class SafeThreadGroup(object):
       while True:
         try:
           l_alive = False
-          for c_thread in self.m_threads:
+          for c_thread in self._targets():
             c_thread.join(1)
-            l_alive = l_alive or c_thread.isAlive()
+            l_alive = l_alive or c_thread.is_alive()
           if not l_alive:
             break
         except KeyboardInterrupt:
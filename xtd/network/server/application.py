@@ -14,7 +14,7 @@ from xtd.core.config          import checkers
 from xtd.core.application     import Application
 
 from .log                   import LogPage
-from .counter               import CounterPage
+from .counter               import CounterPage, MetricsPage
 from .config                import ConfigPage
 from .param                 import ParamPage
 from .manager               import ServerManager
@@ -69,6 +69,21 @@ class ServerApplication(Application):
       "default"     : None,
       "valued"      : True,
       "description" : "TLS key file"
+    },{
+      "name"        : "log-sample",
+      "default"     : 1,
+      "description" : "log only one request and response out of VAL",
+      "checks"      : config.checkers.is_int(p_min=1)
+    },{
+      "name"        : "log-body-max",
+      "default"     : 0,
+      "description" : "truncate logged request and response bodies to VAL characters, 0 for no limit",
+      "checks"      : config.checkers.is_int(p_min=0)
+    },{
+      "name"        : "log-compact",
+      "default"     : False,
+      "description" : "log requests and responses as single JSON lines",
+      "checks"      : checkers.is_bool()
     }])
 
   def _initialize_server(self):
@@ -80,7 +95,10 @@ class ServerApplication(Application):
     if l_password:
       l_credentials = { "admin" : l_password }
 
-    ServerManager.initialize(__name__)
+    ServerManager.initialize(__name__,
+                             config.get("http", "log-sample"),
+                             config.get("http", "log-body-max") or None,
+                             config.get("http", "log-compact"))
 
     l_tls    = config.get("http", "tls")
     l_cacert = config.get("http", "tlscacert")
@@ -90,6 +108,7 @@ class ServerApplication(Application):
     ServerManager.mount(self,          "/",              {}, __name__)
     ServerManager.mount(ConfigPage(),  "/admin/config",  {}, __name__)
     ServerManager.mount(CounterPage(), "/admin/counter", {}, __name__)
+    ServerManager.mount(MetricsPage(), "/admin/metrics", {}, __name__)
 
     l_paramPage = ParamPage(l_credentials)
     ServerManager.mount(l_paramPage,   "/admin/params",   {
@@ -5,9 +5,16 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 #------------------------------------------------------------------#
 
+import collections
+import math
+import re
+import threading
 import cherrypy
 
+from xtd.core              import logger
 from xtd.core.stat.manager import StatManager
+from xtd.core.error        import XtdError
+from xtd.core.stat.counter import Histogram
 
 #------------------------------------------------------------------#
 
@@ -16,7 +23,189 @@ class CounterPage(object):
   @cherrypy.tools.json_out()
   #pylint: disable=unused-argument,no-self-use
   def default(self, *p_args, **p_kwds):
-    l_counters = StatManager().get_json()
+    l_counters = dict(StatManager().snapshot().items())
     for c_sub in p_args:
       l_counters = l_counters.get(c_sub, {})
     return l_counters
+
+  @cherrypy.expose
+  @cherrypy.tools.json_out()
+  #pylint: disable=no-self-use
+  def history(self, p_ns, p_name, **p_kwds):
+    """ Get recent values of a counter
+
+    Path : ``/admin/counter/history/<ns>/<name>?from=<timestamp>&step=<seconds>``,
+    see :py:meth:`~xtd.core.stat.history.CounterHistory.query` for parameter details.
+    """
+    l_history = StatManager().history()
+    if l_history is None:
+      raise cherrypy.HTTPError(404, "counter history is not enabled")
+    try:
+      l_from = p_kwds.get("from", None)
+      l_step = p_kwds.get("step", None)
+      l_from = float(l_from) if l_from else None
+      l_step = float(l_step) if l_step else None
+    except ValueError:
+      raise cherrypy.HTTPError(400, "invalid from or step parameter")
+    try:
+      return l_history.query(p_ns, p_name, l_from, l_step)
+    except XtdError as l_error:
+      raise cherrypy.HTTPError(404, str(l_error))
+
+#------------------------------------------------------------------#
+
+class MetricsPage(object):
+  """ Prometheus text exposition of registered counters
+
+  Each counter of namespace ``a.b`` named ``c`` becomes a ``gauge`` metric
+  ``a_b_c``. Characters not allowed in metric names are replaced by ``_``.
+
+  Children of composed counters, such as ``min``, ``max`` and ``avg`` of
+  :py:class:`~xtd.core.stat.counter.Perf`, become series of the same metric
+  labelled with ``stat`` :
+
+  ::
+
+    # TYPE a_b_rtt gauge
+    a_b_rtt{stat="min"} 120
+    a_b_rtt{stat="max"} 3400
+
+  :py:class:`~xtd.core.stat.counter.Histogram` counters become ``histogram``
+  metrics with their ``_bucket``, ``_sum`` and ``_count`` series.
+
+  Flattening namespaces and names may give the same metric name to
+  different counters, for instance ``a`` / ``b.c`` and ``a.b`` / ``c``.
+  Their series are grouped under a single ``# TYPE`` line. A counter whose
+  metric has another type, or that gives a series already given by another
+  counter, is skipped and logged once as a warning.
+
+  Values are read from the shared
+  :py:meth:`~xtd.core.stat.manager.StatManager.snapshot`, so that all
+  endpoints and handlers report the same values. The whole text is
+  rendered at once, since grouping needs all counters, and is kept as long
+  as the snapshot is reused : concurrent scrapes share the same rendering.
+
+  Args:
+    p_ttl (float) : maximum snapshot age, in seconds, see
+     :py:meth:`~xtd.core.stat.manager.StatManager.snapshot`
+  """
+
+  CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+  TTL          = 1.0
+  INVALID      = re.compile("[^a-zA-Z0-9_:]")
+
+  def __init__(self, p_ttl = None):
+    if p_ttl is None:
+      p_ttl = self.TTL
+    self.m_ttl        = p_ttl
+    self.m_lock       = threading.Lock()
+    self.m_snapshot   = None
+    self.m_body       = b""
+    self.m_duplicates = set()
+
+  @cherrypy.expose
+  def index(self):
+    cherrypy.response.headers["Content-Type"] = self.CONTENT_TYPE
+    return self.render()
+
+  def render(self):
+    """ Get rendered text of current snapshot
+
+    Returns:
+      bytes: utf-8 encoded text
+    """
+    l_snapshot = StatManager().snapshot(self.m_ttl)
+    with self.m_lock:
+      if l_snapshot is not self.m_snapshot:
+        self.m_body     = "".join(self._render(l_snapshot)).encode("utf-8")
+        self.m_snapshot = l_snapshot
+      return self.m_body
+
+  @classmethod
+  def metric_name(cls, p_ns, p_name):
+    """ Get prometheus metric name of given counter """
+    l_name = cls.INVALID.sub("_", "%s_%s" % (p_ns, p_name))
+    if l_name[0].isdigit():
+      l_name = "_" + l_name
+    return l_name
+
+  @staticmethod
+  def _value(p_value):
+    if isinstance(p_value, float):
+      if math.isnan(p_value):
+        return "NaN"
+      if math.isinf(p_value):
+        return "+Inf" if p_value > 0 else "-Inf"
+      return repr(p_value)
+    return str(p_value)
+
+  @staticmethod
+  def _label(p_value):
+    return p_value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+  def _histogram_series(self, p_metric, p_counter, p_values):
+    l_series = []
+    l_prefix = p_counter.m_name + "."
+    for c_bound in p_counter.m_bounds:
+      l_value = p_values[l_prefix + p_counter.bound_name(c_bound)]
+      l_series.append(("%s_bucket{le=\"%s\"}" % (p_metric, self._value(c_bound)), l_value))
+    l_series.append(("%s_bucket{le=\"+Inf\"}" % p_metric, p_values[l_prefix + "le_inf"]))
+    l_series.append(("%s_sum" % p_metric, p_values[l_prefix + "sum"]))
+    l_series.append(("%s_count" % p_metric, p_values[l_prefix + "count"]))
+    return l_series
+
+  def _counter_series(self, p_metric, p_counter, p_values):
+    l_series = []
+    l_prefix = p_counter.m_name + "."
+    for c_name, c_value in p_values:
+      if c_name == p_counter.m_name:
+        l_series.append((p_metric, c_value))
+      else:
+        l_stat = c_name[len(l_prefix):] if c_name.startswith(l_prefix) else c_name
+        l_series.append(("%s{stat=\"%s\"}" % (p_metric, self._label(l_stat)), c_value))
+    return l_series
+
+  def _duplicate(self, p_ns, p_counter, p_metric, p_type):
+    l_key = (p_ns, p_counter.m_name)
+    if l_key not in self.m_duplicates:
+      self.m_duplicates.add(l_key)
+      logger.warning(__name__, "skipping counter '%s' of namespace '%s' : metric '%s' (%s) "
+                     "collides with another counter", p_counter.m_name, p_ns, p_metric, p_type)
+
+  def _metrics(self, p_snapshot):
+    """ Get series of each metric, in order of first appearance
+
+    Counters whose metric name has another type, or which would output a
+    series already given by another counter, are skipped.
+
+    Returns:
+      list: ``[ (<metric>, <type>, [ (<series>, <value>), ... ]), ... ]``
+    """
+    l_metrics = collections.OrderedDict()
+    for c_ns, c_counters in sorted(p_snapshot.counters(), key=lambda x: x[0]):
+      for c_counter, c_values in c_counters:
+        l_metric = self.metric_name(c_ns, c_counter.m_name)
+        if isinstance(c_counter, Histogram):
+          l_type   = "histogram"
+          l_series = self._histogram_series(l_metric, c_counter, dict(c_values))
+        else:
+          l_type   = "gauge"
+          l_series = self._counter_series(l_metric, c_counter, c_values)
+        l_entry = l_metrics.setdefault(l_metric, (l_type, collections.OrderedDict()))
+        if l_entry[0] != l_type or [ x for x, y in l_series if x in l_entry[1] ]:
+          self._duplicate(c_ns, c_counter, l_metric, l_type)
+          continue
+        l_entry[1].update(l_series)
+    return [ (x, y[0], list(y[1].items())) for x, y in l_metrics.items() ]
+
+  def _render(self, p_snapshot):
+    for c_metric, c_type, c_series in self._metrics(p_snapshot):
+      yield "# TYPE %s %s\n" % (c_metric, c_type)
+      for c_name, c_value in c_series:
+        yield "%s %s\n" % (c_name, self._value(c_value))
+
+#------------------------------------------------------------------#
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -25,6 +25,7 @@ from .                         import tools
 
 class ServerManager(object):
   ms_initialized = False
+  ms_logOptions  = {}
 
   class LoggerFilter(logging.Filter):
     def __init__(self, p_name="", p_wrap=False):
@@ -75,10 +76,24 @@ class ServerManager(object):
     return l_server
 
   @classmethod
-  def initialize(cls, p_logger):
+  def initialize(cls, p_logger, p_logSample=1, p_logMaxBody=None, p_logCompact=False):
+    """ Register server tools and configure cherrypy engine
+
+    Args:
+      p_logger (str) : root logger name of server logs
+      p_logSample (int) : log one request/response out of ``p_logSample``
+      p_logMaxBody (int) : maximum length of logged body values, None for no limit
+      p_logCompact (bool) : log requests/responses as single JSON lines
+    """
     if cls.ms_initialized:
       return None
 
+    cls.ms_logOptions = {
+      "sample"  : p_logSample,
+      "maxbody" : p_logMaxBody,
+      "compact" : p_logCompact
+    }
+
     cherrypy.tools.counter_start = \
       cherrypy._cptools.Tool("on_start_resource", tools.perf_begin())
     cherrypy.tools.counter_stop = \
@@ -113,8 +128,13 @@ class ServerManager(object):
     if not cls.ms_initialized:
       raise XtdError(__name__, "you must initialize server manager first")
 
+    l_logOptions = {}
+    for c_tool in [ "log_request", "log_response" ]:
+      for c_key, c_val in cls.ms_logOptions.items():
+        l_logOptions["tools.%s.%s" % (c_tool, c_key)] = c_val
+
     l_res = mergedicts({
-      '/' : {
+      '/' : dict(l_logOptions, **{
         "tools.log_request.on"           : True,
         "tools.log_request.module"       : p_logger + ".error",
         "tools.log_request.level"        : "debug",
@@ -124,11 +144,22 @@ class ServerManager(object):
         "tools.counter_start.on"         : True,
         "tools.counter_start.ns"         : p_logger,
         "tools.counter_start.name"       : "rtt",
+        "tools.counter_start.percentiles": [ 50, 90, 99, 99.9 ],
+        "tools.counter_start.meter"      : "qps",
         "tools.counter_stop.on"          : True,
         "tools.counter_stop.ns"          : p_logger,
         "tools.counter_stop.name"        : "rtt",
-      }
+        "tools.counter_stop.percentiles" : [ 50, 90, 99, 99.9 ],
+      })
     }, p_conf)
+    l_res  = dict(l_res)
+    l_root = l_res['/']
+    if l_root.get("tools.counter_start.on") and not "tools.counter_start.perf" in l_root:
+      l_root["tools.counter_start.perf"] = tools.PerfHandle(
+        l_root["tools.counter_start.ns"],
+        l_root["tools.counter_start.name"],
+        l_root.get("tools.counter_start.percentiles"),
+        l_root.get("tools.counter_start.meter"))
     l_app = cherrypy.tree.mount(p_handler, p_path, dict(l_res))
     l_filterAccess = cls.LoggerFilter(p_logger + ".access")
     l_filterError  = cls.LoggerFilter(p_logger + ".error")
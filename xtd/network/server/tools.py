@@ -6,24 +6,39 @@ __version__   = "0.3"
 
 #------------------------------------------------------------------#
 
+import itertools
 import json
+import logging
 import cherrypy
 
-from xtd.core import logger, error, stat
+from xtd.core import logger, stat
 
 #------------------------------------------------------------------#
 
-def log_request_response(p_withResponse):
+def log_request_response(p_withResponse, p_maxBody = None):
+  """ Get request and response data as a dict
+
+  Args:
+    p_withResponse (bool) : include request parts and response
+    p_maxBody (int) : maximum length of logged body values, parameter values
+      and response chunks are truncated, None for no limit
+  """
   def enc(p_val):
     if isinstance(p_val, bytes):
-      return p_val.decode("utf-8")
+      return p_val.decode("utf-8", "replace")
     return p_val
 
+  def cap(p_val):
+    l_val = enc(p_val)
+    if p_maxBody is not None and hasattr(l_val, "__len__") and len(l_val) > p_maxBody:
+      l_val = "%s...(%d more)" % (l_val[:p_maxBody], len(l_val) - p_maxBody)
+    return l_val
+
   def print_part(p_part):
     return {
       "name"    : enc(p_part.name),
       "headers" : { enc(x):enc(y) for x,y in p_part.headers.items() },
-      "value"   : enc(p_part.fullvalue())
+      "value"   : cap(p_part.fullvalue())
     }
 
   l_request = cherrypy.serving.request
@@ -56,10 +71,10 @@ def log_request_response(p_withResponse):
             l_body["params"][enc(c_name)][c_pos] = print_part(c_item)
           else:
             l_body["params"][enc(c_name)][c_pos] = {
-              "value" : enc(c_item)
+              "value" : cap(c_item)
             }
       else:
-        l_body["params"][enc(c_name)] = enc(c_value)
+        l_body["params"][enc(c_name)] = cap(c_value)
 
   if not p_withResponse:
     return l_data
@@ -84,51 +99,123 @@ def log_request_response(p_withResponse):
 
   if not cherrypy.response.stream:
     try:
+      l_left = p_maxBody
       for c_chunk in cherrypy.response.body:
+        if l_left is not None:
+          if l_left <= 0:
+            break
+          c_chunk = c_chunk[:l_left]
+          l_left -= len(c_chunk)
         l_data["response"]["body"]["chunks"].append(enc(c_chunk))
     except BaseException:
       l_data["response"]["body"]["chunks"] = []
   return l_data
 
+SAMPLE_COUNTER = itertools.count()
+""" Request counter of sampled request/response loggers """
+
+def _log_enabled(p_level, p_module, p_sample):
+  if not logger.is_enabled(p_module, logger.tools.LEVELS.get(p_level, logging.NOTSET)):
+    return False
+  if p_sample <= 1:
+    return True
+  l_request = cherrypy.serving.request
+  l_sampled = getattr(l_request, "xtd_log_sampled", None)
+  if l_sampled is None:
+    l_sampled = l_request.xtd_log_sampled = (next(SAMPLE_COUNTER) % p_sample) == 0
+  return l_sampled
+
+def _log_data(p_level, p_module, p_data, p_compact):
+  if p_compact:
+    logger.log(p_level, p_module, json.dumps(p_data, separators=(",", ":")))
+    return
+  l_val = json.dumps(p_data, indent=2)
+  for c_line in l_val.split("\n"):
+    logger.log(p_level, p_module, c_line)
+
 def request_logger():
+  """ Request logging tool
+
+  Tool parameters :
+
+  - ``level`` : logging level name
+  - ``module`` : logger name
+  - ``sample`` : log only one request out of ``sample``, the same requests
+    are picked by response logger
+  - ``maxbody`` : maximum length of logged body values, see :py:func:`log_request_response`
+  - ``compact`` : log data as a single line of JSON, instead of indented lines
+
+  Nothing is computed when ``level`` is disabled for ``module``.
+  """
   #pylint: disable=invalid-name
-  def handle(level, module):
-    l_data = log_request_response(False)
-    l_val  = json.dumps(l_data, indent=2)
-    for c_line in l_val.split("\n"):
-      logger.log(level, module, c_line)
+  def handle(level, module, sample=1, maxbody=None, compact=False):
+    if _log_enabled(level, module, sample):
+      _log_data(level, module, log_request_response(False, maxbody), compact)
   return handle
 
 
 def response_logger():
+  """ Response logging tool, see :py:func:`request_logger` """
   #pylint: disable=invalid-name
-  def handle(level, module):
-    l_data = log_request_response(True)
-    l_val  = json.dumps(l_data, indent=2)
-    for c_line in l_val.split("\n"):
-      logger.log(level, module, c_line)
+  def handle(level, module, sample=1, maxbody=None, compact=False):
+    if _log_enabled(level, module, sample):
+      _log_data(level, module, log_request_response(True, maxbody), compact)
   return handle
 
+class PerfHandle(object):
+  """ Request counters bound to a mount point
+
+  Holds the :py:class:`~xtd.core.stat.counter.Perf` and the optional
+  :py:class:`~xtd.core.stat.counter.Meter` updated by ``counter_start`` and
+  ``counter_stop`` tools, registering them in
+  :py:class:`~xtd.core.stat.manager.StatManager` if needed. Given as
+  ``tools.counter_start.perf`` configuration, it saves the counter lookup
+  on each request.
+
+  Args:
+    p_ns (str) : counter namespace
+    p_name (str) : perf counter name
+    p_percentiles (list) : perf counter percentiles, see :py:class:`~xtd.core.stat.counter.Perf`
+    p_meter (str) : meter counter name, None to disable
+  """
+  def __init__(self, p_ns, p_name, p_percentiles = None, p_meter = None):
+    l_manager  = stat.manager.StatManager()
+    self.m_key = (p_ns, p_name)
+    self.m_perf = l_manager.get_or_create(
+      p_ns, p_name, lambda x: stat.counter.Perf(x, p_percentiles=p_percentiles))
+    self.m_meter = None
+    if p_meter:
+      self.m_meter = l_manager.get_or_create(p_ns, p_meter, stat.counter.Meter)
+
+  def begin(self):
+    """ Count current request and start its time measure """
+    if self.m_meter is not None:
+      self.m_meter.mark()
+    l_request = cherrypy.serving.request
+    if not hasattr(l_request, "xtd_perf"):
+      l_request.xtd_perf = {}
+    l_request.xtd_perf[self.m_key] = self.m_perf.measure().start()
+
+
 def perf_begin():
+  l_handles = {}
   #pylint: disable=invalid-name
-  def handle(ns, name):
-    try:
-      l_counter = stat.manager.StatManager().get(ns, name)
-    except error.XtdError:
-      l_counter = stat.counter.Perf(name)
-      stat.manager.StatManager().register_counter(ns, l_counter)
-    l_counter.work_begin()
+  def handle(ns, name, percentiles=None, meter=None, perf=None):
+    if perf is None:
+      l_key = (ns, name, meter)
+      perf  = l_handles.get(l_key, None)
+      if perf is None:
+        perf = l_handles[l_key] = PerfHandle(ns, name, percentiles, meter)
+    perf.begin()
   return handle
 
 def perf_end():
-  #pylint: disable=invalid-name
-  def handle(ns, name):
-    try:
-      l_counter = stat.manager.StatManager().get(ns, name)
-    except error.XtdError:
-      l_counter = stat.counter.Perf(name)
-      stat.manager.StatManager().register_counter(ns, l_counter)
-    l_counter.work_end()
+  #pylint: disable=invalid-name,unused-argument
+  def handle(ns, name, percentiles=None, perf=None):
+    l_measures = getattr(cherrypy.serving.request, "xtd_perf", {})
+    l_measure  = l_measures.pop((ns, name), None)
+    if l_measure is not None:
+      l_measure.stop()
   return handle
 
 class JsonHTTPError(cherrypy.HTTPError):
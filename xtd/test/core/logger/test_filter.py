@@ -8,6 +8,7 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 import sys
 import os
 import optparse
+import threading
 import termcolor
 import unittest2 as unittest
 
@@ -176,5 +177,22 @@ class FilterTest(unittest.TestCase):
     self.assertEqual(self.m_obj.filter(l_rec), True)
     self.assertEqual(l_rec.field1, "%-23s" % termcolor.colored("value", "yellow", "on_red"))
 
+  def test_filter_threads(self):
+    self.setUp({ "field1" : { "pad" : "left" } })
+    self.m_obj.filter(self.makeRec({"field1" : "value"}))
+    l_thread = threading.Thread(target=self.m_obj.filter,
+                                args=(self.makeRec({"field1" : "longvalue"}),))
+    l_thread.start()
+    l_thread.join()
+    self.assertEqual(self.m_obj.m_widths["field1"], len("longvalue"))
+
+    l_rec = self.makeRec({"field1" : "value"})
+    self.m_obj.filter(l_rec)
+    self.assertEqual(l_rec.field1, "value    ")
+
+    for c_idx in range(self.m_obj.MERGE_INTERVAL):
+      self.m_obj.filter(self.makeRec({"field1" : "value"}))
+    self.assertEqual(self.m_obj._state().widths["field1"], len("longvalue"))
+
 if __name__ == "__main__":
   unittest.main()
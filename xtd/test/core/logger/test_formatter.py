@@ -8,10 +8,15 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 import sys
 import os
 import optparse
+import json
+import logging
+import time
 import termcolor
 import unittest2 as unittest
 
-from xtd.core.logger import formatter
+from xtd.core.logger         import formatter
+from xtd.core.logger.handler import AsyncHandler
+from xtd.core                import error
 
 #------------------------------------------------------------------#
 
@@ -67,5 +72,90 @@ class LocationFormatterTest(unittest.TestCase):
     l_coloredResult = termcolor.colored(l_rawResult, "red", attrs=["bold"])
     self.assertEqual(self.m_obj._get_loc(l_rec), l_coloredResult)
 
+  def test_format(self):
+    self.setUp(fmt="[%(levelname)s] %(message)s %(location)s",
+               locfmt="at %(filename)s:%(lineno)s")
+    l_rec = logging.LogRecord("test", logging.INFO, "/path/file.py", 20, "value %d", (1,), None)
+    self.assertEqual(self.m_obj.m_locFields, [ "filename", "lineno" ])
+    self.assertEqual(self.m_obj.format(l_rec), "[INFO] value 1 at file.py:20")
+    self.assertFalse(hasattr(l_rec, "location"))
+    self.assertEqual(self.m_obj._style._fmt, self.m_obj.m_fmt)
+
+    # expected colors depend on termcolor terminal detection
+    self.setUp(fmt="%(message)s %(location)s", locfmt="at %(filename)s:%(lineno)s",
+               locstyle={ "colors" : [ "red" ] })
+    self.assertEqual(self.m_obj.format(l_rec),
+                     "value 1 %s" % termcolor.colored("at file.py:20", "red"))
+
+    self.setUp(fmt="%(message)s", locstyle={ "colors" : [ "red" ] })
+    self.assertFalse(self.m_obj.uses_location())
+    self.assertEqual(self.m_obj.format(l_rec), "value 1")
+
+
+class JsonFormatterTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(JsonFormatterTest, self).__init__(*p_args, **p_kwds)
+
+  @staticmethod
+  def makeRec(p_msg = "value %s %d", p_args = ("a", 1)):
+    return logging.LogRecord("test", logging.INFO, "/path/file.py", 20, p_msg, p_args, None)
+
+  def test___init__(self):
+    with self.assertRaises(error.XtdError):
+      formatter.JsonFormatter(encoder="unknown")
+    l_obj = formatter.JsonFormatter(fields=[ "name", ("line", "lineno") ])
+    self.assertEqual(l_obj.m_fields, [ ("name", "name"), ("line", "lineno") ])
+    self.assertTrue(l_obj.uses_location())
+    self.assertFalse(l_obj.usesTime())
+    l_obj = formatter.JsonFormatter()
+    self.assertFalse(l_obj.uses_location())
+    self.assertTrue(l_obj.usesTime())
+
+  def test_format(self):
+    for c_encoder in [ "json", "auto" ]:
+      l_obj = formatter.JsonFormatter(static={ "app" : "test" }, encoder=c_encoder)
+      l_rec = self.makeRec()
+      l_res = l_obj.format(l_rec)
+      self.assertTrue(l_res.startswith('{"app":"test",'))
+      l_res = json.loads(l_res)
+      self.assertEqual(l_res["message"], "value %s %d")
+      self.assertEqual(l_res["args"], [ "a", 1 ])
+      self.assertEqual(l_res["level"], "INFO")
+      self.assertEqual(l_res["time"], "%s.%03d" % (
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(l_rec.created)), l_rec.msecs))
+
+    l_obj = formatter.JsonFormatter(fields={ "msg" : "message" }, args=False)
+    self.assertEqual(json.loads(l_obj.format(self.makeRec())), { "msg" : "value a 1" })
+    l_obj = formatter.JsonFormatter(fields={ "msg" : "message" })
+    l_res = json.loads(l_obj.format(self.makeRec("%(key)s", ({ "key" : object() },))))
+    self.assertEqual(list(l_res["args"].keys()), [ "key" ])
+
+    l_obj = formatter.JsonFormatter(fields=[], static={ "app" : "test" })
+    self.assertEqual(l_obj.format(self.makeRec("", ())), '{"app":"test"}')
+
+  def test_format_async(self):
+    l_rec = AsyncHandler._prepare(self.makeRec())
+    l_obj = formatter.JsonFormatter(fields={ "msg" : "message" })
+    self.assertEqual(json.loads(l_obj.format(l_rec)), { "msg" : "value %s %d", "args" : [ "a", 1 ] })
+    l_obj = formatter.JsonFormatter(fields={ "msg" : "message" }, args=False)
+    self.assertEqual(json.loads(l_obj.format(l_rec)), { "msg" : "value a 1" })
+
+  def test_format_exception(self):
+    l_obj = formatter.JsonFormatter(fields=[ "message" ])
+    try:
+      raise RuntimeError("failure")
+    except RuntimeError:
+      l_rec = logging.LogRecord("test", logging.ERROR, "/path/file.py", 20, "error", (), sys.exc_info())
+    l_res = json.loads(l_obj.format(l_rec))
+    self.assertIn("RuntimeError: failure", l_res["exception"])
+
+  def test_formatTime(self):
+    l_obj = formatter.JsonFormatter()
+    l_rec = self.makeRec()
+    l_obj.formatTime(l_rec, l_obj.datefmt)
+    self.assertEqual(l_obj.m_time[0], int(l_rec.created))
+    l_obj.m_time = (l_obj.m_time[0], "cached")
+    self.assertEqual(l_obj.formatTime(l_rec, l_obj.datefmt), "cached.%03d" % l_rec.msecs)
+
 if __name__ == "__main__":
   unittest.main()
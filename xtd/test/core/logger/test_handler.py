@@ -0,0 +1,197 @@
+# -*- coding: utf-8
+# pylint: disable=protected-access
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import logging
+import logging.handlers
+import threading
+import time
+import unittest2 as unittest
+
+from xtd.core.logger.handler import AsyncHandler
+from xtd.core.logger         import manager
+from xtd.core.stat.manager   import StatManager
+from xtd.core.error          import XtdError
+from xtd.core                import mixin
+
+#------------------------------------------------------------------#
+
+class GateHandler(logging.Handler):
+  def __init__(self):
+    super(GateHandler, self).__init__()
+    self.m_gate    = threading.Event()
+    self.m_records = []
+
+  def emit(self, record):
+    self.m_gate.wait(5)
+    self.m_records.append(record.getMessage())
+
+class ReentrantHandler(logging.Handler):
+  def __init__(self):
+    super(ReentrantHandler, self).__init__()
+    self.m_async   = None
+    self.m_records = []
+
+  def emit(self, record):
+    self.m_records.append(record.getMessage())
+    if record.getMessage() == "first":
+      for c_msg in [ "a", "b" ]:
+        self.m_async.handle(logging.LogRecord("test", logging.INFO, __file__, 0, c_msg, None, None))
+
+#------------------------------------------------------------------#
+
+class AsyncHandlerTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(AsyncHandlerTest, self).__init__(*p_args, **p_kwds)
+
+  def setUp(self):
+    mixin.Singleton.reset(StatManager)
+
+  @staticmethod
+  def _record(p_level, p_msg, *p_args):
+    return logging.LogRecord("test", p_level, __file__, 0, p_msg, p_args, None)
+
+  def _fill(self, p_obj, p_records):
+    # first record blocks listener in target handler
+    p_obj.handle(self._record(logging.INFO, "first"))
+    l_end = time.time() + 5
+    while not p_obj.m_busy and time.time() < l_end:
+      time.sleep(0.01)
+    self.assertTrue(p_obj.m_busy)
+    for c_level, c_msg in p_records:
+      p_obj.handle(self._record(c_level, c_msg))
+
+  def test___init__(self):
+    l_target = GateHandler()
+    l_target.setLevel(logging.WARNING)
+    with self.assertRaises(XtdError):
+      AsyncHandler(l_target, "h1", p_overflow="unknown")
+    with self.assertRaises(XtdError):
+      AsyncHandler(l_target, "h1", p_size=0)
+    l_obj = AsyncHandler(l_target, "h1")
+    self.assertEqual(l_obj.level, logging.WARNING)
+    self.assertEqual(l_obj.target(), l_target)
+    l_target.m_gate.set()
+    l_obj.close()
+
+  def test_emit(self):
+    l_target = GateHandler()
+    l_target.m_gate.set()
+    l_obj  = AsyncHandler(l_target, "h1")
+    l_args = [ 1 ]
+    l_obj.handle(self._record(logging.INFO, "value %s", l_args))
+    l_args.append(2)
+    l_obj.flush()
+    self.assertEqual(l_target.m_records, [ "value [1]" ])
+    l_obj.close()
+    l_obj.handle(self._record(logging.INFO, "closed"))
+    self.assertEqual(l_target.m_records, [ "value [1]" ])
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="INFO").val, 1)
+
+  def test_emit_args(self):
+    l_target = GateHandler()
+    l_target.m_gate.set()
+    l_obj    = AsyncHandler(l_target, "h1")
+    l_record = self._record(logging.INFO, "value %s %s", 1, "a")
+    l_copy   = l_obj._prepare(l_record)
+    self.assertEqual(l_copy.msg, "value 1 a")
+    self.assertEqual(l_copy.args, None)
+    self.assertEqual(l_copy.xtd_msg, "value %s %s")
+    self.assertEqual(l_copy.xtd_args, (1, "a"))
+    self.assertEqual(l_record.args, (1, "a"))
+    l_obj.close()
+
+  def test_drop_oldest(self):
+    l_target = GateHandler()
+    l_obj    = AsyncHandler(l_target, "h1", 2, "drop_oldest")
+    self._fill(l_obj, [ (logging.INFO, "a"), (logging.INFO, "b"), (logging.INFO, "c") ])
+    l_target.m_gate.set()
+    l_obj.flush()
+    self.assertEqual(l_target.m_records, [ "first", "b", "c" ])
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="INFO").val, 1)
+    l_obj.close()
+
+  def test_drop_debug(self):
+    l_target = GateHandler()
+    l_obj    = AsyncHandler(l_target, "h1", 2, "drop_debug")
+    self._fill(l_obj, [
+      (logging.INFO,  "a"),
+      (logging.DEBUG, "b"),
+      (logging.DEBUG, "c"),
+      (logging.ERROR, "d"),
+      (logging.ERROR, "e")
+    ])
+    l_target.m_gate.set()
+    l_obj.flush()
+    self.assertEqual(l_target.m_records, [ "first", "d", "e" ])
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="DEBUG").val, 2)
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="INFO").val, 1)
+    l_obj.close()
+
+  def test_block(self):
+    l_target = GateHandler()
+    l_obj    = AsyncHandler(l_target, "h1", 1, "block")
+    self._fill(l_obj, [ (logging.INFO, "a") ])
+    threading.Timer(0.1, l_target.m_gate.set).start()
+    l_obj.handle(self._record(logging.INFO, "b"))
+    l_obj.close()
+    self.assertEqual(l_target.m_records, [ "first", "a", "b" ])
+    self.assertEqual(l_obj.policy().m_blocked.val, 1)
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="INFO").val, 0)
+
+  def test_block_reentrant(self):
+    l_target = ReentrantHandler()
+    l_obj    = AsyncHandler(l_target, "h1", 1, "block")
+    l_target.m_async = l_obj
+    l_obj.handle(self._record(logging.INFO, "first"))
+    l_end = time.time() + 5
+    while len(l_target.m_records) < 2 and time.time() < l_end:
+      time.sleep(0.01)
+    l_obj.close()
+    self.assertEqual(l_target.m_records, [ "first", "a" ])
+    self.assertEqual(l_obj.policy().m_dropped.labels(level="INFO").val, 1)
+    self.assertEqual(l_obj.policy().m_blocked.val, 0)
+
+  def test_load_handlers(self):
+    mixin.Singleton.reset(manager.LogManager)
+    l_obj = manager.LogManager()
+    l_obj.initialize({}, {
+      "async" : True,
+      "loggers" : {
+        "root"       : { "handlers" : [ ], "level" : 30 },
+        "test.async" : { "handlers" : [ "mem", "sync" ], "level" : 20 }
+      },
+      "handlers" : {
+        "mem"  : {
+          "class"    : "logging.handlers.MemoryHandler",
+          "capacity" : 30,
+          "queue"    : 5,
+          "overflow" : "drop_oldest"
+        },
+        "sync" : {
+          "class"    : "logging.handlers.MemoryHandler",
+          "capacity" : 30,
+          "async"    : False
+        }
+      },
+      "formatters" : {
+        "default" : { "class" : "logging.Formatter" }
+      }
+    })
+    l_handler = l_obj.get_handler("mem")
+    self.assertIsInstance(l_handler, AsyncHandler)
+    self.assertEqual(l_handler.policy().m_size, 5)
+    self.assertEqual(l_handler.policy().m_overflow, "drop_oldest")
+    self.assertIsInstance(l_obj.get_handler("sync"), logging.handlers.MemoryHandler)
+    logging.getLogger("test.async").info("message")
+    l_obj.flush()
+    self.assertEqual([ x.getMessage() for x in l_handler.target().buffer ], [ "message" ])
+    l_handler.close()
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -6,6 +6,8 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 #------------------------------------------------------------------#
 
 import logging
+import logging.handlers
+import sys
 import unittest2 as unittest
 
 from xtd.core        import logger
@@ -491,6 +493,76 @@ class LogManagerTest(unittest.TestCase):
       logger.critical(__name__, "test")
       self.assertEqual(len(l_logs.records), 4)
 
+  def _init_memory(self, p_name, p_fmt):
+    self.m_obj.initialize({}, {
+      "loggers" : {
+        "root" : {
+          "handlers" : [ ],
+          "level" : 30
+        },
+        p_name : {
+          "handlers" : [ "mem" ],
+          "level" : 30
+        }
+      },
+      "handlers" : {
+        "mem" : {
+          "class" : "logging.handlers.MemoryHandler",
+          "capacity" : 30,
+          "formatter" : "fmt",
+          "filters" : [ ]
+        }
+      },
+      "formatters" : {
+        "fmt" : {
+          "class" : "logging.Formatter",
+          "fmt"   : p_fmt
+        }
+      }
+    })
+    return self.m_obj.get_handler("mem")
+
+  def test_find_caller(self):
+    l_handler = self._init_memory("test.location", "%(message)s (%(funcName)s)")
+    self.assertTrue(manager.WrapperLogger.ms_location)
+    l_line = sys._getframe().f_lineno + 1
+    logger.error("test.location", "msg")
+    logger.log("error", "test.location", "msg")
+    logging.getLogger("test.location").error("msg", stack_info=True)
+    self.assertEqual(len(l_handler.buffer), 3)
+    for c_record in l_handler.buffer:
+      self.assertEqual(c_record.funcName, "test_find_caller")
+      self.assertEqual(c_record.pathname, __file__.replace(".pyc", ".py"))
+    self.assertEqual(l_handler.buffer[0].lineno, l_line)
+    self.assertIn("test_find_caller", l_handler.buffer[2].stack_info)
+
+  def test_find_caller_disabled(self):
+    l_handler = self._init_memory("test.nolocation", "%(message)s")
+    self.addCleanup(setattr, manager.WrapperLogger, "ms_location", True)
+    self.assertFalse(manager.WrapperLogger.ms_location)
+    logger.error("test.nolocation", "msg")
+    self.assertEqual(l_handler.buffer[0].funcName, "(unknown function)")
+
+  def test_find_caller_late_handler(self):
+    self._init_memory("test.latelocation", "%(message)s")
+    self.addCleanup(setattr, manager.WrapperLogger, "ms_location", True)
+    self.assertFalse(manager.WrapperLogger.ms_location)
+    l_handler = logging.handlers.MemoryHandler(30)
+    l_handler.setFormatter(logging.Formatter("%(message)s (%(lineno)d)"))
+    self.m_obj.add_handler("late", l_handler)
+    self.assertTrue(manager.WrapperLogger.ms_location)
+    logging.getLogger("test.latelocation").addHandler(l_handler)
+    self.addCleanup(logging.getLogger("test.latelocation").removeHandler, l_handler)
+    l_line = sys._getframe().f_lineno + 1
+    logger.error("test.latelocation", "msg")
+    self.assertEqual(l_handler.buffer[0].lineno, l_line)
+
+  @unittest.skipIf(sys.version_info.major == 2, "format styles require python 3")
+  def test_uses_location_styles(self):
+    for c_fmt, c_style in [ ("{message} {funcName}", "{"), ("$message ${lineno}", "$") ]:
+      self.assertTrue(self.m_obj._uses_location(logging.Formatter(c_fmt, style=c_style)))
+    self.assertFalse(self.m_obj._uses_location(logging.Formatter("{message}", style="{")))
+
   def test_dupped_record(self):
     l_override = {
       "loggers" : {
@@ -525,5 +597,45 @@ class LogManagerTest(unittest.TestCase):
     self.assertEqual(l_h2.buffer[0].name, "\x1b[1m\x1b[31mtest\x1b[0m")
     self.assertEqual(l_h1.buffer[0].name, "test")
 
+    l_arg = Rec()
+    logger.error("test.child", "msg %s", l_arg)
+    self.assertEqual(len(l_h1.buffer), 2)
+    self.assertEqual(len(l_h2.buffer), 2)
+    self.assertIs(l_h1.buffer[1].args[0], l_arg)
+    self.assertIs(l_h2.buffer[1].args[0], l_arg)
+    self.assertEqual(l_h1.buffer[1].name, "test.child")
+
+  def test_propagate(self):
+    l_handlers = {}
+    for c_name in [ "parent", "c1", "c2" ]:
+      l_handlers[c_name] = { "class" : "logging.handlers.MemoryHandler", "capacity" : 30, "filters" : [] }
+    self.m_obj.initialize({}, {
+      "loggers" : {
+        "root"                      : { "handlers" : [ ], "level" : 30 },
+        "test_propagate"            : { "handlers" : [ "parent" ], "level" : 30 },
+        "test_propagate.child"      : { "handlers" : [ "c1", "c2" ], "level" : 30 },
+        "test_propagate.child.leaf" : { "handlers" : [ "c1" ], "level" : 30 }
+      },
+      "handlers" : l_handlers
+    })
+    l_parent = self.m_obj.get_handler("parent")
+    l_c1     = self.m_obj.get_handler("c1")
+    l_c2     = self.m_obj.get_handler("c2")
+    l_child  = logging.getLogger("test_propagate.child")
+    l_top    = logging.getLogger("test_propagate")
+    self.addCleanup(setattr, l_child, "propagate", True)
+    # keep records away from handlers left on root logger by other tests
+    l_top.propagate = False
+    self.addCleanup(setattr, l_top, "propagate", True)
+
+    logger.error("test_propagate.child", "msg")
+    self.assertEqual([ len(x.buffer) for x in [ l_parent, l_c1, l_c2 ] ], [ 1, 1, 1 ])
+
+    l_child.propagate = False
+    logger.error("test_propagate.child", "msg")
+    self.assertEqual([ len(x.buffer) for x in [ l_parent, l_c1, l_c2 ] ], [ 1, 2, 2 ])
+    logger.error("test_propagate.child.leaf", "msg")
+    self.assertEqual([ len(x.buffer) for x in [ l_parent, l_c1, l_c2 ] ], [ 1, 4, 3 ])
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import logging
+import unittest2 as unittest
+
+from xtd.core.logger import tools, manager
+
+#------------------------------------------------------------------#
+
+class ListHandler(logging.Handler):
+  def __init__(self):
+    super(ListHandler, self).__init__()
+    self.m_records = []
+
+  def emit(self, record):
+    self.m_records.append(record.getMessage())
+
+#------------------------------------------------------------------#
+
+class ToolsTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(ToolsTest, self).__init__(*p_args, **p_kwds)
+
+  def setUp(self):
+    self.m_class = logging.getLoggerClass()
+    logging.setLoggerClass(manager.WrapperLogger)
+    self.m_logger  = logging.getLogger("test.tools")
+    self.m_handler = ListHandler()
+    self.m_logger.handlers  = [ self.m_handler ]
+    self.m_logger.propagate = False
+    self.m_logger.setLevel(logging.INFO)
+
+  def tearDown(self):
+    self.m_logger.handlers = []
+    logging.setLoggerClass(self.m_class)
+
+  def test_is_enabled(self):
+    self.assertTrue(tools.is_enabled("test.tools", logging.INFO))
+    self.assertFalse(tools.is_enabled("test.tools", logging.DEBUG))
+    self.assertFalse(tools.is_enabled("test.tools.child", logging.DEBUG))
+
+    # level changes are seen without invalidation
+    logging.Logger.setLevel(self.m_logger, logging.DEBUG)
+    self.assertTrue(tools.is_enabled("test.tools.child", logging.DEBUG))
+    self.m_logger.setLevel(logging.ERROR)
+    self.assertFalse(tools.is_enabled("test.tools.child", logging.INFO))
+
+    # root logger and disable
+    l_root = logging.getLogger()
+    l_level = l_root.level
+    self.addCleanup(l_root.setLevel, l_level)
+    l_root.setLevel(logging.ERROR)
+    self.assertFalse(tools.is_enabled("test_tools_unset", logging.INFO))
+    l_root.setLevel(logging.DEBUG)
+    self.assertTrue(tools.is_enabled("test_tools_unset", logging.INFO))
+    logging.disable(logging.INFO)
+    self.addCleanup(logging.disable, logging.NOTSET)
+    self.assertFalse(tools.is_enabled("test_tools_unset", logging.INFO))
+    logging.disable(logging.NOTSET)
+    self.assertTrue(tools.is_enabled("test_tools_unset", logging.INFO))
+
+  def test_wrappers(self):
+    tools.debug("test.tools", "debug")
+    tools.info("test.tools", "info %d", 1)
+    tools.log("debug", "test.tools", "log debug")
+    tools.log("warning", "test.tools", "log warning")
+    with self.assertRaises(AttributeError):
+      tools.log("unknown", "test.tools", "log unknown")
+    self.assertEqual(self.m_handler.m_records, [ "info 1", "log warning" ])
+
+  def test_lazy(self):
+    l_calls = []
+    def compute(p_value, p_suffix=""):
+      l_calls.append(p_value)
+      return "%s%s" % (p_value, p_suffix)
+    tools.debug("test.tools", "value %s", tools.Lazy(compute, 1))
+    self.assertEqual(l_calls, [])
+    tools.info("test.tools", "value %s %r", tools.Lazy(compute, 2, p_suffix="!"), tools.Lazy(compute, 3))
+    self.assertEqual(l_calls, [ 2, 3 ])
+    self.assertEqual(self.m_handler.m_records, [ "value 2! '3'" ])
+
+if __name__ == "__main__":
+  unittest.main()
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -0,0 +1,111 @@
+# -*- coding: utf-8
+# pylint: disable=protected-access
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import os
+import tempfile
+import shutil
+import unittest2 as unittest
+
+from xtd.core.stat.arena import CounterArena, ArenaValue
+from xtd.core.error      import XtdError
+
+#------------------------------------------------------------------#
+
+
+class CounterArenaTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(CounterArenaTest, self).__init__(*p_args, **p_kwds)
+
+  def test___init__(self):
+    l_obj = CounterArena(["a", "b"], 3, p_types={ "b" : "d" })
+    self.assertEqual(l_obj.names(), ["a", "b"])
+    self.assertEqual(l_obj.stripes(), 3)
+    self.assertEqual(l_obj.slot("b"), 1)
+    with self.assertRaises(XtdError):
+      l_obj.slot("c")
+    with self.assertRaises(XtdError):
+      CounterArena(["a", "a"])
+    with self.assertRaises(XtdError):
+      CounterArena(["a"], p_types={ "a" : "x" })
+    with self.assertRaises(XtdError):
+      CounterArena(["a"], 0)
+    with self.assertRaises(XtdError):
+      l_obj.attach(3)
+
+  def test_fork(self):
+    l_obj = CounterArena(["requests", "time"], 3, p_types={ "time" : "d" })
+    l_requests = l_obj.counter("requests", p_detail=True)
+    l_time     = l_obj.counter("time")
+    l_requests.incr(5)
+    l_pids = []
+    for c_idx in range(1, 3):
+      l_pid = os.fork()
+      if not l_pid:
+        l_obj.attach(c_idx)
+        l_requests.incr(c_idx * 10)
+        l_time.val = 0.5
+        os._exit(0)
+      l_pids.append(l_pid)
+    for c_pid in l_pids:
+      os.waitpid(c_pid, 0)
+
+    self.assertEqual(l_requests.val, 35)
+    self.assertEqual(l_time.val, 1.0)
+    l_data = {}
+    def visitor(p_name, p_value):
+      l_data[p_name] = p_value
+    l_requests.visit(visitor)
+    self.assertDictEqual(l_data, {
+      "requests"   : 35,
+      "requests.0" : 5,
+      "requests.1" : 10,
+      "requests.2" : 20
+    })
+    with self.assertRaises(TypeError):
+      l_requests.incr(0.5)
+
+  def test_open(self):
+    l_dir  = tempfile.mkdtemp()
+    l_path = os.path.join(l_dir, "arena")
+    l_obj  = CounterArena(["a", "b"], 2, l_path)
+    l_obj.counter("b").incr(3)
+    l_obj.attach(1)
+    l_obj.counter("b").incr(4)
+
+    l_reader = CounterArena.open(l_path)
+    self.assertEqual(l_reader.names(), ["a", "b"])
+    l_data = {}
+    def visitor(p_name, p_value):
+      l_data[p_name] = p_value
+    for c_counter in l_reader.counters():
+      self.assertIsInstance(c_counter, ArenaValue)
+      c_counter.update()
+      c_counter.visit(visitor)
+    self.assertDictEqual(l_data, { "a" : 0, "b" : 7 })
+    self.assertIsNot(l_reader.counter("b"), l_reader.counter("b", True))
+    self.assertIs(l_reader.counter("b", True), l_reader.counter("b", True))
+    with self.assertRaises(XtdError):
+      l_reader.set(0, 1)
+    with self.assertRaises(XtdError):
+      l_reader.counter("a").incr()
+    with self.assertRaises(XtdError):
+      l_reader.attach(0)
+    l_reader.close()
+    l_obj.close()
+
+    with open(l_path, "wb") as l_file:
+      l_file.write(b"garbage")
+    with self.assertRaises(XtdError):
+      CounterArena.open(l_path)
+    with self.assertRaises(XtdError):
+      CounterArena.open(os.path.join(l_dir, "unknown"))
+    shutil.rmtree(l_dir)
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
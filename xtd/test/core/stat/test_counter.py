@@ -7,6 +7,7 @@ __author__    = "Xavier MARCELET <xavier@marcelet.com>"
 
 import time
 import sys
+import threading
 import os
 import termcolor
 import unittest2 as unittest
@@ -14,6 +15,10 @@ import unittest2 as unittest
 from xtd.core.stat.counter import BaseCounter, Value, Int32, Int64
 from xtd.core.stat.counter import UInt32, UInt64, Float, Double
 from xtd.core.stat.counter import Composed, TimedSample, Perf, CounterError
+from xtd.core.stat.counter import PerfMeasure, Meter, Histogram, Family
+from xtd.core.stat import counter
+from xtd.core.stat.counter import SampleRing, SampleBuckets, QuantileSketch, Quantile
+from xtd.core.stat.counter import ShardedValue, ShardedInt32, ShardedUInt64, ShardedDouble
 
 #------------------------------------------------------------------#
 
@@ -154,6 +159,51 @@ class ValueTest(unittest.TestCase):
     Double("name", 0.5)
 
 
+class ShardedValueTest(unittest.TestCase):
+  def test_incr(self):
+    l_val = ShardedInt32("toto", 20)
+    self.assertEqual(l_val.val, 20)
+    l_val.incr()
+    l_val.decr(3)
+    self.assertEqual(l_val.val, 18)
+    with self.assertRaises(TypeError):
+      l_val.incr(0.5)
+    with self.assertRaises(TypeError):
+      ShardedInt32("toto", 0.5)
+
+    l_val.val = 100
+    l_val.incr(1)
+    self.assertEqual(l_val.val, 101)
+    l_val.val = None
+    self.assertEqual(l_val.val, None)
+
+    l_val = ShardedDouble("toto")
+    l_val.incr(0.5)
+    l_val.val = 2.0
+    l_val.incr(0.25)
+    self.assertEqual(l_val.val, 2.25)
+
+  def test_threads(self):
+    l_val = ShardedUInt64("toto", 0)
+    def work():
+      for c_idx in range(0, 1000):
+        l_val.incr()
+    l_threads = [ threading.Thread(target=work) for x in range(0, 8) ]
+    for c_thread in l_threads:
+      c_thread.start()
+    for c_thread in l_threads:
+      c_thread.join()
+    l_data = {}
+    def visitor(p_name, p_value):
+      l_data[p_name] = p_value
+    l_val.visit(visitor)
+    self.assertDictEqual(l_data, { "toto" : 8000 })
+    self.assertEqual(len(l_val.m_shards), 0)
+    l_val.unset()
+    l_val.visit(visitor)
+    self.assertDictEqual(l_data, { "toto" : "NaN" })
+
+
 class ComposedTest(unittest.TestCase):
   def test__init__(self):
     l_group = Composed("with_name")
@@ -173,9 +223,200 @@ class ComposedTest(unittest.TestCase):
     l_group.update()
     l_group.visit(visitor)
 
+  def test_register_nested(self):
+    l_child = Composed("child")
+    l_child.register(Int32("value", 1))
+    l_group = Composed("parent")
+    l_group.register(l_child)
+    l_data = {}
+    def visitor(p_name, p_value):
+      l_data[p_name] = p_value
+    l_group.visit(visitor)
+    self.assertDictEqual(l_data, { "parent.child.value" : 1 })
+
+
+class QuantileSketchTest(unittest.TestCase):
+  def test_index(self):
+    l_obj = QuantileSketch(p_precision=7, p_maxBits=40)
+    for c_val in range(0, 128):
+      self.assertEqual(l_obj.index(c_val), c_val)
+      self.assertEqual(l_obj.value(c_val), c_val)
+    l_prev = 127
+    for c_val in range(128, 100000, 7):
+      l_idx = l_obj.index(c_val)
+      self.assertTrue(l_prev <= l_idx)
+      self.assertAlmostEqual(l_obj.value(l_idx), c_val, delta=c_val / 128.0)
+      l_prev = l_idx
+    self.assertEqual(l_obj.index(-5), 0)
+    self.assertEqual(l_obj.index(1 << 50), l_obj.m_size - 1)
+
+  def test_quantiles(self):
+    l_obj = QuantileSketch()
+    self.assertEqual(l_obj.quantiles([50, 99]), [None, None])
+    for c_val in range(1, 10001):
+      l_obj.add(c_val)
+    l_res = l_obj.quantiles([99, 50, 0, 100])
+    self.assertAlmostEqual(l_res[0], 9900, delta=9900 / 128.0)
+    self.assertAlmostEqual(l_res[1], 5000, delta=5000 / 128.0)
+    self.assertEqual(l_res[2], 1)
+    self.assertAlmostEqual(l_res[3], 10000, delta=10000 / 128.0)
+
+  def test_quantiles_bounds(self):
+    l_obj = QuantileSketch()
+    for c_val in range(1, 2001):
+      l_obj.add(c_val)
+    l_res = l_obj.quantiles([0, 99.9, 100])
+    self.assertGreaterEqual(l_res[0], 1)
+    self.assertLessEqual(l_res[1], 2000)
+    self.assertEqual(l_res[2], 2000)
+
+    l_obj = QuantileSketch()
+    for c_val in range(1000, 1010):
+      l_obj.add(c_val)
+    l_res = l_obj.quantiles([0, 100])
+    self.assertGreaterEqual(l_res[0], 1000)
+    self.assertLessEqual(l_res[1], 1009)
+
+  def test_merge(self):
+    l_obj1 = QuantileSketch()
+    l_obj2 = QuantileSketch()
+    for c_val in range(0, 100):
+      l_obj1.add(c_val)
+      l_obj2.add(c_val + 100)
+    l_obj1.merge(QuantileSketch.from_state(l_obj2.state()))
+    self.assertEqual(l_obj1.m_count, 200)
+    self.assertEqual((l_obj1.m_min, l_obj1.m_max), (0, 199))
+    self.assertEqual(l_obj1.quantiles([50])[0], 99)
+    with self.assertRaises(ValueError):
+      l_obj1.merge(QuantileSketch(p_precision=5))
+
+
+class QuantileTest(unittest.TestCase):
+  def test_update(self):
+    l_obj = Quantile("lat", [50, 99.9], p_timeMs=100)
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, { "lat.p50" : "NaN", "lat.p999" : "NaN" })
+
+    for c_val in range(1, 101):
+      l_obj.push(c_val)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, { "lat.p50" : 50, "lat.p999" : 100 })
+
+    time.sleep(0.15)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, { "lat.p50" : "NaN", "lat.p999" : "NaN" })
+
+    with self.assertRaises(TypeError):
+      l_obj.push("toto")
+
+
+
+class SampleRingTest(unittest.TestCase):
+  def test_push(self):
+    l_obj = SampleRing(3)
+    self.assertEqual(len(l_obj), 0)
+    self.assertEqual(l_obj.min(), None)
+    self.assertEqual(l_obj.max(), None)
+    for c_val in [5, 1, 9]:
+      l_obj.push(c_val, c_val)
+    self.assertEqual(len(l_obj), 3)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (1, 9, 15))
+    self.assertEqual(l_obj[0], (5, 5))
+    self.assertEqual(l_obj[-1], (9, 9))
+
+    # evicts 5 then 1
+    l_obj.push(10, 7)
+    l_obj.push(11, 8)
+    self.assertEqual(len(l_obj), 3)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (7, 9, 24))
+    l_obj.push(12, 2)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (2, 8, 17))
+
+    with self.assertRaises(IndexError):
+      l_obj[3]
+
+    # values that don't fit in type widen the storage
+    l_obj = SampleRing(3, 'L')
+    l_obj.push(0, 5)
+    l_obj.push(1, -1)
+    self.assertEqual(l_obj.m_values.typecode, 'd')
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (-1, 5, 4))
+
+  def test_expire(self):
+    l_obj = SampleRing(10)
+    for c_val in range(0, 10):
+      l_obj.push(c_val, 10 - c_val)
+    l_obj.expire(4)
+    self.assertEqual(len(l_obj), 6)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (1, 6, 21))
+    l_obj.expire(100)
+    self.assertEqual(len(l_obj), 0)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (None, None, 0))
+
+
+class SampleBucketsTest(unittest.TestCase):
+  def test_push(self):
+    l_obj = SampleBuckets(3000, 1000)
+    self.assertEqual(l_obj.m_size, 4)
+    self.assertEqual(len(l_obj), 0)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (None, None, 0))
+    for c_val in [5, 1, 9]:
+      l_obj.push(10.1, c_val)
+    l_obj.push(11.5, 20)
+    l_obj.push(12.5, -3)
+    self.assertEqual(len(l_obj), 5)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (-3, 20, 32))
+
+    l_obj.expire(11.2)
+    self.assertEqual(len(l_obj), 2)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (-3, 20, 17))
+
+    # reuses slot of t=10
+    l_obj.push(14.0, 7)
+    l_obj.expire(10.0)
+    self.assertEqual(len(l_obj), 3)
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (-3, 20, 24))
+
+
+    # values that don't fit in type widen the storage
+    l_obj = SampleBuckets(3000, 1000, 'L')
+    l_obj.push(0, 5)
+    l_obj.push(0, -1)
+    self.assertEqual(l_obj.m_mins.typecode, 'd')
+    self.assertEqual((l_obj.min(), l_obj.max(), l_obj.sum()), (-1, 5, 4))
 
 
 class TimedSampleTest(unittest.TestCase):
+  def test_buckets(self):
+    l_obj = TimedSample("avg", p_timeMs=100, p_bucketMs=10)
+    self.assertIsInstance(l_obj.m_samples, SampleBuckets)
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    for c_val in range(0, 1000):
+      l_obj.push(c_val % 20)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, {
+      "avg.min" : 0,
+      "avg.max" : 19,
+      "avg.avg" : 9
+    })
+    time.sleep(0.15)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, {
+      "avg.min" : "NaN",
+      "avg.max" : "NaN",
+      "avg.avg" : "NaN"
+    })
+
   def test_push(self):
     l_obj = TimedSample("avg", p_timeMs=10*1000, p_maxSamples = 1000)
     for c_val in range(0, 500):
@@ -193,6 +434,15 @@ class TimedSampleTest(unittest.TestCase):
     with self.assertRaises(TypeError):
       l_obj.push("toto")
 
+  def test_push_overflow(self):
+    for c_bucketMs in [None, 10]:
+      l_obj = TimedSample("avg", p_timeMs=10*1000, p_type='L', p_bucketMs=c_bucketMs)
+      l_obj.push(1 << 40)
+      l_obj.push(-1)
+      l_obj.update()
+      self.assertEqual(l_obj.m_samples.min(), -1)
+      self.assertEqual(l_obj.m_samples.max(), 1 << 40)
+
   def test_update(self):
     l_obj = TimedSample("avg", p_timeMs=100, p_maxSamples = 1000)
     # visitor to get data
@@ -250,6 +500,228 @@ class PerfTest(unittest.TestCase):
     self.assertEqual(len(l_obj.m_samples), 1)
     self.assertAlmostEqual(l_obj.m_samples[0][1], 100000, delta=15000)
 
+  def test_measure(self):
+    l_obj = Perf("perf")
+    with l_obj.measure():
+      with l_obj.measure():
+        time.sleep(0.05)
+      time.sleep(0.05)
+    self.assertEqual(len(l_obj.m_samples), 2)
+    self.assertAlmostEqual(l_obj.m_samples[0][1], 50000, delta=15000)
+    self.assertAlmostEqual(l_obj.m_samples[1][1], 100000, delta=15000)
+
+    l_measure1 = l_obj.measure().start()
+    l_measure2 = l_obj.measure().start()
+    self.assertIsInstance(l_measure1, PerfMeasure)
+    l_measure1.stop()
+    l_measure2.stop()
+    self.assertEqual(len(l_obj.m_samples), 4)
+    with self.assertRaises(CounterError):
+      l_measure2.stop()
+
+    @l_obj.measure()
+    def func(p_val):
+      return p_val * 2
+    self.assertEqual(func(4), 8)
+    self.assertEqual(func.__name__, "func")
+    self.assertEqual(len(l_obj.m_samples), 5)
+
+  @unittest.skipIf(sys.version_info < (3, 7), "requires asyncio.run")
+  def test_measure_coroutine(self):
+    import asyncio
+    l_obj = Perf("perf")
+
+    @l_obj.measure()
+    async def func(p_val):
+      await asyncio.sleep(0.05)
+      return p_val
+
+    async def main():
+      return await asyncio.gather(*[ func(x) for x in range(0, 10) ])
+
+    self.assertEqual(asyncio.run(main()), list(range(0, 10)))
+    self.assertEqual(len(l_obj.m_samples), 10)
+    for c_idx in range(0, 10):
+      self.assertAlmostEqual(l_obj.m_samples[c_idx][1], 50000, delta=20000)
+
+  def test_percentiles(self):
+    l_obj = Perf("perf", p_percentiles=[50, 99])
+    for c_val in range(0, 100):
+      l_obj.push(c_val)
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertEqual(sorted(l_data.keys()), [
+      "perf.avg", "perf.max", "perf.min", "perf.p50", "perf.p99"
+    ])
+    self.assertEqual(l_data["perf.p50"], 49)
+    self.assertEqual(l_data["perf.p99"], 98)
+
+class MeterTest(unittest.TestCase):
+  def test_update(self):
+    l_obj = Meter("qps")
+    l_obj.MIN_INTERVAL = 0.1
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertDictEqual(l_data, {
+      "qps.count" : 0,
+      "qps.rate"  : "NaN",
+      "qps.m1"    : "NaN",
+      "qps.m5"    : "NaN",
+      "qps.m15"   : "NaN"
+    })
+
+    time.sleep(0.1)
+    l_obj.mark(10)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertEqual(l_data["qps.count"], 10)
+    self.assertAlmostEqual(l_data["qps.rate"], 100, delta=30)
+    self.assertEqual(l_data["qps.m1"], l_data["qps.rate"])
+
+    # too close from previous update
+    l_obj.mark(10)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertEqual(l_data["qps.count"], 20)
+    self.assertAlmostEqual(l_data["qps.rate"], 100, delta=30)
+
+    time.sleep(0.1)
+    l_obj.update()
+    time.sleep(0.1)
+    l_obj.update()
+    l_obj.visit(visitor)
+    self.assertEqual(l_data["qps.rate"], 0)
+    self.assertLess(l_data["qps.m1"], l_data["qps.m5"])
+    self.assertLess(l_data["qps.m5"], l_data["qps.m15"])
+
+    with self.assertRaises(TypeError):
+      l_obj.mark(0.5)
+
+class HistogramTest(unittest.TestCase):
+  def _data(self, p_obj):
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    p_obj.update()
+    p_obj.visit(visitor)
+    return l_data
+
+  def test_bounds(self):
+    self.assertEqual(Histogram.linear(0, 5, 3), [0, 5, 10])
+    self.assertEqual(Histogram.exponential(1, 2, 4), [1, 2, 4, 8])
+    self.assertEqual(Histogram.bound_name(0.5), "le_0_5")
+    with self.assertRaises(CounterError):
+      Histogram("size", [])
+
+  def test_observe(self):
+    l_obj = Histogram("size", [10, 1, 100])
+    for c_val in [0, 1, 2, 10, 50, 1000]:
+      l_obj.observe(c_val)
+    self.assertDictEqual(self._data(l_obj), {
+      "size.le_1"   : 2,
+      "size.le_10"  : 4,
+      "size.le_100" : 5,
+      "size.le_inf" : 6,
+      "size.sum"    : 1063.0,
+      "size.count"  : 6
+    })
+    with self.assertRaises(TypeError):
+      l_obj.observe("toto")
+
+  def test_observe_many(self):
+    l_values = [0, 1, 2, 10, 50, 1000] * 10
+    for c_numpy in set([None, counter.get_numpy()]):
+      l_saved = counter.numpy
+      counter.numpy = c_numpy
+      try:
+        l_obj = Histogram("size", [1, 10, 100])
+        l_obj.observe_many(l_values)
+        l_obj.observe_many(iter([5]))
+        self.assertDictEqual(self._data(l_obj), {
+          "size.le_1"   : 20,
+          "size.le_10"  : 41,
+          "size.le_100" : 51,
+          "size.le_inf" : 61,
+          "size.sum"    : 10635.0,
+          "size.count"  : 61
+        })
+        with self.assertRaises(TypeError):
+          l_obj.observe_many(["toto"])
+      finally:
+        counter.numpy = l_saved
+
+
+class FamilyTest(unittest.TestCase):
+  def _data(self, p_obj):
+    l_data = {}
+    def visitor(p_name, p_val):
+      l_data[p_name] = p_val
+    p_obj.update()
+    p_obj.visit(visitor)
+    return l_data
+
+  def test_labels(self):
+    l_obj = Family("requests", [ "path", "code" ])
+    l_child = l_obj.labels(path="/x", code=200)
+    l_child.incr()
+    self.assertIs(l_obj.labels("/x", 200), l_child)
+    self.assertIs(l_obj.labels(path="/x", code="200"), l_child)
+    l_obj.labels(code=404, path="a,b=c").incr(2)
+    self.assertEqual(len(l_obj), 2)
+    self.assertDictEqual(self._data(l_obj), {
+      "requests.path=%2Fx,code=200"       : 1,
+      "requests.path=a%2Cb%3Dc,code=404"  : 2
+    })
+    with self.assertRaises(CounterError):
+      l_obj.labels(path="/x")
+    with self.assertRaises(CounterError):
+      l_obj.labels(path="/x", status=200)
+    with self.assertRaises(CounterError):
+      l_obj.labels("/x")
+    with self.assertRaises(CounterError):
+      Family("requests", [])
+
+  def test_overflow(self):
+    l_obj = Family("requests", [ "path" ], lambda x: Int32(x, 0), p_maxChildren=2)
+    l_version = l_obj.version()
+    for c_idx in range(0, 5):
+      l_obj.labels(path="/%d" % c_idx).incr()
+    l_obj.labels(path="/0").incr()
+    self.assertNotEqual(l_obj.version(), l_version)
+    self.assertEqual(len(l_obj), 2)
+    self.assertDictEqual(self._data(l_obj), {
+      "requests.path=%2F0"  : 2,
+      "requests.path=%2F1"  : 1,
+      "requests.overflow"   : 3
+    })
+
+  def test_composed(self):
+    l_obj = Family("requests", [ "code" ])
+    l_parent = Composed("http")
+    l_parent.register(l_obj)
+    l_obj.labels(code=200).incr()
+    self.assertDictEqual(self._data(l_parent), { "http.requests.code=200" : 1 })
+
+  def test_threads(self):
+    l_obj = Family("requests", [ "code" ], lambda x: ShardedUInt64(x, 0), p_maxChildren=5)
+    def work():
+      for c_idx in range(0, 1000):
+        l_obj.labels(code=c_idx % 10).incr()
+    l_threads = [ threading.Thread(target=work) for x in range(4) ]
+    for c_thread in l_threads:
+      c_thread.start()
+    for c_thread in l_threads:
+      c_thread.join()
+    l_data = self._data(l_obj)
+    self.assertEqual(len(l_data), 6)
+    self.assertEqual(sum(l_data.values()), 4000)
+
 # Local Variables:
 # ispell-local-dictionary: "american"
 # End:
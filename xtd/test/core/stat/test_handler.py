@@ -11,13 +11,16 @@ import logging
 import tempfile
 import shutil
 import os
+import socket
+import zlib
 import unittest2 as unittest
 
 from httmock import urlmatch, HTTMock
 
 from xtd.core.stat.handler import BaseHandler, DiskHandler
-from xtd.core.stat.handler import HttpHandler, LoggingHandler
-from xtd.core.stat.counter import Int32
+from xtd.core.stat.handler import HttpHandler, LoggingHandler, StatsdHandler
+from xtd.core.stat.counter import Int32, Perf, TimedSample
+from xtd.core.stat.manager import StatSnapshot
 from xtd.core.error import XtdError
 
 #------------------------------------------------------------------#
@@ -101,6 +104,44 @@ class DiskHandlerTest(unittest.TestCase):
 
     shutil.rmtree(l_dir)
 
+  def test_write_changed(self):
+    l_dir = tempfile.mkdtemp()
+    l_obj = DiskHandler(l_dir)
+    l_counter = Int32("toto", 20)
+
+    l_obj.write({ "a.b" : [ l_counter ] })
+    self._check_file(l_dir + "/a/b/toto", "20")
+    self.assertEqual(os.listdir(l_dir + "/a/b"), [ "toto" ])
+
+    os.remove(l_dir + "/a/b/toto")
+    l_obj.write({ "a.b" : [ l_counter ] })
+    self.assertFalse(os.path.exists(l_dir + "/a/b/toto"))
+
+    l_counter.val = 21
+    l_obj.write({ "a.b" : [ l_counter ] })
+    self._check_file(l_dir + "/a/b/toto", "21")
+    self.assertEqual(os.listdir(l_dir + "/a/b"), [ "toto" ])
+    shutil.rmtree(l_dir)
+
+  def test_write_format(self):
+    l_dir = tempfile.mkdtemp()
+    with self.assertRaises(XtdError):
+      DiskHandler(l_dir, p_format="xml")
+
+    l_counters = {
+      "a.b.c" : [ Int32("toto", 20), Int32("titi", 100) ],
+      "a.b"   : [ Int32("toto")                         ]
+    }
+    DiskHandler(l_dir, p_format="json").write(l_counters)
+    self._check_file(l_dir + "/a.b.c.json", '{"titi": 100, "toto": 20}')
+    self._check_file(l_dir + "/a.b.json", '{"toto": "NaN"}')
+
+    DiskHandler(l_dir, p_format="kv").write(l_counters)
+    self._check_file(l_dir + "/a.b.c.kv", "titi=100\ntoto=20\n")
+    self._check_file(l_dir + "/a.b.kv", "toto=NaN\n")
+    self.assertEqual(sorted(os.listdir(l_dir)), [ "a.b.c.json", "a.b.c.kv", "a.b.json", "a.b.kv" ])
+    shutil.rmtree(l_dir)
+
 
 class HttpHandlerTest(unittest.TestCase):
   def __init__(self, *p_args, **p_kwds):
@@ -146,6 +187,152 @@ class HttpHandlerTest(unittest.TestCase):
           "a.b"   : [ Int32("toto", 55), Int32("c.d",  106) ]
         })
 
+  def test_write_queue(self):
+    l_bodies = []
+    @urlmatch(netloc="localhost")
+    def handle(p_url, p_request):
+      self.assertEqual(p_request.headers["Content-Encoding"], "gzip")
+      l_bodies.append(json.loads(zlib.decompress(p_request.body, 16 + zlib.MAX_WBITS).decode("utf-8")))
+      return {'status_code': 200}
+
+    l_obj = HttpHandler("http://localhost/json", p_gzip=True, p_queueSize=2, p_timeout=1)
+    self.assertEqual([ x.m_name for x in l_obj.counters() ],
+                     [ "sent", "dropped", "errors", "latency" ])
+    l_logger = logging.getLogger("xtd.core.stat.handler.HttpHandler")
+    with HTTMock(self._make_error):
+      with self.assertLogs(l_logger, level="ERROR"):
+        for c_val in range(3):
+          l_obj.write({ "a" : [ Int32("toto", c_val) ] })
+    self.assertEqual(l_obj.m_errors.val, 3)
+    self.assertEqual(l_obj.m_dropped.val, 1)
+    self.assertEqual(l_obj.m_sent.val, 0)
+
+    # queue overflow : tick 0 was dropped
+    self.assertEqual([ x["a"]["toto"] for x in l_obj.m_queue ], [ 1, 2 ])
+
+    with HTTMock(handle):
+      l_obj.write({ "a" : [ Int32("toto", 3) ] })
+      l_obj.write({ "a" : [ Int32("toto", 4) ] })
+    self.assertEqual(l_bodies, [
+      [ { "a" : { "toto" : 2 } }, { "a" : { "toto" : 3 } } ],
+      [ { "a" : { "toto" : 4 } } ]
+    ])
+    self.assertEqual(l_obj.m_dropped.val, 2)
+    self.assertEqual(l_obj.m_sent.val, 3)
+    self.assertEqual(len(l_obj.m_queue), 0)
+    self.assertEqual(len(l_obj.m_latency.m_samples), 5)
+
+  def test_write_retry(self):
+    l_bodies = []
+    l_status = [ 500, 200 ]
+    @urlmatch(netloc="localhost")
+    def handle(p_url, p_request):
+      l_bodies.append(json.loads(p_request.body))
+      return {'status_code': l_status.pop(0)}
+
+    l_obj    = HttpHandler("http://localhost/json", p_queueSize=5)
+    l_logger = logging.getLogger("xtd.core.stat.handler.HttpHandler")
+    with HTTMock(handle):
+      with self.assertLogs(l_logger, level="ERROR"):
+        l_obj.write({ "a" : [ Int32("toto", 1) ] })
+      l_obj.write({ "a" : [ Int32("toto", 2) ] })
+    self.assertEqual(l_bodies, [
+      [ { "a" : { "toto" : 1 } } ],
+      [ { "a" : { "toto" : 1 } }, { "a" : { "toto" : 2 } } ]
+    ])
+    self.assertEqual(l_obj.m_errors.val, 1)
+    self.assertEqual(l_obj.m_dropped.val, 0)
+    self.assertEqual(l_obj.m_sent.val, 2)
+
+  def test_write_noqueue(self):
+    l_obj = HttpHandler("http://localhost/json")
+    l_logger = logging.getLogger("xtd.core.stat.handler.HttpHandler")
+    with HTTMock(self._make_error):
+      with self.assertLogs(l_logger, level="ERROR"):
+        l_obj.write({ "a" : [ Int32("toto", 1) ] })
+    self.assertEqual(l_obj.m_dropped.val, 1)
+    self.assertEqual(len(l_obj.m_queue), 0)
+    with HTTMock(self._unknown):
+      l_obj.write({ "a" : [ Int32("toto", 2) ] })
+    self.assertEqual(l_obj.m_sent.val, 1)
+
+
+class StatsdHandlerTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(StatsdHandlerTest, self).__init__(*p_args, **p_kwds)
+
+  def setUp(self):
+    self.m_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.m_server.bind(("127.0.0.1", 0))
+    self.m_server.settimeout(1)
+    self.m_port = self.m_server.getsockname()[1]
+
+  def tearDown(self):
+    self.m_server.close()
+
+  def _recv(self, p_count):
+    return [ self.m_server.recv(65536).decode("utf-8") for x in range(p_count) ]
+
+  def test_write(self):
+    l_perf = Perf("perf", p_percentiles=[50])
+    l_perf.push(100)
+    l_sample = TimedSample("sample")
+    l_sample.push(3)
+    l_obj = StatsdHandler("127.0.0.1", self.m_port, p_prefix="app", p_tags=["env:test", ""])
+    l_obj.write({
+      "a.b" : [ Int32("to to", 20), Int32("unset"), l_perf, l_sample ]
+    })
+    l_lines = sorted(self._recv(1)[0].split("\n"))
+    self.assertEqual(l_lines, [
+      "app.a.b.perf.avg:0.1|ms|#env:test",
+      "app.a.b.perf.max:0.1|ms|#env:test",
+      "app.a.b.perf.min:0.1|ms|#env:test",
+      "app.a.b.perf.p50:0.1|ms|#env:test",
+      "app.a.b.sample.avg:3|g|#env:test",
+      "app.a.b.sample.max:3|g|#env:test",
+      "app.a.b.sample.min:3|g|#env:test",
+      "app.a.b.to_to:20|g|#env:test"
+    ])
+    self.assertEqual(l_obj.m_sent.val, 1)
+
+  def test_write_snapshot(self):
+    # counters of the snapshot are not registered in StatManager
+    l_perf = Perf("perf")
+    l_perf.push(2000)
+    l_perf.update()
+    l_items = []
+    l_perf.visit(lambda x, y: l_items.append((x, y)))
+    l_value = Int32("value", 5)
+    l_snapshot = StatSnapshot(0, { "a" : dict(l_items + [ ("value", 5) ]) }, {
+      "a" : [ (l_perf, l_items), (l_value, [ ("value", 5) ]) ]
+    })
+    l_obj = StatsdHandler("127.0.0.1", self.m_port)
+    l_obj.write(l_snapshot)
+    l_lines = sorted(self._recv(1)[0].split("\n"))
+    self.assertEqual(l_lines, [
+      "a.perf.avg:2.0|ms",
+      "a.perf.max:2.0|ms",
+      "a.perf.min:2.0|ms",
+      "a.value:5|g"
+    ])
+
+  def test_write_batch(self):
+    l_obj = StatsdHandler("127.0.0.1", self.m_port)
+    l_counters = [ Int32("counter_%03d" % x, x) for x in range(200) ]
+    l_obj.write({ "a" : l_counters })
+    l_count   = l_obj.m_sent.val
+    l_packets = self._recv(l_count)
+    self.assertGreater(l_count, 1)
+    for c_packet in l_packets:
+      self.assertLessEqual(len(c_packet), StatsdHandler.MTU)
+    l_lines = sum([ x.split("\n") for x in l_packets ], [])
+    self.assertEqual(len(l_lines), 200)
+    self.assertEqual(l_lines[0], "a.counter_000:0|g")
+    self.assertEqual(l_obj.counters(), [ l_obj.m_sent, l_obj.m_dropped ])
+
+  def test___init__(self):
+    with self.assertRaises(XtdError):
+      StatsdHandler("invalid.host.invalid", self.m_port)
 
 
 class LoggingHandlerTest(unittest.TestCase):
@@ -0,0 +1,97 @@
+# -*- coding: utf-8
+# pylint: disable=protected-access
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import time
+import unittest2 as unittest
+
+from xtd.core.stat.history import HistoryTier, CounterHistory
+from xtd.core.stat.counter import Int32, Perf
+from xtd.core.error        import XtdError
+
+#------------------------------------------------------------------#
+
+
+class HistoryTierTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(HistoryTierTest, self).__init__(*p_args, **p_kwds)
+
+  def test_points(self):
+    l_obj = HistoryTier(10, 4)
+    self.assertEqual(l_obj.span(), 40)
+    self.assertEqual(l_obj.add_series(), 0)
+    self.assertEqual(l_obj.add_series(), 1)
+    for c_time in [ 100, 105, 110, 130 ]:
+      l_obj.add(l_obj.slot(c_time), 0, c_time)
+    self.assertEqual(l_obj.points(0, 0, 135), [
+      (100, 205.0, 2), (110, 110.0, 1), (130, 130.0, 1)
+    ])
+    self.assertEqual(l_obj.points(1, 0, 135), [])
+
+    # slot of 100 is reused
+    l_obj.add(l_obj.slot(140), 1, 1)
+    self.assertEqual(l_obj.points(0, 0, 145), [ (110, 110.0, 1), (130, 130.0, 1) ])
+    self.assertEqual(l_obj.points(1, 0, 145), [ (140, 1.0, 1) ])
+    self.assertEqual(l_obj.points(0, 120, 145), [ (130, 130.0, 1) ])
+
+
+class CounterHistoryTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(CounterHistoryTest, self).__init__(*p_args, **p_kwds)
+
+  def test___init__(self):
+    l_obj = CounterHistory()
+    self.assertEqual([ x.step() for x in l_obj.tiers() ], [ 10, 60 ])
+    self.assertEqual(l_obj.m_loopInterval, 10)
+    with self.assertRaises(XtdError):
+      CounterHistory([])
+    with self.assertRaises(XtdError):
+      CounterHistory([ (0, 10) ])
+
+  def test_query(self):
+    l_obj  = CounterHistory([ (1, 10), (5, 100) ])
+    l_now  = int(time.time()) - 20
+    l_val  = Int32("val")
+    l_perf = Perf("perf")
+    for c_idx in range(0, 20):
+      l_val.val = c_idx
+      l_perf.push(c_idx * 10)
+      l_obj.record(l_now + c_idx, { "a" : [ l_val, l_perf, Int32("unset") ] })
+
+    l_end = l_now + 19
+    l_res = l_obj.query("a", "val", l_now + 10, p_to=l_end)
+    self.assertEqual(l_res, {
+      "val" : [ [ l_now + x, float(x) ] for x in range(10, 20) ]
+    })
+
+    l_res = l_obj.query("a", "perf", l_now + 15, p_to=l_end)
+    self.assertEqual(sorted(l_res.keys()), [ "perf.avg", "perf.max", "perf.min" ])
+    self.assertEqual(l_res["perf.max"][-1], [ l_end, 190.0 ])
+
+    l_res = l_obj.query("a", "val", l_now + 10, 2, p_to=l_end)
+    l_expected = {}
+    for c_idx in range(10, 20):
+      l_expected.setdefault(((l_now + c_idx) // 2) * 2, []).append(c_idx)
+    self.assertEqual(l_res["val"], [
+      [ x, float(sum(l_expected[x])) / len(l_expected[x]) ] for x in sorted(l_expected)
+    ])
+
+    l_res = l_obj.query("a", "val", l_now, p_to=l_end)
+    self.assertEqual([ x[0] % 5 for x in l_res["val"] ], [ 0 ] * len(l_res["val"]))
+    self.assertEqual(l_res["val"][-1][0], (l_end // 5) * 5)
+
+    l_res = l_obj.query("a", "val")
+    self.assertEqual(l_res["val"][-1], [ l_end, 19.0 ])
+
+    with self.assertRaises(XtdError):
+      l_obj.query("a", "unset")
+    with self.assertRaises(XtdError):
+      l_obj.query("a", "va")
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -15,8 +15,8 @@ import unittest2 as unittest
 
 from xtd.core              import mixin
 from xtd.core.error        import XtdError
-from xtd.core.stat.manager import StatManager
-from xtd.core.stat.counter import Int32
+from xtd.core.stat.manager import StatManager, StatSnapshot
+from xtd.core.stat.counter import Int32, Composed, TimedSample
 
 #------------------------------------------------------------------#
 
@@ -56,6 +56,36 @@ class BaseHandlerTest(unittest.TestCase):
     with self.assertRaises(XtdError):
       self.m_obj.get("a.b", "undef")
 
+  def test_get_many(self):
+    l_rtt  = Int32("rtt")
+    l_rtt2 = Int32("rtt.p99")
+    l_sub  = Int32("rtt")
+    l_errs = Int32("errors")
+    self.m_obj.register_counter("app.http", l_rtt)
+    self.m_obj.register_counter("app.http", l_rtt2)
+    self.m_obj.register_counter("app.http", l_errs)
+    self.m_obj.register_counter("app.db.sql", l_sub)
+    self.m_obj.register_counter("other", Int32("rtt"))
+
+    self.assertEqual(self.m_obj.get_many("app.*", "rtt*"), [
+      ("app.db.sql", l_sub), ("app.http", l_rtt), ("app.http", l_rtt2)
+    ])
+    self.assertEqual(self.m_obj.get_many("app.http"), [
+      ("app.http", l_rtt), ("app.http", l_rtt2), ("app.http", l_errs)
+    ])
+    self.assertEqual(self.m_obj.get_many("app.http", "errors"), [ ("app.http", l_errs) ])
+    self.assertEqual(self.m_obj.get_many("app.http", "undef"), [])
+    self.assertEqual(self.m_obj.get_many("undef", "*"), [])
+    self.assertEqual(len(self.m_obj.get_many()), 5)
+
+  def test_get_or_create(self):
+    l_counter = self.m_obj.get_or_create("a", "toto", Int32)
+    self.assertEqual(l_counter.m_name, "toto")
+    self.assertIs(self.m_obj.get("a", "toto"), l_counter)
+    self.assertIs(self.m_obj.get_or_create("a", "toto", Int32), l_counter)
+    self.assertTrue(self.m_obj.exists("a", "toto"))
+    self.assertFalse(self.m_obj.exists("a", "titi"))
+
   def test_get_json(self):
     self.m_obj.register_counter("a.b.c", Int32("toto", 1))
     self.m_obj.register_counter("a.b.c", Int32("ti.ti", 2))
@@ -69,3 +99,66 @@ class BaseHandlerTest(unittest.TestCase):
         "toto" : 3
       }
     })
+
+  def test_snapshot(self):
+    l_value = Int32("toto", 1)
+    l_group = Composed("group")
+    l_group.register(Int32("titi", 2))
+    l_sample = TimedSample("sample")
+    self.m_obj.register_counter("a", l_value)
+    self.m_obj.register_counter("a", l_group)
+    self.m_obj.register_counter("b", l_sample)
+
+    l_snap = self.m_obj.snapshot()
+    self.assertIsInstance(l_snap, StatSnapshot)
+    self.assertDictEqual(l_snap.json(), {
+      "a" : { "toto" : 1, "group.titi" : 2 },
+      "b" : { "sample.min" : "NaN", "sample.max" : "NaN", "sample.avg" : "NaN" }
+    })
+    self.assertEqual(dict(l_snap.counters())["a"], [
+      (l_value, [ ("toto", 1) ]),
+      (l_group, [ ("group.titi", 2) ])
+    ])
+
+    # shared until max age
+    l_value.incr()
+    self.assertIs(self.m_obj.snapshot(), l_snap)
+    l_snap2 = self.m_obj.snapshot(0)
+    self.assertIsNot(l_snap2, l_snap)
+    self.assertEqual(l_snap2.json()["a"]["toto"], 2)
+    self.assertEqual(l_snap.json()["a"]["toto"], 1)
+
+    # unchanged counters are not visited again
+    l_visits = []
+    l_visit  = l_group.visit
+    def visit(p_visitor):
+      l_visits.append(1)
+      l_visit(p_visitor)
+    l_group.visit = visit
+    self.m_obj.snapshot(0)
+    self.assertEqual(len(l_visits), 0)
+    l_group.m_childs[0].incr()
+    self.assertEqual(self.m_obj.snapshot(0).json()["a"]["group.titi"], 3)
+    self.assertEqual(len(l_visits), 1)
+
+    # time dependant counters are always updated
+    l_sample.push(5)
+    self.assertEqual(self.m_obj.snapshot(0).json()["b"]["sample.min"], 5)
+
+  @unittest.skipIf(not hasattr(os, "fork"), "requires os.fork")
+  def test_snapshot_fork(self):
+    l_value = Int32("hits", 0)
+    l_group = Composed("group")
+    l_group.register(Int32("titi", 0))
+    self.m_obj.register_counter("a", l_value)
+    self.m_obj.register_counter("a", l_group)
+    self.assertEqual(self.m_obj.get_json(), { "a" : { "hits" : 0, "group.titi" : 0 } })
+
+    l_pid = os.fork()
+    if l_pid == 0:
+      l_value.incr(5)
+      l_group.m_childs[0].incr(2)
+      os._exit(0)
+    os.waitpid(l_pid, 0)
+    self.assertEqual(l_value.val, 5)
+    self.assertEqual(self.m_obj.snapshot(0).json(), { "a" : { "hits" : 5, "group.titi" : 2 } })
@@ -0,0 +1,189 @@
+# -*- coding: utf-8
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import time
+import unittest2 as unittest
+
+from xtd.core.tools.thread import SafeThread, SafeThreadGroup, Scheduler
+from xtd.core.error        import XtdError
+
+#------------------------------------------------------------------#
+
+class CountThread(SafeThread):
+  def __init__(self, p_name, p_interval):
+    super(CountThread, self).__init__(p_name, p_interval)
+    self.m_count = 0
+
+  def work(self):
+    self.m_count += 1
+
+#------------------------------------------------------------------#
+
+class SafeThreadTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(SafeThreadTest, self).__init__(*p_args, **p_kwds)
+
+  def test_interval(self):
+    l_obj = CountThread("thread", 0.05)
+    l_obj.start()
+    time.sleep(0.3)
+    l_obj.stop()
+    l_obj.safe_join()
+    self.assertGreater(l_obj.m_count, 2)
+
+  def test_stop(self):
+    l_obj = CountThread("thread", 60)
+    l_obj.start()
+    time.sleep(0.05)
+    l_start = time.time()
+    l_obj.stop()
+    l_obj.safe_join()
+    self.assertLess(time.time() - l_start, 0.5)
+    self.assertEqual(l_obj.m_count, 1)
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.m_now = 0.0
+
+  def __call__(self):
+    return self.m_now
+
+  def step(self, p_delay):
+    self.m_now += p_delay
+
+
+def wait_until(p_cond, p_timeout = 5):
+  l_end = time.time() + p_timeout
+  while not p_cond() and time.time() < l_end:
+    time.sleep(0.01)
+  return p_cond()
+
+
+class SchedulerTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(SchedulerTest, self).__init__(*p_args, **p_kwds)
+
+  def test_add_job(self):
+    l_clock = FakeClock()
+    l_obj   = Scheduler("scheduler", l_clock)
+    with self.assertRaises(XtdError):
+      l_obj.add_job(lambda: None, 0)
+
+    l_calls = []
+    l_obj.add_job(lambda: l_calls.append("fast"), 0.05)
+    l_obj.add_job(lambda: l_calls.append("slow"), 0.2)
+    self.assertEqual(l_obj.run_pending(), 0.05)
+    self.assertEqual(l_calls, [ "fast", "slow" ])
+    for _ in range(10):
+      l_clock.step(0.05)
+      l_obj.run_pending()
+    self.assertEqual(l_calls.count("fast"), 11)
+    self.assertEqual(l_calls.count("slow"), 3)
+
+  def test_remove_job(self):
+    l_clock = FakeClock()
+    l_obj   = Scheduler("scheduler", l_clock)
+    l_calls = []
+    self.assertEqual(l_obj.run_pending(), None)
+    l_id    = l_obj.add_job(lambda: l_calls.append(1), 0.05, p_delay=0.2)
+    self.assertEqual(l_obj.run_pending(), 0.2)
+    l_obj.remove_job(l_id)
+    l_clock.step(0.3)
+    self.assertEqual(l_obj.run_pending(), None)
+    self.assertEqual(l_calls, [])
+
+  def test_drift(self):
+    l_clock = FakeClock()
+    l_obj   = Scheduler("scheduler", l_clock)
+    l_calls = []
+    def job():
+      l_calls.append(l_clock())
+      l_clock.step(0.03)
+    l_obj.add_job(job, 0.1)
+    while l_clock() < 0.55:
+      l_delay = l_obj.run_pending()
+      l_clock.step(l_delay)
+    self.assertEqual(len(l_calls), 6)
+    for c_idx, c_time in enumerate(l_calls):
+      self.assertAlmostEqual(c_time, c_idx * 0.1)
+
+  def test_overrun(self):
+    l_clock = FakeClock()
+    l_obj   = Scheduler("scheduler", l_clock)
+    l_calls = []
+    def job():
+      l_calls.append(l_clock())
+      l_clock.step(0.25)
+    l_obj.add_job(job, 0.1)
+    while l_clock() < 1.0:
+      l_clock.step(l_obj.run_pending())
+    # executions at 0.1 and 0.2 are skipped, next deadline stays on period
+    self.assertEqual([ round(x, 6) for x in l_calls ], [ 0, 0.3, 0.6, 0.9 ])
+
+  def test_thread(self):
+    l_obj   = Scheduler("scheduler")
+    l_calls = []
+    l_obj.add_job(lambda: l_calls.append(1), 0.01)
+    l_obj.start()
+    self.assertTrue(wait_until(lambda: len(l_calls) >= 3))
+    l_obj.stop()
+    l_obj.safe_join()
+    self.assertFalse(l_obj.is_alive())
+
+  def test_stop(self):
+    l_obj = Scheduler("scheduler")
+    l_obj.add_job(lambda: None, 60)
+    l_obj.start()
+    l_start = time.time()
+    l_obj.stop()
+    l_obj.safe_join()
+    self.assertLess(time.time() - l_start, 5)
+
+
+class SafeThreadGroupTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(SafeThreadGroupTest, self).__init__(*p_args, **p_kwds)
+
+  def test_use_scheduler(self):
+    l_obj = SafeThreadGroup("group")
+    l_threads = [ CountThread("t%d" % x, 0.01) for x in range(3) ]
+    for c_thread in l_threads:
+      l_obj.add_thread(c_thread)
+    with self.assertRaises(XtdError):
+      l_obj.add_thread(object())
+    l_obj.use_scheduler()
+    l_obj.start()
+    self.assertTrue(wait_until(lambda: min(x.m_count for x in l_threads) > 2))
+    l_obj.stop()
+    l_obj.join()
+    self.assertIsNotNone(l_obj.m_scheduler)
+    for c_thread in l_threads:
+      self.assertFalse(c_thread.is_alive())
+
+  def test_use_scheduler_blocking(self):
+    l_obj      = SafeThreadGroup("group")
+    l_thread   = CountThread("t0", 0.01)
+    l_blocking = CountThread("blocking", 0.01)
+    l_blocking.ms_blocking = True
+    l_obj.add_thread(l_thread)
+    l_obj.add_thread(l_blocking)
+    l_obj.use_scheduler()
+    l_obj.start()
+    self.assertTrue(wait_until(lambda: l_thread.m_count > 1 and l_blocking.m_count > 1))
+    self.assertFalse(l_thread.is_alive())
+    self.assertTrue(l_blocking.is_alive())
+    l_obj.stop()
+    l_obj.join()
+    self.assertFalse(l_blocking.is_alive())
+
+if __name__ == "__main__":
+  unittest.main()
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End:
@@ -0,0 +1,108 @@
+# -*- coding: utf-8
+# pylint: disable=protected-access
+#------------------------------------------------------------------#
+
+__author__    = "Xavier MARCELET <xavier@marcelet.com>"
+
+#------------------------------------------------------------------#
+
+import logging
+import unittest2 as unittest
+
+from xtd.network.server.counter import MetricsPage
+from xtd.core.stat.manager      import StatSnapshot
+from xtd.core.stat.counter      import Int32, Perf, Histogram
+
+#------------------------------------------------------------------#
+
+def make_snapshot(p_counters):
+  l_data   = {}
+  l_groups = {}
+  for c_ns, c_counters in p_counters.items():
+    l_values = l_data[c_ns] = {}
+    l_group  = l_groups[c_ns] = []
+    for c_counter in c_counters:
+      l_items = []
+      c_counter.update()
+      c_counter.visit(lambda x, y, p_items=l_items: p_items.append((x, y)))
+      l_values.update(l_items)
+      l_group.append((c_counter, l_items))
+  return StatSnapshot(0, l_data, l_groups)
+
+#------------------------------------------------------------------#
+
+class MetricsPageTest(unittest.TestCase):
+  def __init__(self, *p_args, **p_kwds):
+    super(MetricsPageTest, self).__init__(*p_args, **p_kwds)
+
+  def test_metric_name(self):
+    self.assertEqual(MetricsPage.metric_name("a.b", "c-d"), "a_b_c_d")
+    self.assertEqual(MetricsPage.metric_name("1.b", "c"), "_1_b_c")
+
+  def test_render(self):
+    l_perf = Perf("rtt")
+    l_perf.push(120)
+    l_histo = Histogram("size", [ 10, 100 ])
+    l_histo.observe(5)
+    l_histo.observe(50)
+    l_histo.observe(500)
+    l_snapshot = make_snapshot({
+      "app"   : [ Int32("requests", 3), Int32("unset") ],
+      "app.b" : [ l_perf, l_histo ]
+    })
+    l_text = "".join(MetricsPage()._render(l_snapshot))
+    self.assertEqual(l_text.splitlines(), [
+      "# TYPE app_requests gauge",
+      "app_requests 3",
+      "# TYPE app_unset gauge",
+      "app_unset NaN",
+      "# TYPE app_b_rtt gauge",
+      "app_b_rtt{stat=\"min\"} 120",
+      "app_b_rtt{stat=\"max\"} 120",
+      "app_b_rtt{stat=\"avg\"} 120",
+      "# TYPE app_b_size histogram",
+      "app_b_size_bucket{le=\"10.0\"} 1",
+      "app_b_size_bucket{le=\"100.0\"} 2",
+      "app_b_size_bucket{le=\"+Inf\"} 3",
+      "app_b_size_sum 555.0",
+      "app_b_size_count 3"
+    ])
+
+  def test_render_collision(self):
+    l_perf = Perf("rtt")
+    l_perf.push(7)
+    l_snapshot = make_snapshot({
+      "app"      : [ Int32("http.rtt", 1), Int32("http_rtt", 2), Histogram("http.rtt.h", [ 1 ]) ],
+      "app.http" : [ l_perf, Int32("rtt_h", 3) ]
+    })
+    l_obj    = MetricsPage()
+    l_logger = logging.getLogger("xtd.network.server.counter")
+    with self.assertLogs(l_logger, level="WARNING") as l_logs:
+      l_text = "".join(l_obj._render(l_snapshot))
+    self.assertEqual(len(l_logs.output), 2)
+    l_lines = l_text.splitlines()
+    self.assertEqual(l_lines, [
+      "# TYPE app_http_rtt gauge",
+      "app_http_rtt 1",
+      "app_http_rtt{stat=\"min\"} 7",
+      "app_http_rtt{stat=\"max\"} 7",
+      "app_http_rtt{stat=\"avg\"} 7",
+      "# TYPE app_http_rtt_h histogram",
+      "app_http_rtt_h_bucket{le=\"1.0\"} 0",
+      "app_http_rtt_h_bucket{le=\"+Inf\"} 0",
+      "app_http_rtt_h_sum 0.0",
+      "app_http_rtt_h_count 0"
+    ])
+    self.assertEqual(len([ x for x in l_lines if x.startswith("# TYPE") ]),
+                     len(set(x for x in l_lines if x.startswith("# TYPE"))))
+
+    # duplicates are logged once
+    l_obj._render(l_snapshot)
+    self.assertEqual(len(l_obj.m_duplicates), 2)
+
+if __name__ == "__main__":
+  unittest.main()
+
+# Local Variables:
+# ispell-local-dictionary: "american"
+# End: